@@ -5,6 +5,11 @@
 This is a web service to print labels on Brother QL label printers.
 """
 
+import time
+
+_import_started = time.perf_counter()
+
+import os
 import sys
 import random
 import argparse
@@ -12,22 +17,40 @@ import argparse
 from flask import Flask
 from flask_bootstrap import Bootstrap
 
-from brother_ql.devicedependent import models
-
 from . import fonts
 from config import Config
 
 bootstrap = Bootstrap()
 
 
+class StartupTimer:
+    """Duration of the phases of app creation, reported once the app is ready."""
+
+    def __init__(self, imports_ms=0.0):
+        self.phases = [('imports', imports_ms)] if imports_ms else []
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self._last) * 1000.0))
+        self._last = now
+
+    def report(self):
+        total = sum(ms for _, ms in self.phases)
+        return ', '.join(f'{phase} {ms:.0f} ms' for phase, ms in self.phases) + f' (total {total:.0f} ms)'
+
+
 def create_app(config_class=Config):
+    timer = StartupTimer(IMPORTS_MS)
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(config_class)
     app.config.from_pyfile('application.py', silent=True)
 
     app.logger.setLevel(app.config['LOG_LEVEL'])
+    timer.mark('config')
 
     main(app)
+    timer.mark('fonts')
 
     app.config['BOOTSTRAP_SERVE_LOCAL'] = True
     bootstrap.init_app(app)
@@ -40,6 +63,26 @@ def create_app(config_class=Config):
 
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
+    timer.mark('blueprints')
+
+    from app import markdown_render
+    markdown_render.block_cache.max_bytes = int(app.config['MARKDOWN_BLOCK_CACHE_SIZE_MB'] * 1024 * 1024)
+
+    from app.font_cache import font_cache
+    font_cache.max_entries = app.config['FONT_CACHE_SIZE']
+    timer.mark('caches')
+
+    if app.config['PRELOAD']:
+        from app.preload import preload
+        preload(app, FONTS)
+        timer.mark('preload')
+
+    from app.labeldesigner.render_pool import start_render_pool
+    start_render_pool(app)
+    timer.mark('render pool')
+
+    app.extensions['startup_timings'] = dict(timer.phases)
+    app.logger.info('Startup: %s', timer.report())
 
     return app
 
@@ -48,17 +91,34 @@ def main(app):
     global FONTS
 
     FONTS = fonts.Fonts()
-    FONTS.scan_global_fonts()
 
     parse_args(app)
 
-    if app.config['FONT_FOLDER']:
-        FONTS.scan_fonts_folder(app.config['FONT_FOLDER'])
+    if app.config['FONT_INDEX']:
+        directories = list(app.config['FONT_DIRECTORIES'])
+        if app.config['FONT_FOLDER']:
+            directories.append(app.config['FONT_FOLDER'])
+        FONTS.use_index(os.path.join(app.instance_path, 'font_index.json'), directories)
+    else:
+        FONTS.scan_global_fonts()
+        if app.config['FONT_FOLDER']:
+            FONTS.scan_fonts_folder(app.config['FONT_FOLDER'])
+
+    # Done before serving: check_fonts may change the default font in the
+    # config, which requests read. With the font index this is cheap.
+    if not check_fonts(app):
+        sys.exit(2)
+
 
+def check_fonts(app):
+    """Check that fonts were found and that the default font is one of them.
+
+    :return: False if not a single font was found
+    """
     if not FONTS.fonts_available():
         app.logger.error(
             "Not a single font was found on your system. Please install some.\n")
-        sys.exit(2)
+        return False
 
     if app.config['LABEL_DEFAULT_FONT_FAMILY'] in FONTS.fonts.keys() and app.config['LABEL_DEFAULT_FONT_STYLE'] in FONTS.fonts[app.config['LABEL_DEFAULT_FONT_FAMILY']].keys():
         app.logger.debug(
@@ -73,9 +133,12 @@ def main(app):
         app.config['LABEL_DEFAULT_FONT_STYLE'] = style
         app.logger.warn(
             'The default font is now set to: {} ({})\n'.format(family, style))
+    return True
 
 
 def parse_args(app):
+    from brother_ql.devicedependent import models
+
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('--default-label-size', default=False,
                         help='Label size inserted in your printer. Defaults to 62.')
@@ -106,3 +169,6 @@ def parse_args(app):
         app.config.update(
             LABEL_DEFAULT_ORIENTATION=args.default_orientation
         )
+
+
+IMPORTS_MS = (time.perf_counter() - _import_started) * 1000.0
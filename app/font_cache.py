@@ -0,0 +1,63 @@
+"""Process wide LRU cache of loaded FreeType fonts."""
+
+import threading
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+class FontCache:
+    """Thread-safe LRU of ImageFont objects keyed by (path, size, variation)."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, size, variation=None):
+        """Return the font at ``size`` pixels, raises OSError like ImageFont.truetype."""
+        key = (path, size, variation)
+        with self._lock:
+            font = self._entries.get(key)
+            if font is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return font
+            self.misses += 1
+
+        font = ImageFont.truetype(path, size)
+        if variation:
+            font.set_variation_by_name(variation)
+
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = font
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return font
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+font_cache = FontCache()
+
+
+def load_font(path, size, variation=None):
+    """Load a TrueType/OpenType font through the shared font cache."""
+    return font_cache.get(path, size, variation)
@@ -1,22 +1,46 @@
+import json
+import os
 import subprocess
 import sys
+import tempfile
+import threading
 from collections import defaultdict
 
+FONT_EXTENSIONS = ('.ttf', '.otf')
+
+# Bump when the index layout changes so old index files are rebuilt
+INDEX_VERSION = 1
+
 
 class Fonts:
     def __init__(self):
-        self.fonts = defaultdict(dict)
+        self._fonts = defaultdict(dict)
+        self._folders = []
+        self._index_path = None
+        self._index_directories = ()
+        self._index_mtime = None
+        self._loaded = True
+        self._lock = threading.RLock()
 
-    def parse_fonts(self, raw):
-        """ adds the found fonts the the fonts list
-        :param raw: command to be run to get the raw font list from the system
-        :return: true if fonts were added false if not
+    @property
+    def fonts(self):
+        """ family -> style -> path of all known fonts, the font index is
+        read on first access and again after another process rewrote it
         """
+        if self._index_path is not None:
+            if not self._loaded:
+                with self._lock:
+                    if not self._loaded:
+                        self.refresh()
+            elif self._index_mtime != self._stat_index():
+                self._reload_index()
+        return self._fonts
 
-        if raw.returncode != 0:
-            return {'error': 'an error occurred while processing the fonts'}
-
-        for line in raw.stdout.decode('utf-8').split('\n'):
+    @staticmethod
+    def _parse_lines(stdout):
+        """ parses fc-list/fc-scan output into (family, style, path) tuples """
+        found = []
+        for line in stdout.decode('utf-8').split('\n'):
             font = line.split(':')
             if len(font) < 3:
                 continue
@@ -31,9 +55,22 @@ class Fonts:
                     fontname = fontname.split()[0]
                 fontname = fontname.strip()
 
-                self.fonts[fontname][fontstyle] = fontpath
+                found.append((fontname, fontstyle, fontpath))
             else:
                 pass
+        return found
+
+    def parse_fonts(self, raw):
+        """ adds the found fonts the the fonts list
+        :param raw: command to be run to get the raw font list from the system
+        :return: true if fonts were added false if not
+        """
+
+        if raw.returncode != 0:
+            return {'error': 'an error occurred while processing the fonts'}
+
+        for fontname, fontstyle, fontpath in self._parse_lines(raw.stdout):
+            self._fonts[fontname][fontstyle] = fontpath
 
     def scan_global_fonts(self):
         """ Get a list of all fonts that are available to the user who runs this
@@ -52,6 +89,8 @@ class Fonts:
         """ Get a list of all fonts that are available to the user who runs this
         :return: raw output of the command fc-list
         """
+        if folder not in self._folders:
+            self._folders.append(folder)
         cmd = ['fc-scan', '--format',
                '%{file}:%{family}:style=%{style}\n', folder]
         try:
@@ -62,6 +101,175 @@ class Fonts:
 
         self.parse_fonts(raw)
 
+    def use_index(self, index_path, directories):
+        """ takes the font list from a persisted index of the given directories
+        (searched recursively) instead of running fc-list. The index is loaded
+        on first access, only directories whose mtime changed are rescanned.
+        :param index_path: JSON file holding the index
+        :param directories: font directories to index
+        """
+        self._index_path = index_path
+        self._index_directories = tuple(directories)
+        self._loaded = False
+
+    def rescan(self, full=False):
+        """ rebuilds the font list without restarting
+        :param full: rescan every directory instead of only the changed ones
+        :return: number of rescanned directories, None without an index
+        """
+        if self._index_path is not None:
+            return self.refresh(full=full)
+
+        fresh = Fonts()
+        fresh.scan_global_fonts()
+        for folder in self._folders:
+            fresh.scan_fonts_folder(folder)
+        with self._lock:
+            self._fonts = fresh._fonts
+        return None
+
+    def refresh(self, full=False):
+        """ updates the index: rescans new and modified directories, drops
+        removed ones and rewrites the index file if anything changed
+        :return: number of rescanned directories
+        """
+        with self._lock:
+            data = self._read_index_data()
+            # Directories fontconfig is configured with are found once, with
+            # fc-list, and kept in the index
+            fontconfig_directories = data.get('fontconfig_directories')
+            if full or fontconfig_directories is None:
+                fontconfig_directories = self._fontconfig_directories()
+            directories = self._font_directories(fontconfig_directories)
+            if not directories:
+                # None of the directories exist, ask fontconfig instead
+                self._fonts = defaultdict(dict)
+                self.scan_global_fonts()
+                self._loaded = True
+                return 0
+
+            index = {} if full else data.get('directories', {})
+            entries = {}
+            rescanned = 0
+            for directory, mtime in sorted(directories.items()):
+                entry = index.get(directory)
+                if entry is None or entry['mtime'] != mtime:
+                    found = self._scan_directory(directory)
+                    if found is None:
+                        continue
+                    entry = {'mtime': mtime, 'fonts': found}
+                    rescanned += 1
+                entries[directory] = entry
+
+            if rescanned or set(index) != set(entries) or \
+                    fontconfig_directories != data.get('fontconfig_directories'):
+                self._write_index(entries, fontconfig_directories)
+            self._apply_index(entries)
+            self._loaded = True
+            return rescanned
+
+    @staticmethod
+    def _fontconfig_directories():
+        """ directories holding the fonts fontconfig knows about, these may lie
+        outside the configured font directories
+        """
+        try:
+            raw = subprocess.run(['fc-list', '--format', '%{file}\n'], stdout=subprocess.PIPE)
+        except FileNotFoundError:
+            return []
+        if raw.returncode != 0:
+            return []
+        return sorted({os.path.dirname(line.strip())
+                       for line in raw.stdout.decode('utf-8').split('\n') if line.strip()})
+
+    def _font_directories(self, extra_roots=()):
+        """ maps every directory below the indexed directories to its mtime """
+        found = {}
+        for root in tuple(self._index_directories) + tuple(extra_roots):
+            for dirpath, _, _ in os.walk(os.path.abspath(os.path.expanduser(root))):
+                try:
+                    found[dirpath] = os.stat(dirpath).st_mtime
+                except OSError:
+                    continue
+        return found
+
+    def _scan_directory(self, directory):
+        """ runs fc-scan on the font files directly inside directory
+        :return: list of [family, style, path], None if fc-scan failed
+        """
+        try:
+            files = sorted(entry.path for entry in os.scandir(directory)
+                           if entry.is_file() and entry.name.lower().endswith(FONT_EXTENSIONS))
+        except OSError:
+            return []
+        if not files:
+            return []
+
+        cmd = ['fc-scan', '--format', '%{file}:%{family}:style=%{style}\n'] + files
+        try:
+            raw = subprocess.run(cmd, stdout=subprocess.PIPE)
+        except FileNotFoundError:
+            print('fc-scan not found', file=sys.stderr)
+            return None
+        if raw.returncode != 0:
+            return None
+        return [list(font) for font in self._parse_lines(raw.stdout)]
+
+    def _stat_index(self):
+        try:
+            return os.stat(self._index_path).st_mtime
+        except OSError:
+            return None
+
+    def _read_index_data(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            return {}
+        return data
+
+    def _read_index(self):
+        return self._read_index_data().get('directories', {})
+
+    def _write_index(self, entries, fontconfig_directories=()):
+        folder = os.path.dirname(self._index_path)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        except OSError as e:
+            print(f'Could not write font index: {e}', file=sys.stderr)
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'directories': entries,
+                           'fontconfig_directories': list(fontconfig_directories)}, f)
+            os.replace(tmp, self._index_path)
+        except OSError as e:
+            print(f'Could not write font index: {e}', file=sys.stderr)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _apply_index(self, entries):
+        fonts = defaultdict(dict)
+        for directory in sorted(entries):
+            for fontname, fontstyle, fontpath in entries[directory]['fonts']:
+                fonts[fontname][fontstyle] = fontpath
+        self._fonts = fonts
+        self._index_mtime = self._stat_index()
+
+    def _reload_index(self):
+        with self._lock:
+            entries = self._read_index()
+            if entries:
+                self._apply_index(entries)
+            else:
+                self._index_mtime = self._stat_index()
+
     def fontlist(self):
         return sorted(self.fonts, key=str.lower)
 
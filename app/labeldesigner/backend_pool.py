@@ -0,0 +1,159 @@
+"""Reusable backend connections for network (tcp://) printers."""
+
+import logging
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDLE_TIMEOUT = 30
+
+# Set in each worker when several server processes share the printers
+_multiprocess = False
+
+
+def set_multiprocess(enabled):
+    """Mark this process as one of several server workers (see connection_idle_timeout)."""
+    global _multiprocess
+    _multiprocess = enabled
+
+
+def connection_idle_timeout(configured=None):
+    """Idle timeout of pooled connections, None picks the default.
+
+    Network printers accept about one client at a time, an idle socket kept
+    by one server process would block the jobs of all the others. So with
+    several workers the default is 0, a new connection for every job.
+    """
+    if configured is not None:
+        return configured
+    return 0 if _multiprocess else DEFAULT_IDLE_TIMEOUT
+
+
+class _PooledBackend:
+
+    def __init__(self, backend, idle_timeout):
+        self.backend = backend
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+
+    def expired(self, now):
+        return now - self.last_used > self.idle_timeout
+
+    def alive(self):
+        """Check that the printer did not close the socket; drain stale status bytes."""
+        sock = getattr(self.backend, 's', None)
+        if sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if readable:
+                # Printers push status packets after a job, an empty read means EOF
+                if not sock.recv(1024):
+                    return False
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def dispose(self):
+        self.backend.dispose()
+
+
+class BackendPool:
+    """Keeps one open backend per tcp:// device and hands it out to jobs.
+
+    Other backends (USB, kernel device files) are opened and disposed per use
+    like before. Callers must serialize use of a device themselves, see
+    ``printer.get_device_lock``.
+    """
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    @staticmethod
+    def is_poolable(device_specifier):
+        return isinstance(device_specifier, str) and device_specifier.startswith('tcp://')
+
+    @contextmanager
+    def connection(self, device_specifier, backend_class, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """Yield a connected backend, reusing a pooled one for network printers.
+
+        If the body raises, the connection is dropped instead of being returned
+        to the pool so the next job reconnects.
+        """
+        if not self.is_poolable(device_specifier) or idle_timeout <= 0:
+            be = backend_class(device_specifier)
+            try:
+                yield be
+            finally:
+                be.dispose()
+            return
+
+        pooled = self._checkout(device_specifier)
+        if pooled is None:
+            logger.info(f"Opening connection to {device_specifier}")
+            pooled = _PooledBackend(backend_class(device_specifier), idle_timeout)
+        try:
+            yield pooled.backend
+        except Exception:
+            pooled.dispose()
+            raise
+        pooled.idle_timeout = idle_timeout
+        pooled.last_used = time.monotonic()
+        self._checkin(device_specifier, pooled)
+
+    def write(self, device_specifier, backend_class, data, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """Write data to the device over a pooled connection.
+
+        Stale connections are replaced before anything is sent (see _checkout).
+        A failed write is not repeated, part of the job may already have been
+        printed.
+        """
+        with self.connection(device_specifier, backend_class, idle_timeout) as be:
+            be.write(data)
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for pooled in connections:
+            pooled.dispose()
+
+    def _checkout(self, device_specifier):
+        with self._lock:
+            pooled = self._connections.pop(device_specifier, None)
+        if pooled is None:
+            return None
+        if pooled.expired(time.monotonic()) or not pooled.alive():
+            logger.info(f"Dropping stale connection to {device_specifier}")
+            pooled.dispose()
+            return None
+        return pooled
+
+    def _checkin(self, device_specifier, pooled):
+        with self._lock:
+            previous = self._connections.get(device_specifier)
+            self._connections[device_specifier] = pooled
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name='backend-pool-reaper', daemon=True)
+                self._reaper.start()
+        if previous is not None and previous is not pooled:
+            previous.dispose()
+
+    def _reap(self):
+        # Printers usually accept a single TCP client, so don't sit on idle sockets
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            with self._lock:
+                expired = [spec for spec, pooled in self._connections.items() if pooled.expired(now)]
+                stale = [self._connections.pop(spec) for spec in expired]
+            for pooled in stale:
+                pooled.dispose()
+
+
+backend_pool = BackendPool()
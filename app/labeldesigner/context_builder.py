@@ -1,5 +1,7 @@
 """Build label context from HTTP requests and JSON payloads."""
 
+import os
+
 from flask import current_app
 from .dimensions import get_label_spec
 
@@ -7,10 +9,16 @@ MARKDOWN_DEFAULT_PAGE_NUMBER_MM = 4.0
 MARKDOWN_DEFAULT_SLICE_MM = 90.0
 MARKDOWN_MIN_PAGE_NUMBER_FOOTER_MM = 6.0
 
+PREVIEW_QUALITIES = ('full', 'draft')
+
 
 def build_label_context_from_request(request):
     """Build label context dictionary from Flask request."""
-    d = request.values
+    return build_label_context_from_values(request.values)
+
+
+def build_label_context_from_values(d):
+    """Build label context dictionary from form style key/value pairs."""
     current_app.logger.info('[build_context] Received params: %s', dict(d))
     label_size = d.get('label_size', current_app.config['LABEL_DEFAULT_SIZE'])
     print_type = str(d.get('print_type', 'text')).lower()
@@ -64,6 +72,7 @@ def build_label_context_from_request(request):
         'markdown_page_number_mm': to_float(d.get('markdown_page_number_mm', None), MARKDOWN_DEFAULT_PAGE_NUMBER_MM),
         'markdown_page_count': int(d.get('markdown_page_count', 1)) == 1,
         'markdown_page': to_int(d.get('markdown_page', None), 1) if d.get('markdown_page') else None,
+        'markdown_engine': str(d.get('markdown_engine', current_app.config['MARKDOWN_DEFAULT_ENGINE'])).lower(),
         'head_width_px': width,
         'no_crop': int(d.get('no_crop', 0)) == 1,
         'label_width': to_int(d.get('label_width', None), 0),
@@ -172,6 +181,7 @@ def build_label_context_from_json(data):
         'markdown_page_number_mm': float(data.get('page_number_mm', MARKDOWN_DEFAULT_PAGE_NUMBER_MM)),
         'markdown_page_count': bool(data.get('page_count', True)),
         'markdown_page': int(data.get('markdown_page', 1)) if data.get('markdown_page') else None,
+        'markdown_engine': str(data.get('engine', cfg['MARKDOWN_DEFAULT_ENGINE'])).lower(),
         'head_width_px': width,
     }
 
@@ -180,4 +190,19 @@ def build_label_context_from_json(data):
         if context.get('markdown_slice_mm', 0) <= 0:
             context['markdown_slice_mm'] = MARKDOWN_DEFAULT_SLICE_MM
 
-    return context
\ No newline at end of file
+    return context
+
+
+def apply_preview_quality(context, quality, image_file=None):
+    """Render a preview context at PREVIEW_DRAFT_DPI for ``quality`` 'draft'.
+
+    Drafts only apply to uploaded PDFs, where rasterizing is the expensive
+    step. Other sources render at full resolution either way, so a draft
+    would only add a second render. Printing always renders at full
+    resolution.
+    """
+    if str(quality or 'full').lower() != 'draft' or image_file is None:
+        return context
+    if os.path.splitext(image_file.filename or '')[1].lower() == '.pdf':
+        context['render_dpi'] = int(current_app.config.get('PREVIEW_DRAFT_DPI', 100))
+    return context
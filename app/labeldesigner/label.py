@@ -1,6 +1,8 @@
+import hashlib
 from enum import Enum, auto
-from qrcode import QRCode, constants
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+
+from app.font_cache import load_font
 
 
 class LabelContent(Enum):
@@ -32,12 +34,8 @@ class TextAlign(Enum):
 
 
 class SimpleLabel:
-    qr_correction_mapping = {
-        'L': constants.ERROR_CORRECT_L,
-        'M': constants.ERROR_CORRECT_M,
-        'Q': constants.ERROR_CORRECT_Q,
-        'H': constants.ERROR_CORRECT_H
-    }
+    # Error correction levels, mapped to qrcode.constants when the code is generated
+    qr_correction_levels = ('L', 'M', 'Q', 'H')
 
     def __init__(
             self,
@@ -75,6 +73,14 @@ class SimpleLabel:
         self._line_spacing = line_spacing
         self.pre_rotated = pre_rotated
 
+    def __getstate__(self):
+        # Pages of a sequence point back to the whole sequence, which must not
+        # be pickled along when a single page is sent to a render worker
+        state = self.__dict__.copy()
+        state.pop('_markdown_labels', None)
+        state.pop('_pdf_page_labels', None)
+        return state
+
     @property
     def label_content(self):
         return self._label_content
@@ -93,14 +99,11 @@ class SimpleLabel:
 
     @property
     def qr_correction(self):
-        for key, val in self.qr_correction_mapping:
-            if val == self._qr_correction:
-                return key
+        return self._qr_correction
 
     @qr_correction.setter
     def qr_correction(self, value):
-        self._qr_correction = self.qr_correction_mapping.get(
-            value, constants.ERROR_CORRECT_L)
+        self._qr_correction = value if value in self.qr_correction_levels else 'L'
 
     @property
     def label_orientation(self):
@@ -118,6 +121,21 @@ class SimpleLabel:
     def label_type(self, value):
         self._label_type = value
 
+    def cache_key(self):
+        """Digest over everything that influences the generated image."""
+        h = hashlib.blake2b(digest_size=16)
+        params = (
+            self._width, self._height, self._label_content, self._label_orientation,
+            self._label_type, self._label_margin, self._fore_color, self._text,
+            self._text_align, self._qr_size, self._qr_correction, self._font_path,
+            self._font_size, self._line_spacing, self.pre_rotated
+        )
+        h.update(repr(params).encode('utf-8'))
+        if self._image is not None:
+            h.update(repr((self._image.mode, self._image.size)).encode('utf-8'))
+            h.update(self._image.tobytes())
+        return h.hexdigest()
+
     def generate(self):
         if self._label_content in (LabelContent.QRCODE_ONLY, LabelContent.TEXT_QRCODE):
             img = self._generate_qr()
@@ -195,7 +213,8 @@ class SimpleLabel:
         if self._label_content == LabelContent.MARKDOWN_IMAGE:
             print(f"[label.py] Creating canvas: {int(width)}x{int(height)}, img={img_width}x{img_height}, orientation={self._label_orientation}")
 
-        imgResult = Image.new('RGB', (int(width), int(height)), 'white')
+        mode = self._canvas_mode(img)
+        imgResult = Image.new(mode, (int(width), int(height)), 'white')
 
         if img is not None:
             imgResult.paste(img, image_offset)
@@ -205,17 +224,26 @@ class SimpleLabel:
             draw.multiline_text(
                 text_offset,
                 self._prepare_text(self._text),
-                self._fore_color,
+                self._fore_color if mode == 'RGB' else 0,
                 font=self._get_font(),
                 align=self._text_align,
                 spacing=int(self._font_size*((self._line_spacing - 100) / 100)))
 
         return imgResult
 
+    def _canvas_mode(self, img):
+        """Grayscale canvas for black only labels, RGB when red text or a color image is involved."""
+        if self._fore_color != (0, 0, 0):
+            return 'RGB'
+        if img is not None and img.mode not in ('1', 'L'):
+            return 'RGB'
+        return 'L'
+
     def _generate_qr(self):
+        from qrcode import QRCode, constants
         qr = QRCode(
             version=1,
-            error_correction=self._qr_correction,
+            error_correction=getattr(constants, f'ERROR_CORRECT_{self._qr_correction}'),
             box_size=self._qr_size,
             border=0,
         )
@@ -249,4 +277,4 @@ class SimpleLabel:
         return '\n'.join(lines)
 
     def _get_font(self):
-        return ImageFont.truetype(self._font_path, self._font_size)
+        return load_font(self._font_path, self._font_size)
@@ -3,17 +3,19 @@
 This module contains the massive create_label_from_context function.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+
 from flask import current_app
 from PIL import Image
 
 from app import FONTS
 from .label import SimpleLabel, LabelContent, LabelOrientation, LabelType
-from .dimensions import get_label_dimensions, margin_in_pixels, points_to_pixels
+from .dimensions import get_label_spec, get_label_dimensions, margin_in_pixels, points_to_pixels
 from .context_builder import build_label_context_from_request
 from .utils.image_processing import get_uploaded_image, apply_image_mode, scale_image_to_box, DEFAULT_DPI
 from .pdf_processor import get_uploaded_pdf_pages
 
-from brother_ql.devicedependent import ENDLESS_LABEL, DIE_CUT_LABEL
+from brother_ql.devicedependent import ENDLESS_LABEL, DIE_CUT_LABEL, ROUND_DIE_CUT_LABEL
 
 
 def get_font_info(font_family_name, font_style_name):
@@ -36,3 +38,35 @@ def create_label_from_request(request):
     from .context_builder import build_label_context_from_request
     context = build_label_context_from_request(request)
     return create_label_from_context(context, image_file=request.files.get('image', None))
+
+
+def create_labels_from_images(images, label_size):
+    """Wrap already rendered page images, e.g. forwarded by another instance, as labels.
+
+    The images are printed as they are: no margins, no cropping and no
+    resizing, the label type only decides how the printer rotates them.
+    """
+    kind = get_label_spec(label_size)['kind']
+    label_type = LabelType.DIE_CUT_LABEL if kind in (DIE_CUT_LABEL, ROUND_DIE_CUT_LABEL) else LabelType.ENDLESS_LABEL
+    return [SimpleLabel(
+        width=img.width,
+        height=img.height,
+        label_content=LabelContent.IMAGE_GRAYSCALE,
+        label_orientation=LabelOrientation.STANDARD,
+        label_type=label_type,
+        image=img) for img in images]
+
+
+def create_labels_from_contexts(contexts, max_workers=1):
+    """Create labels for many contexts concurrently, returned in input order."""
+    if max_workers <= 1 or len(contexts) <= 1:
+        return [create_label_from_context(context) for context in contexts]
+
+    app = current_app._get_current_object()
+
+    def build(context):
+        with app.app_context():
+            return create_label_from_context(context)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(build, contexts))
@@ -1,9 +1,16 @@
 """Markdown content slicing and pagination."""
 
-from typing import List, Optional, Dict, Tuple
-from PIL import Image, ImageDraw
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Dict, Sequence, Tuple
+from PIL import Image, ImageDraw, ImageFont
 from flask import current_app
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from app.font_cache import load_font
 from .dimensions import mm_to_pixels
 
 MARKDOWN_DEFAULT_SLICE_WINDOW_MM = 6.0
@@ -24,7 +31,7 @@ def slice_markdown_pages(image, slice_mm, footer_mm, dpi,
         if slice_mm <= 0:
             page = fragment
             if footer_px > 0:
-                canvas = Image.new('RGB', (fragment.width, fragment.height + footer_px), 'white')
+                canvas = Image.new(fragment.mode, (fragment.width, fragment.height + footer_px), 'white')
                 canvas.paste(fragment, (0, 0))
                 page = canvas
             return [(page, carry_boundary, False, fragment.height, 0)], False
@@ -126,7 +133,7 @@ def draw_page_number_footer(image, index, total, footer_mm, diameter_mm, dpi,
     try:
         if font_path:
             font_size = max(8, min(diameter_px - 2, int(diameter_px * 0.85)))
-            font = ImageFont.truetype(font_path, font_size)
+            font = load_font(font_path, font_size)
         else:
             font = ImageFont.load_default()
     except Exception:
@@ -164,33 +171,45 @@ def draw_page_number_footer(image, index, total, footer_mm, diameter_mm, dpi,
     return image
 
 
-def build_row_blank_map(image: Image.Image, white_threshold: int = 250, max_ink_frac: float = 0.01, downsample_x: int = 4) -> List[bool]:
-    gray = image.convert('L')
+def _row_ink_counts(gray: Image.Image, white_threshold: int):
+    """Count the pixels darker than white_threshold in every row of an 'L' image.
+
+    Returns a NumPy integer array, or a list when NumPy is not installed.
+    """
     width, height = gray.size
+    if np is not None:
+        return np.count_nonzero(np.asarray(gray) < white_threshold, axis=1)
+
+    # Average a 0/1 ink mask over each row by resizing it to one column ('F'
+    # keeps the means exact instead of rounding them to 8 bits)
+    ink = gray.point(lambda p: 1 if p < white_threshold else 0).convert('F')
+    means = ink.resize((1, height), resample=Image.BOX)
+    return [int(round(mean * width)) for mean in means.getdata()]
+
+
+def _downsample_rows(gray: Image.Image, downsample_x: int) -> Image.Image:
     if downsample_x > 1:
-        ds_width = max(1, width // downsample_x)
-        gray = gray.resize((ds_width, height), resample=Image.BOX)
-    else:
-        ds_width = width
+        width, height = gray.size
+        return gray.resize((max(1, width // downsample_x), height), resample=Image.BOX)
+    return gray
+
 
-    data = gray.tobytes()
-    stride = ds_width
+def build_row_blank_map(image: Image.Image, white_threshold: int = 250, max_ink_frac: float = 0.01, downsample_x: int = 4) -> Sequence[bool]:
+    gray = _downsample_rows(image.convert('L'), downsample_x)
+    stride = gray.width
     allowance = max(1, int(stride * max_ink_frac))
 
-    row_blank: List[bool] = []
-    offset = 0
-    for _ in range(height):
-        ink = 0
-        for x in range(stride):
-            if data[offset + x] < white_threshold:
-                ink += 1
-        row_blank.append(ink <= allowance)
-        offset += stride
+    counts = _row_ink_counts(gray, white_threshold)
+    if np is not None:
+        return counts <= allowance
+    return [ink <= allowance for ink in counts]
 
-    return row_blank
 
+def compute_row_stats(image: Image.Image, white_threshold: int = 250, max_ink_frac: float = 0.01, downsample_x: int = 4) -> tuple[Sequence[bool], Sequence[bool], Sequence[float]]:
+    """Per-row blank, heavy (near solid line) and ink density statistics.
 
-def compute_row_stats(image: Image.Image, white_threshold: int = 250, max_ink_frac: float = 0.01, downsample_x: int = 4) -> tuple[List[bool], List[bool], List[float]]:
+    Returns NumPy arrays when NumPy is installed and lists otherwise.
+    """
     gray = image.convert('L')
     width, height = gray.size
 
@@ -206,33 +225,19 @@ def compute_row_stats(image: Image.Image, white_threshold: int = 250, max_ink_fr
         right = min(width, right)
         if right > left:
             gray = gray.crop((left, 0, right, height))
-            width = right - left
-
-    if downsample_x > 1:
-        ds_width = max(1, width // downsample_x)
-        gray = gray.resize((ds_width, height), resample=Image.BOX)
-    else:
-        ds_width = width
 
-    data = gray.tobytes()
-    stride = ds_width
+    gray = _downsample_rows(gray, downsample_x)
+    stride = gray.width
     allowance = max(1, int(stride * max_ink_frac))
     heavy_threshold = max(stride - allowance, int(stride * 0.9))
 
-    row_blank: List[bool] = []
-    row_heavy: List[bool] = []
-    row_density: List[float] = []
-    offset = 0
-    for _ in range(height):
-        ink = 0
-        for x in range(stride):
-            if data[offset + x] < white_threshold:
-                ink += 1
-        row_blank.append(ink <= allowance)
-        row_heavy.append(ink >= heavy_threshold)
-        row_density.append(ink / float(stride))
-        offset += stride
+    counts = _row_ink_counts(gray, white_threshold)
+    if np is not None:
+        return counts <= allowance, counts >= heavy_threshold, counts / float(stride)
 
+    row_blank = [ink <= allowance for ink in counts]
+    row_heavy = [ink >= heavy_threshold for ink in counts]
+    row_density = [ink / float(stride) for ink in counts]
     return row_blank, row_heavy, row_density
 
 
@@ -313,6 +318,187 @@ def find_previous_boundary(row_blank: List[bool],
     return best
 
 
+class RowIndex:
+    """Index over row statistics answering the cut searches in O(log n) or O(1).
+
+    Built once per slicing run: sorted positions of ink and heavy rows, the
+    end positions of blank runs (from prefix sums over ``row_blank``, one list
+    per run length) and a sparse table for range maximum queries over
+    ``row_density``. The answers are identical to the linear scans of
+    ``find_safe_cut_y_rows``, ``find_table_separator_row``,
+    ``find_previous_boundary`` and the density fallback of ``slice_exact_pages``.
+    """
+
+    def __init__(self, row_blank: Sequence[bool],
+                 row_heavy: Optional[Sequence[bool]] = None,
+                 row_density: Optional[Sequence[float]] = None):
+        self.height = len(row_blank)
+        if np is not None:
+            blank = np.asarray(row_blank, dtype=bool)
+            self._blank_prefix = np.concatenate(([0], np.cumsum(blank)))
+            self._ink_rows = np.flatnonzero(~blank).tolist()
+        else:
+            blank = [bool(b) for b in row_blank]
+            self._blank_prefix = [0]
+            for b in blank:
+                self._blank_prefix.append(self._blank_prefix[-1] + b)
+            self._ink_rows = [i for i, b in enumerate(blank) if not b]
+
+        self.heavy_height = len(row_heavy) if row_heavy is not None else 0
+        if row_heavy is None:
+            self._heavy_rows = None
+        elif np is not None:
+            self._heavy_rows = np.flatnonzero(np.asarray(row_heavy, dtype=bool)).tolist()
+        else:
+            self._heavy_rows = [i for i, heavy in enumerate(row_heavy) if heavy]
+
+        self._density = list(row_density) if row_density is not None else None
+        self._density_table = None
+        self._run_ends_cache: Dict[int, List[int]] = {}
+
+    def last_ink_row(self) -> int:
+        return self._ink_rows[-1] if self._ink_rows else -1
+
+    def _run_ends(self, run: int) -> List[int]:
+        """Sorted positions e where rows [e - run, e) are all blank."""
+        ends = self._run_ends_cache.get(run)
+        if ends is None:
+            prefix = self._blank_prefix
+            if run > self.height:
+                ends = []
+            elif np is not None:
+                candidates = np.arange(run, self.height + 1)
+                ends = candidates[prefix[run:] - prefix[:len(prefix) - run] == run].tolist()
+            else:
+                ends = [e for e in range(run, self.height + 1) if prefix[e] - prefix[e - run] == run]
+            self._run_ends_cache[run] = ends
+        return ends
+
+    def safe_cut(self, approx_y: int, window_px: int, min_blank_run: int) -> int:
+        """Same result as ``find_safe_cut_y_rows``."""
+        h = self.height
+        if h == 0:
+            return approx_y
+        approx_y = max(0, min(approx_y, h - 1))
+        window_px = max(0, window_px)
+        run = max(1, min_blank_run)
+        half = run // 2
+        ends = self._run_ends(run)
+
+        # Closest blank run at or above approx_y, cut below it
+        top = max(0, approx_y - window_px)
+        lo, hi = max(top - half + run, run), min(approx_y - half + run, h)
+        if lo <= hi:
+            i = bisect_right(ends, hi) - 1
+            if i >= 0 and ends[i] >= lo:
+                return ends[i]
+
+        # Otherwise the closest one below approx_y, cut above it
+        bot = min(h, approx_y + window_px)
+        lo, hi = max(approx_y - half + run, run), min(bot - 1 - half + run, h)
+        if lo <= hi:
+            i = bisect_left(ends, lo)
+            if i < len(ends) and ends[i] <= hi:
+                return ends[i] - run
+
+        return approx_y
+
+    def separator_row(self, approx_y: int, window_px: int) -> Optional[int]:
+        """Same result as ``find_table_separator_row``."""
+        h = self.heavy_height
+        if h == 0 or self._heavy_rows is None:
+            return None
+        approx_y = max(0, min(approx_y, h - 1))
+        window_px = max(0, window_px)
+        top = max(0, approx_y - window_px)
+        bot = min(h, approx_y + window_px)
+        heavy = self._heavy_rows
+
+        i = bisect_left(heavy, approx_y)
+        if i < len(heavy) and heavy[i] < bot:
+            return min(h, heavy[i] + 1)
+        i = bisect_right(heavy, min(approx_y, bot - 1)) - 1
+        if i >= 0 and heavy[i] >= top:
+            return min(h, heavy[i] + 1)
+        return None
+
+    def previous_boundary(self, approx_y: int, lower_bound: int, min_blank_run: int) -> Optional[int]:
+        """Same result as ``find_previous_boundary``."""
+        if approx_y <= lower_bound:
+            return None
+        run = max(1, min_blank_run)
+        last_y = approx_y - 1
+
+        heavy_y = -1
+        if self._heavy_rows is not None:
+            i = bisect_right(self._heavy_rows, min(last_y, self.heavy_height - 1)) - 1
+            if i >= 0 and self._heavy_rows[i] >= lower_bound:
+                heavy_y = self._heavy_rows[i]
+
+        # Full blank runs ending at y
+        blank_y = -1
+        ends = self._run_ends(run)
+        i = bisect_right(ends, last_y + 1) - 1
+        if i >= 0 and ends[i] >= lower_bound + run:
+            blank_y = ends[i] - 1
+        # Shorter runs clipped at lower_bound count as well
+        i = bisect_left(self._ink_rows, lower_bound)
+        first_ink = self._ink_rows[i] if i < len(self._ink_rows) else self.height
+        clipped_y = min(first_ink - 1, lower_bound + run - 2, last_y, self.height - 1)
+        if clipped_y >= lower_bound:
+            blank_y = max(blank_y, clipped_y)
+
+        if heavy_y < lower_bound and blank_y < lower_bound:
+            return None
+        if heavy_y >= blank_y:
+            return min(self.height, heavy_y + 1)
+        return blank_y + 1
+
+    def densest_row(self, first: int, last: int) -> Optional[Tuple[int, float]]:
+        """Row with the highest density in [first, last], the last such row on ties."""
+        if self._density is None:
+            return None
+        first = max(0, first)
+        last = min(last, len(self._density) - 1)
+        if last < first:
+            return None
+        if self._density_table is None:
+            self._density_table = self._build_density_table()
+        level = (last - first + 1).bit_length() - 1
+        a = self._density_table[level][first]
+        b = self._density_table[level][last - (1 << level) + 1]
+        row = self._denser(a, b)
+        return row, self._density[row]
+
+    def _denser(self, a: int, b: int) -> int:
+        da, db = self._density[a], self._density[b]
+        if da != db:
+            return a if da > db else b
+        return max(a, b)
+
+    def _build_density_table(self) -> List[Sequence[int]]:
+        n = len(self._density)
+        if np is not None:
+            density = np.asarray(self._density, dtype=float)
+            table = [np.arange(n)]
+            span = 1
+            while span * 2 <= n:
+                prev = table[-1]
+                a, b = prev[:len(prev) - span], prev[span:]
+                da, db = density[a], density[b]
+                table.append(np.where(da > db, a, np.where(da < db, b, np.maximum(a, b))))
+                span *= 2
+            return [level.tolist() for level in table]
+
+        table = [list(range(n))]
+        span = 1
+        while span * 2 <= n:
+            prev = table[-1]
+            table.append([self._denser(prev[i], prev[i + span]) for i in range(n - span * 2 + 1)])
+            span *= 2
+        return table
+
+
 def slice_exact_pages(image: Image.Image, mm_height: float, dpi: int, footer_px: int = 0,
                       smart: bool = True, window_px: int = 0, min_blank_run: int = 4,
                       row_blank: Optional[List[bool]] = None,
@@ -341,11 +527,10 @@ def slice_exact_pages(image: Image.Image, mm_height: float, dpi: int, footer_px:
         else:
             effective_row_blank, effective_row_heavy, effective_row_density = compute_row_stats(image, white_threshold=250, max_ink_frac=0.01, downsample_x=4)
 
+    index: Optional[RowIndex] = None
     if effective_row_blank is not None:
-        try:
-            last_ink = max(i for i, b in enumerate(effective_row_blank) if not b)
-        except ValueError:
-            last_ink = -1
+        index = RowIndex(effective_row_blank, effective_row_heavy, effective_row_density)
+        last_ink = index.last_ink_row()
     else:
         last_ink = image.height - 1
     effective_total = max(0, last_ink + 1)
@@ -362,7 +547,7 @@ def slice_exact_pages(image: Image.Image, mm_height: float, dpi: int, footer_px:
     while True:
         if y >= total:
             if not pages and total == 0:
-                blank = Image.new('RGB', (image.width, page_px), (255, 255, 255))
+                blank = Image.new(image.mode, (image.width, page_px), 'white')
                 pages.append((blank, last_boundary, False, 0, 0))
             break
 
@@ -409,32 +594,26 @@ def slice_exact_pages(image: Image.Image, mm_height: float, dpi: int, footer_px:
                     used_boundary = True
                     boundary_idx = scan_idx
 
-            if not used_boundary and smart and effective_row_blank is not None:
+            if not used_boundary and smart and index is not None:
                 window = window_px if window_px > 0 else content_px
-                cut_y = find_safe_cut_y_rows(effective_row_blank, target_cut, window, max(1, min_blank_run))
+                cut_y = index.safe_cut(target_cut, window, max(1, min_blank_run))
                 if effective_row_heavy is not None and cut_y == target_cut:
-                    table_cut = find_table_separator_row(effective_row_heavy, target_cut, window)
+                    table_cut = index.separator_row(target_cut, window)
                     if table_cut is not None and table_cut > y:
                         cut_y = min(table_cut, total)
 
                 if cut_y == target_cut:
-                    boundary = find_previous_boundary(effective_row_blank, effective_row_heavy, target_cut, y, max(1, min_blank_run))
+                    boundary = index.previous_boundary(target_cut, y, max(1, min_blank_run))
                     if boundary is not None and boundary > y:
                         cut_y = min(boundary, total)
                 if cut_y == target_cut and effective_row_density is not None:
                     window = window_px if window_px > 0 else content_px
                     search_lower = max(y, target_cut - window)
-                    best_row = None
-                    best_density = -1.0
-                    for row in range(target_cut - 1, search_lower - 1, -1):
-                        if row < 0 or row >= len(effective_row_density):
-                            continue
-                        density = effective_row_density[row]
-                        if density > best_density:
-                            best_density = density
-                            best_row = row
-                    if best_row is not None and best_density >= 0.95 and best_row + 1 > y:
-                        cut_y = min(best_row + 1, total)
+                    densest = index.densest_row(search_lower, target_cut - 1)
+                    if densest is not None:
+                        best_row, best_density = densest
+                        if best_density >= 0.95 and best_row + 1 > y:
+                            cut_y = min(best_row + 1, total)
             elif not used_boundary:
                 cut_y = target_cut
 
@@ -469,7 +648,7 @@ def slice_exact_pages(image: Image.Image, mm_height: float, dpi: int, footer_px:
                 # INNERGRID is 0.6pt ≈ 2.5px at 300dpi, use 3px to be safe
                 border_overlap = 3
 
-        page = Image.new('RGB', (image.width, page_px), (255, 255, 255))
+        page = Image.new(image.mode, (image.width, page_px), 'white')
         if cut_y > y:
             # Extend the crop to include border if needed
             crop_end = min(cut_y + border_overlap, total)
@@ -1,14 +1,36 @@
 """PDF file processing utilities."""
 
+import logging
 import os
+from functools import partial
+
 from flask import current_app
 from PIL import Image
 
-from app.utils import pdffile_to_images, get_pdf_page_count, pdffile_to_single_page
-from .utils.image_processing import apply_crop_and_rotate, apply_image_mode, scale_image_to_box, RESAMPLE_LANCZOS
+from app.utils import pdffile_to_images, get_pdf_page_count, file_to_bytes, render_pdf_page
+from .utils.image_processing import (
+    apply_crop_and_rotate,
+    apply_image_mode,
+    scale_image_to_box,
+    get_render_dpi,
+    to_printer_scale,
+    RESAMPLE_LANCZOS
+)
+from .render_pool import render_map
 
 DEFAULT_DPI = 300
 
+logger = logging.getLogger(__name__)
+
+
+def _render_pdf_page_or_none(pdf_bytes, dpi, page_number):
+    """Render one page in a pool worker, a page that fails is skipped instead of failing the document."""
+    try:
+        return render_pdf_page(pdf_bytes, dpi, page_number)
+    except Exception as e:
+        logger.error(f"Failed to convert PDF page {page_number + 1}: {e}")
+        return None
+
 
 def get_uploaded_pdf_pages(image_file, context, content_width_px, content_height_limit_px, is_endless):
     """Get all pages from a multipage PDF as a list of processed images."""
@@ -20,6 +42,7 @@ def get_uploaded_pdf_pages(image_file, context, content_width_px, content_height
         current_app.logger.info('[pdf-multipage] Loading PDF pages from %s', image_file.filename)
 
         page_count = get_pdf_page_count(image_file)
+        dpi = get_render_dpi(context)
         selected_page_numbers = []
 
         page_from = context.get('page_from')
@@ -28,7 +51,7 @@ def get_uploaded_pdf_pages(image_file, context, content_width_px, content_height
 
         if not page_count:
             # Fallback: load all pages
-            images = pdffile_to_images(image_file, DEFAULT_DPI)
+            images = pdffile_to_images(image_file, dpi)
             page_count = len(images)
 
             if page_from is not None or page_to is not None:
@@ -60,17 +83,22 @@ def get_uploaded_pdf_pages(image_file, context, content_width_px, content_height
                 context['pdf_page_count'] = page_count
                 context['pdf_current_page'] = requested_page + 1
 
-            pages_to_process = []
-            for page_num in pages_to_load:
-                img = pdffile_to_single_page(image_file, DEFAULT_DPI, page_number=page_num)
-                if img:
-                    pages_to_process.append(img)
+            # Pages are rasterized concurrently by the render pool, in page order
+            pdf_bytes = file_to_bytes(image_file)
+            rendered = render_map(partial(_render_pdf_page_or_none, pdf_bytes, dpi), pages_to_load)
+            skipped = [page_num + 1 for page_num, img in zip(pages_to_load, rendered) if not img]
+            if skipped:
+                current_app.logger.warning('[pdf-multipage] Skipping pages that could not be converted: %s',
+                                           ', '.join(map(str, skipped)))
+            pages_to_process = [img for img in rendered if img]
+            selected_page_numbers = [page_num + 1 for page_num, img in zip(pages_to_load, rendered) if img]
 
         # Process pages
         processed_pages = []
         stretch_length = context.get('image_stretch_length', False)
 
         for idx, img in enumerate(pages_to_process):
+            img = to_printer_scale(img, dpi)
             img = apply_crop_and_rotate(img, context)
             img = apply_image_mode(img, context)
 
@@ -93,7 +121,7 @@ def get_uploaded_pdf_pages(image_file, context, content_width_px, content_height
 
                 if not stretch_length and not is_rotated:
                     canvas_width = int(content_width_px)
-                    canvas = Image.new('RGB', (canvas_width, img.height), 'white')
+                    canvas = Image.new(img.mode if img.mode in ('1', 'L') else 'RGB', (canvas_width, img.height), 'white')
                     x = max(0, (canvas_width - img.width) // 2)
                     canvas.paste(img, (x, 0))
                     img = canvas
@@ -0,0 +1,314 @@
+"""Content addressed cache of rendered label previews.
+
+Previews are keyed by a hash of the built label context and the digest of
+the uploaded file, so re-posting an unchanged designer state skips font
+loading, PDF building, rasterization and PNG encoding. Entries live in a
+memory LRU and, optionally, in a size bounded directory on disk that
+survives restarts.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from flask import current_app
+from PIL import Image
+
+from app.utils import file_to_bytes
+from app.lru_cache import BytesLRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE_MB = 64
+
+# Disk tier used when PREVIEW_CACHE_DISK_SIZE_MB is None and several server
+# processes share the work, it is what lets any of them serve page URLs
+MULTIPROCESS_DISK_SIZE_MB = 128
+
+# A full disk tier is evicted down to this fraction of its size, so the
+# directory is not rescanned on every following write
+DISK_EVICT_TO = 0.9
+
+# Bump when the rendering output changes so stale disk entries are ignored
+CACHE_VERSION = 2
+
+# Set when several server processes answer requests (see gunicorn.conf.py),
+# a page URL may then reach another process than the one that rendered the
+# preview and only the disk tier is shared between them
+_multiprocess = False
+
+# Context entries filled in while rendering that previews report back
+PREVIEW_META_KEYS = ('source_width_mm', 'source_height_mm', 'pdf_page_count', 'pdf_current_page', 'render_dpi')
+
+
+def preview_cache_key(kind, context, upload=None):
+    """Hash a freshly built context (and uploaded file) into a cache key.
+
+    Must be called before the label is created, rendering adds entries to the context.
+    """
+    h = hashlib.sha256()
+    h.update(f'{CACHE_VERSION}:{kind}:'.encode())
+    h.update(json.dumps(context, sort_keys=True, default=str).encode())
+    if upload is not None:
+        h.update(b':')
+        h.update(hashlib.sha256(file_to_bytes(upload)).digest())
+        upload.seek(0)
+    return h.hexdigest()
+
+
+def encode_page(png, fmt='png', bilevel=False):
+    """Re-encode a preview page, optionally dithered to 1 bit like the printer does.
+
+    Pages with red content stay in color, a 1 bit page would lose it.
+    """
+    img = Image.open(io.BytesIO(png))
+    if bilevel and img.mode in ('1', 'L'):
+        img = img.convert('1')
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        img.save(buffer, format='WEBP', lossless=True, method=4)
+    else:
+        img.save(buffer, format='PNG', optimize=bilevel)
+    return buffer.getvalue()
+
+
+class _DiskTier:
+    """Directory of previews, one PNG file per page and a JSON file with the metadata.
+
+    A running total of the written bytes bounds the directory. It is only
+    scanned on start and once the total exceeds max_bytes, then the least
+    recently used previews are evicted down to DISK_EVICT_TO of the limit.
+    Processes sharing the directory each count their own writes on top of
+    the last scan.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._total = sum(size for _, size, _ in self._scan().values())
+
+    def _meta_file(self, key):
+        return os.path.join(self.path, f'{key}.json')
+
+    def _page_file(self, key, index):
+        return os.path.join(self.path, f'{key}.{index}.png')
+
+    def __contains__(self, key):
+        return os.path.exists(self._meta_file(key))
+
+    def get(self, key):
+        meta_file = self._meta_file(key)
+        try:
+            with open(meta_file, 'rb') as f:
+                entry = json.loads(f.read())
+            pages = []
+            for index in range(entry['pages']):
+                with open(self._page_file(key, index), 'rb') as f:
+                    pages.append(f.read())
+            os.utime(meta_file)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return pages, entry['meta']
+
+    def get_page(self, key, index):
+        try:
+            with open(self._page_file(key, index), 'rb') as f:
+                data = f.read()
+            # Fails for pages left behind by an evicted preview
+            os.utime(self._meta_file(key))
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, pages, meta):
+        meta_data = json.dumps({'pages': len(pages), 'meta': meta}).encode()
+        size = sum(len(page) for page in pages) + len(meta_data)
+        if size > self.max_bytes:
+            return
+        try:
+            for index, page in enumerate(pages):
+                self._write(self._page_file(key, index), page)
+            # Written last, the metadata marks the preview complete
+            self._write(self._meta_file(key), meta_data)
+        except OSError as e:
+            logger.warning(f"Could not write preview cache entry: {e}")
+            return
+        with self._lock:
+            self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _write(self, filename, data):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, filename)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _scan(self):
+        """Group the files of the directory by preview: {key: (last used, size, paths)}.
+
+        Previews without metadata (being written or half evicted) count as
+        least recently used. Entries of the former single file format are removed.
+        """
+        entries = {}
+        for entry in os.scandir(self.path):
+            key, _, ext = entry.name.partition('.')
+            if ext == 'bin':
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+                continue
+            if ext != 'json' and not ext.endswith('.png'):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            last_used, size, paths = entries.get(key, (0, 0, []))
+            if ext == 'json':
+                last_used = st.st_mtime
+            entries[key] = (last_used, size + st.st_size, paths + [entry.path])
+        return entries
+
+    def _evict(self):
+        entries = self._scan()
+        self._total = sum(size for _, size, _ in entries.values())
+        target = self.max_bytes * DISK_EVICT_TO
+        for last_used, size, paths in sorted(entries.values()):
+            if self._total <= target:
+                break
+            # The metadata goes first, so readers never see a partial preview
+            for path in sorted(paths, key=lambda path: not path.endswith('.json')):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            self._total -= size
+
+    def stats(self):
+        entries = self._scan()
+        return {'entries': len(entries), 'size_bytes': sum(size for _, size, _ in entries.values()),
+                'max_bytes': self.max_bytes}
+
+
+class PreviewCache:
+    """Two tier cache of previews: a list of PNG pages plus their metadata.
+
+    Pages are stored one by one, next to an entry holding the page count and
+    metadata, so a single page is fetched without loading the whole preview.
+    """
+
+    def __init__(self, max_bytes, disk_path=None, disk_max_bytes=0):
+        self.memory = BytesLRUCache(max_bytes=max_bytes)
+        self.disk = _DiskTier(disk_path, disk_max_bytes) if disk_path and disk_max_bytes > 0 else None
+        self.disk_hits = 0
+
+    def get(self, key):
+        """Return ``(pages, meta)`` for a cached preview or None."""
+        data = self.memory.get(key)
+        if data is not None:
+            entry = json.loads(data)
+            pages = [self.memory.get(f'{key}:{index}') for index in range(entry['pages'])]
+            if None not in pages:
+                return pages, entry['meta']
+        if self.disk is None:
+            return None
+        cached = self.disk.get(key)
+        if cached is None:
+            return None
+        self.disk_hits += 1
+        self._put_memory(key, *cached)
+        return cached
+
+    def put(self, key, pages, meta):
+        self._put_memory(key, pages, meta)
+        if self.disk is not None:
+            self.disk.put(key, list(pages), dict(meta))
+
+    def _put_memory(self, key, pages, meta):
+        for index, page in enumerate(pages):
+            self.memory.put(f'{key}:{index}', page)
+        # Put last, so a preview with its entry usually has all of its pages
+        self.memory.put(key, json.dumps({'pages': len(pages), 'meta': dict(meta)}).encode())
+
+    def __contains__(self, key):
+        return key in self.memory or (self.disk is not None and key in self.disk)
+
+    def addressable(self, key):
+        """Whether every server process can serve the pages of a cached preview."""
+        if _multiprocess:
+            return self.disk is not None and key in self.disk
+        return key in self
+
+    def get_page(self, key, index, fmt='png', bilevel=False):
+        """Return one page of a cached preview encoded as ``fmt``, None if unknown.
+
+        Re-encoded variants are kept in the memory tier next to the preview.
+        """
+        if fmt == 'png' and not bilevel:
+            page_key = f'{key}:{index}'
+            data = self.memory.get(page_key)
+            if data is None and self.disk is not None and index >= 0:
+                data = self.disk.get_page(key, index)
+                if data is not None:
+                    self.disk_hits += 1
+                    self.memory.put(page_key, data)
+            return data
+
+        variant_key = f'{key}:{index}:{fmt}:{int(bilevel)}'
+        data = self.memory.get(variant_key)
+        if data is None:
+            png = self.get_page(key, index)
+            if png is None:
+                return None
+            data = encode_page(png, fmt, bilevel)
+            self.memory.put(variant_key, data)
+        return data
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        stats['disk'] = self.disk.stats() if self.disk is not None else None
+        return stats
+
+
+_preview_cache = None
+_preview_cache_lock = threading.Lock()
+
+
+def set_multiprocess(enabled):
+    """Declare that requests are spread over several server processes."""
+    global _multiprocess
+    _multiprocess = enabled
+
+
+def get_preview_cache():
+    """Get the process wide preview cache configured by PREVIEW_CACHE_*."""
+    global _preview_cache
+    with _preview_cache_lock:
+        if _preview_cache is None:
+            cfg = current_app.config
+            size_mb = cfg.get('PREVIEW_CACHE_SIZE_MB', DEFAULT_SIZE_MB)
+            disk_mb = cfg.get('PREVIEW_CACHE_DISK_SIZE_MB')
+            if disk_mb is None:
+                disk_mb = MULTIPROCESS_DISK_SIZE_MB if _multiprocess else 0
+            disk_path = cfg.get('PREVIEW_CACHE_DISK_DIR') or os.path.join(current_app.instance_path, 'preview_cache')
+            _preview_cache = PreviewCache(
+                max_bytes=int(size_mb * 1024 * 1024),
+                disk_path=disk_path if disk_mb > 0 else None,
+                disk_max_bytes=int(disk_mb * 1024 * 1024))
+        return _preview_cache
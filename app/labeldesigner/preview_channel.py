@@ -0,0 +1,155 @@
+"""Live preview channels: the latest preview of a designer, pushed as server-sent events.
+
+The designer posts every edit with an increasing sequence number to its
+channel. Starting the render of an edit supersedes the renders of all older
+edits of the channel, they stop at their next checkpoint (see
+RenderTicket.check), and only the result of the latest edit is pushed to
+the channel's event stream.
+
+Channels live in the memory of one process, an edit has to reach the
+process serving the channel's stream. Live preview is therefore only
+offered when the server runs a single process (see set_multiprocess).
+"""
+
+import logging
+import threading
+import time
+
+from .render_pool import RenderCancelled
+
+logger = logging.getLogger(__name__)
+
+# Channels without a stream are forgotten after this many idle seconds
+CHANNEL_IDLE_TIMEOUT = 300
+
+_multiprocess = False
+
+
+class RenderTicket:
+    """Render of one edit, cancelled once a newer edit of the channel starts."""
+
+    def __init__(self, channel, seq):
+        self.channel = channel
+        self.seq = seq
+
+    def cancelled(self):
+        return self.channel.seq != self.seq
+
+    def check(self):
+        """Raise RenderCancelled when the edit has been superseded."""
+        if self.cancelled():
+            raise RenderCancelled()
+
+
+class PreviewChannel:
+    """Latest edit and latest preview of one designer."""
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.seq = -1
+        self.streams = 0
+        self.last_active = time.monotonic()
+        self._event = None
+        self._event_seq = -1
+        self._cond = threading.Condition()
+
+    def begin(self, seq):
+        """Start rendering edit ``seq``, superseding older edits.
+
+        Returns None when a newer edit is already known, edits can arrive out
+        of order over separate connections.
+        """
+        with self._cond:
+            self.last_active = time.monotonic()
+            if seq <= self.seq:
+                return None
+            self.seq = seq
+            return RenderTicket(self, seq)
+
+    def publish(self, ticket, event):
+        """Push the preview of an edit to the streams, if it is still the latest.
+
+        Returns True if a stream of this process will deliver it.
+        """
+        with self._cond:
+            if ticket.cancelled():
+                return False
+            self._event = event
+            self._event_seq = ticket.seq
+            self._cond.notify_all()
+            return self.streams > 0
+
+    def events(self, keepalive, max_seconds):
+        """Yield every new preview, and None after ``keepalive`` idle seconds.
+
+        Ends after ``max_seconds``, the browser reconnects on its own. The
+        stream has to be reserved with open_stream beforehand.
+        """
+        deadline = time.monotonic() + max_seconds
+        with self._cond:
+            seen = self._event_seq
+        while time.monotonic() < deadline:
+            with self._cond:
+                self._cond.wait_for(lambda: self._event_seq != seen,
+                                    timeout=min(keepalive, max(0, deadline - time.monotonic())))
+                self.last_active = time.monotonic()
+                if self._event_seq == seen:
+                    event = None
+                else:
+                    event, seen = self._event, self._event_seq
+            yield event
+
+    def close_stream(self):
+        """Release a stream reserved with open_stream."""
+        with _lock, self._cond:
+            self.streams -= 1
+            self.last_active = time.monotonic()
+
+
+_channels = {}
+_lock = threading.Lock()
+
+
+def set_multiprocess(enabled):
+    """Declare that requests are spread over several server processes."""
+    global _multiprocess
+    _multiprocess = enabled
+
+
+def live_preview_available(enabled=True):
+    """Whether live preview channels can be offered, given PREVIEW_LIVE_ENABLED."""
+    return bool(enabled) and not _multiprocess
+
+
+def _channel(channel_id):
+    now = time.monotonic()
+    for stale_id in [cid for cid, channel in _channels.items()
+                     if channel.streams == 0 and now - channel.last_active > CHANNEL_IDLE_TIMEOUT]:
+        del _channels[stale_id]
+    channel = _channels.get(channel_id)
+    if channel is None:
+        channel = _channels[channel_id] = PreviewChannel(channel_id)
+        logger.debug(f"Opened preview channel {channel_id}")
+    return channel
+
+
+def get_preview_channel(channel_id):
+    """Get (or open) a channel, dropping channels nobody used for a while."""
+    with _lock:
+        return _channel(channel_id)
+
+
+def open_stream(channel_id, max_streams):
+    """Reserve an event stream of a channel, at most ``max_streams`` per process.
+
+    Returns the channel, or None when all streams are taken. Release the
+    stream with PreviewChannel.close_stream.
+    """
+    with _lock:
+        if sum(channel.streams for channel in _channels.values()) >= max_streams:
+            return None
+        channel = _channel(channel_id)
+        with channel._cond:
+            channel.streams += 1
+            channel.last_active = time.monotonic()
+        return channel
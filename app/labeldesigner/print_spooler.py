@@ -0,0 +1,156 @@
+"""Background print spooler with one worker thread per printer.
+
+Spoolers and job states live in the memory of one process. Under gunicorn
+with several workers a job can only be looked up on the worker that
+accepted it, clients that need the result there pass wait=1.
+"""
+
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RASTERIZING = 'rasterizing'
+JOB_SENDING = 'sending'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Finished jobs are kept around so clients can poll their final state
+MAX_FINISHED_JOBS = 200
+
+
+class PrintJob:
+    """A single print request handed over to a spooler."""
+
+    def __init__(self, printer_id, printer_queue):
+        self.id = str(uuid.uuid4())
+        self.printer_id = printer_id
+        self.printer_queue = printer_queue
+        self.state = JOB_QUEUED
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._done = threading.Event()
+
+    def set_state(self, state):
+        self.state = state
+        logger.debug(f"Job {self.id} on printer {self.printer_id}: {state}")
+
+    def finish(self, error=None):
+        self.error = error
+        self.state = JOB_FAILED if error else JOB_DONE
+        self.finished = time.time()
+        # Drop the labels, they are not needed anymore
+        self.printer_queue = None
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Block until the job is done or failed. Returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'printer_id': self.printer_id,
+            'state': self.state,
+            'error': self.error,
+            'created': self.created,
+            'finished': self.finished
+        }
+
+
+class PrintSpooler:
+    """Drains print jobs for one printer on a dedicated daemon thread."""
+
+    def __init__(self, printer_id):
+        self.printer_id = printer_id
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f'print-spooler-{printer_id}',
+            daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        self._queue.put(job)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.set_state(JOB_RASTERIZING)
+                job.printer_queue.process_queue(progress_callback=job.set_state)
+            except Exception as e:
+                logger.error(f"Print job {job.id} on printer {self.printer_id} failed: {e}", exc_info=True)
+                job.finish(error=str(e))
+            else:
+                job.finish()
+            finally:
+                self._queue.task_done()
+                _forget_finished_jobs()
+
+
+_spoolers = {}
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_spooler(printer_id):
+    """Get (or start) the spooler for a printer id."""
+    with _lock:
+        spooler = _spoolers.get(printer_id)
+        if spooler is None:
+            spooler = PrintSpooler(printer_id)
+            _spoolers[printer_id] = spooler
+        return spooler
+
+
+def submit_print_job(printer_id, printer_queue):
+    """Queue a filled printer queue for background printing and return the job."""
+    job = PrintJob(printer_id, printer_queue)
+    with _lock:
+        _jobs[job.id] = job
+    get_spooler(printer_id).submit(job)
+    return job
+
+
+def get_print_job(job_id):
+    """Look up a job by id, returns None for unknown or expired jobs."""
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def _forget_finished_jobs():
+    with _lock:
+        finished = [job_id for job_id, job in _jobs.items() if job.state in (JOB_DONE, JOB_FAILED)]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[job_id]
+
+
+def spool_print_job(printer, wait=False):
+    """Hand a filled printer queue to its spooler and return the job id.
+
+    Prints synchronously (returning None) when the spooler is disabled. With
+    ``wait`` the call blocks until the job has finished and raises if it failed.
+    """
+    if not current_app.config.get('PRINT_SPOOLER_ENABLED', True):
+        printer.process_queue()
+        return None
+
+    job = submit_print_job(printer.printer_id, printer)
+    if wait:
+        if not job.wait(current_app.config.get('PRINT_JOB_WAIT_TIMEOUT', 120)):
+            raise Exception(f"Print job {job.id} did not finish in time")
+        if job.state == JOB_FAILED:
+            raise Exception(job.error)
+    return job.id
@@ -1,24 +1,151 @@
 from brother_ql.backends import backend_factory, guess_backend
 from brother_ql import BrotherQLRaster, create_label
 from .label import LabelOrientation, LabelType, LabelContent
+from .print_spooler import JOB_SENDING
+from .backend_pool import backend_pool, DEFAULT_IDLE_TIMEOUT
+import hashlib
 import logging
+import os
+import queue
+import re
+import tempfile
+import threading
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# Number of rasterized labels buffered ahead of the printer when streaming
+STREAM_BUFFER_LABELS = 2
+
+# Start of every BrotherQLRaster stream: switch to raster mode (models that
+# support it), invalidate (NUL bytes), initialize (ESC @)
+RASTER_PREAMBLE = re.compile(rb'(\x1bia\x01)?\x00+\x1b@')
+
+
+def is_raster_stream(data):
+    """Whether data starts like an instruction stream created by rasterize_label."""
+    return RASTER_PREAMBLE.match(data) is not None
 
-class PrinterQueue:
 
-    _printQueue = []
-    _cutQueue = []
+class DeviceLock:
+    """Serializes the communication with one printer device.
+
+    A thread lock orders the threads of this process, and an flock on a lock
+    file in the temp directory (where fcntl is available) orders the server
+    processes, e.g. several gunicorn workers printing to the same printer.
+    """
+
+    def __init__(self, device_specifier):
+        digest = hashlib.sha1(device_specifier.encode()).hexdigest()[:16]
+        self.path = os.path.join(tempfile.gettempdir(), f'brother_ql_web-device-{digest}.lock')
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if fcntl is not None:
+            try:
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except Exception:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self._file is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+                self._file.close()
+                self._file = None
+        finally:
+            self._lock.release()
+
+
+_device_locks = {}
+_device_locks_guard = threading.Lock()
+
+
+def get_device_lock(device_specifier):
+    """Get the lock serializing all communication with one printer device."""
+    with _device_locks_guard:
+        lock = _device_locks.get(device_specifier)
+        if lock is None:
+            lock = DeviceLock(device_specifier)
+            _device_locks[device_specifier] = lock
+        return lock
+
+
+def rasterize_label(model, label_size, label, cut, raster_cache=None):
+    """Render a label into a self-contained Brother QL instruction stream for ``model``."""
+    if label.label_type == LabelType.ENDLESS_LABEL:
+        # Check if image is pre-rotated (rotated markdown)
+        if hasattr(label, 'pre_rotated') and label.pre_rotated:
+            rotate = 0  # Don't rotate, image is already landscape
+        elif label.label_orientation == LabelOrientation.STANDARD:
+            rotate = 0
+        else:
+            rotate = 90
+    else:
+        rotate = 'auto'
+
+    if label.label_content == LabelContent.IMAGE_BW: 
+        dither = False
+    else:
+        dither = True
+
+    data = None
+    cache_key = None
+    if raster_cache is not None:
+        cache_key = (model, label_size, rotate, dither, cut, label.cache_key())
+        data = raster_cache.get(cache_key)
+
+    if data is None:
+        img = label.generate()
+
+        qlr = BrotherQLRaster(model)
+        create_label(
+            qlr,
+            img,
+            label_size,
+            red='red' in label_size,
+            dither=dither,
+            cut=cut,
+            rotate=rotate)
+        data = qlr.data
+        if cache_key is not None:
+            raster_cache.put(cache_key, data)
+    return data
+
+
+class PrinterQueue:
 
     def __init__(
             self,
             model,
             device_specifier,
-            label_size):
+            label_size,
+            printer_id=None,
+            connection_idle_timeout=DEFAULT_IDLE_TIMEOUT,
+            streaming=True,
+            raster_cache=None):
         self.model = model
         self.device_specifier = device_specifier
         self.label_size = label_size
+        self.printer_id = printer_id
+        self.connection_idle_timeout = connection_idle_timeout
+        self.streaming = streaming
+        self.raster_cache = raster_cache
+        self._printQueue = []
+        self._lock = threading.Lock()
 
     @property
     def model(self):
@@ -48,61 +175,116 @@ class PrinterQueue:
         self._label_size = value
 
     def add_label_to_queue(self, label, count, cut_once=False):
-        for cnt in range(0, count):
-            cut = (cut_once == False) or (cut_once and cnt == count-1)
+        with self._lock:
+            for cnt in range(0, count):
+                cut = (cut_once == False) or (cut_once and cnt == count-1)
 
-            self._printQueue.append(
-                {'label': label,
-                 'cut': cut
-                 })
+                self._printQueue.append(
+                    {'label': label,
+                     'cut': cut
+                     })
 
     def add_label_sequence(self, labels, copies, cut_once=False):
         if not labels:
             return
         total_labels = len(labels)
-        for copy in range(copies):
-            for idx, lbl in enumerate(labels):
-                is_last = (copy == copies - 1) and (idx == total_labels - 1)
-                cut = (not cut_once) or (cut_once and is_last)
-                self._printQueue.append({'label': lbl, 'cut': cut})
-
-    def process_queue(self):
-        qlr = BrotherQLRaster(self._model)
-
-        for queue_entry in self._printQueue:
-            if queue_entry['label'].label_type == LabelType.ENDLESS_LABEL:
-                # Check if image is pre-rotated (rotated markdown)
-                if hasattr(queue_entry['label'], 'pre_rotated') and queue_entry['label'].pre_rotated:
-                    rotate = 0  # Don't rotate, image is already landscape
-                elif queue_entry['label'].label_orientation == LabelOrientation.STANDARD:
-                    rotate = 0
-                else:
-                    rotate = 90
-            else:
-                rotate = 'auto'
-
-            img = queue_entry['label'].generate()
-
-            if queue_entry['label'].label_content == LabelContent.IMAGE_BW: 
-                dither = False
-            else:
-                dither = True
-
-            create_label(
-                qlr,
-                img,
-                self.label_size,
-                red='red' in self.label_size,
-                dither=dither,
-                cut=queue_entry['cut'],
-                rotate=rotate)
-
-        self._printQueue.clear()
-
-        be = self._backend_class(self._device_specifier)
-        be.write(qlr.data)
-        be.dispose()
-        del be
+        with self._lock:
+            for copy in range(copies):
+                for idx, lbl in enumerate(labels):
+                    is_last = (copy == copies - 1) and (idx == total_labels - 1)
+                    cut = (not cut_once) or (cut_once and is_last)
+                    self._printQueue.append({'label': lbl, 'cut': cut})
+
+    def add_queue_entries(self, entries):
+        """Append (label, cut) pairs as they are, e.g. the sequence of a forwarded job."""
+        with self._lock:
+            self._printQueue.extend({'label': label, 'cut': cut} for label, cut in entries)
+
+    def process_queue(self, progress_callback=None):
+        # Take ownership of the queued labels so labels added meanwhile end up in the next job
+        with self._lock:
+            print_queue = self._printQueue
+            self._printQueue = []
+
+        # Copies of the same label are rasterized once per job
+        repeats = Counter((id(entry['label']), entry['cut']) for entry in print_queue if 'label' in entry)
+        job_memo = {key: None for key, count in repeats.items() if count > 1}
+
+        if self.streaming and len(print_queue) > 1:
+            self._stream_queue(print_queue, job_memo, progress_callback)
+            return
+
+        data = b''.join(self._rasterize(queue_entry, job_memo) for queue_entry in print_queue)
+
+        if progress_callback:
+            progress_callback(JOB_SENDING)
+
+        with get_device_lock(self._device_specifier):
+            backend_pool.write(self._device_specifier, self._backend_class, data,
+                               idle_timeout=self.connection_idle_timeout)
+
+    def add_raster(self, data):
+        """Queue an instruction stream rasterized elsewhere for this printer's model."""
+        with self._lock:
+            self._printQueue.append({'raster': data})
+
+    def _rasterize(self, queue_entry, job_memo=None):
+        """Convert one queue entry into a self-contained Brother QL instruction stream."""
+        if 'raster' in queue_entry:
+            return queue_entry['raster']
+
+        label = queue_entry['label']
+        memo_key = (id(label), queue_entry['cut'])
+        if job_memo and job_memo.get(memo_key) is not None:
+            return job_memo[memo_key]
+
+        data = rasterize_label(self._model, self.label_size, label, queue_entry['cut'], self.raster_cache)
+
+        if job_memo is not None and memo_key in job_memo:
+            job_memo[memo_key] = data
+        return data
+
+    def _stream_queue(self, print_queue, job_memo=None, progress_callback=None):
+        """Rasterize labels one by one while a writer thread sends the finished ones.
+
+        The printer starts with the first label right away and at most
+        STREAM_BUFFER_LABELS rasterized labels are held in memory.
+        """
+        chunks = queue.Queue(maxsize=STREAM_BUFFER_LABELS)
+        writer_errors = []
+
+        def writer():
+            try:
+                with get_device_lock(self._device_specifier), \
+                        backend_pool.connection(self._device_specifier, self._backend_class,
+                                                idle_timeout=self.connection_idle_timeout) as be:
+                    while True:
+                        chunk = chunks.get()
+                        if chunk is None:
+                            break
+                        be.write(chunk)
+            except Exception as e:
+                writer_errors.append(e)
+                # Unblock the producer, it stops as soon as it sees the error
+                while chunks.get() is not None:
+                    pass
+
+        writer_thread = threading.Thread(target=writer, name=f'printer-stream-{self.printer_id}', daemon=True)
+        writer_thread.start()
+        try:
+            for idx, queue_entry in enumerate(print_queue):
+                if writer_errors:
+                    break
+                chunks.put(self._rasterize(queue_entry, job_memo))
+                if idx == 0 and progress_callback:
+                    progress_callback(JOB_SENDING)
+                logger.debug(f"Streamed label {idx + 1}/{len(print_queue)} to {self._device_specifier}")
+        finally:
+            chunks.put(None)
+            writer_thread.join()
+
+        if writer_errors:
+            raise writer_errors[0]
 
     def get_printer_status(self):
         """
@@ -122,22 +304,21 @@ class PrinterQueue:
         try:
             from brother_ql.reader import interpret_response
 
-            # Create backend connection
-            be = self._backend_class(self._device_specifier)
-
-            # Send status request: ESC i S (0x1B 0x69 0x53)
-            status_request = bytes([0x1B, 0x69, 0x53])
-            be.write(status_request)
-
-            # Read 32-byte status response with timeout
-            # Note: not all backends support read() method
-            if not hasattr(be, 'read'):
-                logger.info(f"Backend {self._backend_class} does not support status reading")
-                be.dispose()
-                return None
-
-            status_bytes = be.read(32)
-            be.dispose()
+            # Don't interleave the status request with a running print job
+            with get_device_lock(self._device_specifier), \
+                    backend_pool.connection(self._device_specifier, self._backend_class,
+                                            idle_timeout=self.connection_idle_timeout) as be:
+                # Send status request: ESC i S (0x1B 0x69 0x53)
+                status_request = bytes([0x1B, 0x69, 0x53])
+                be.write(status_request)
+
+                # Read 32-byte status response with timeout
+                # Note: not all backends support read() method
+                if not hasattr(be, 'read'):
+                    logger.info(f"Backend {self._backend_class} does not support status reading")
+                    return None
+
+                status_bytes = be.read(32)
 
             if not status_bytes or len(status_bytes) < 32:
                 logger.warning(f"Incomplete status response: {len(status_bytes) if status_bytes else 0} bytes")
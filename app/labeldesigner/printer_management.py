@@ -1,11 +1,142 @@
 """Printer configuration management."""
 
+import copy
 import os
 import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
 from flask import current_app
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from .printer import PrinterQueue
+from .backend_pool import connection_idle_timeout
 from .remote_printer import RemotePrinterQueue
+from .remote_client import get_remote_client
+from .raster_cache import get_raster_cache
+
+
+class _RegistryState(NamedTuple):
+    signature: tuple
+    printers: list
+    by_id: dict
+    default: dict
+
+
+class PrinterRegistry:
+    """In-memory copy of printers.json, indexed by printer id.
+
+    The file is reloaded when its inode, mtime or size changes, so edits by
+    other processes are picked up at the cost of one stat per lookup. Writes
+    go to a temporary file that replaces printers.json, readers never see a
+    partial file. A reload swaps the whole state at once, readers never see
+    the printers of one version with the index of another.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._state = _RegistryState(None, [], {}, None)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        # Every write replaces the file, a new inode even when the timestamp
+        # is too coarse and the size the same
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _refresh(self, force=False):
+        signature = self._stat()
+        if not force and signature == self._state.signature:
+            return self._state
+        with self._lock:
+            printers = []
+            if signature is not None:
+                try:
+                    with open(self.path, 'r') as f:
+                        printers = json.load(f)
+                except Exception:
+                    printers = []
+            return self._set(printers, signature)
+
+    def _set(self, printers, signature):
+        self._state = _RegistryState(
+            signature=signature,
+            printers=printers,
+            by_id={p.get('id'): p for p in printers},
+            default=next((p for p in printers if p.get('default', False)), printers[0] if printers else None))
+        return self._state
+
+    def printers(self):
+        """Copy of all configured printers, safe to modify."""
+        return copy.deepcopy(self._refresh().printers)
+
+    def get(self, printer_id):
+        """Printer with the given id or None, must not be modified."""
+        return self._refresh().by_id.get(printer_id)
+
+    def default(self):
+        """Default printer (or the first one) or None, must not be modified."""
+        return self._refresh().default
+
+    def save(self, printers):
+        """Replace the configured printers."""
+        with self._lock, self._file_lock():
+            self._write(printers)
+
+    @contextmanager
+    def edit(self):
+        """Yield a fresh copy of the printers, saved on exit if it was changed.
+
+        Holds a lock (across processes where fcntl is available) so concurrent
+        edits from the management UI cannot overwrite each other.
+        """
+        with self._lock, self._file_lock():
+            current = self._refresh(force=True).printers
+            printers = copy.deepcopy(current)
+            yield printers
+            if printers != current:
+                self._write(printers)
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, printers):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix='.printers-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(printers, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._set(copy.deepcopy(printers), self._stat())
+
+
+_registry = None
+_registry_lock = threading.Lock()
 
 
 def get_printers_json_path():
@@ -18,23 +149,35 @@ def get_printers_json_path():
     return os.path.join(instance_path, 'printers.json')
 
 
+def get_printer_registry():
+    """Get the process wide registry of the printers.json file."""
+    global _registry
+    path = get_printers_json_path()
+    with _registry_lock:
+        if _registry is None or _registry.path != path:
+            _registry = PrinterRegistry(path)
+        return _registry
+
+
 def load_printers_from_json():
     """Load printers from JSON file."""
-    json_path = get_printers_json_path()
-    if os.path.exists(json_path):
-        try:
-            with open(json_path, 'r') as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
+    return get_printer_registry().printers()
 
 
 def save_printers_to_json(printers):
     """Save printers to JSON file."""
-    json_path = get_printers_json_path()
-    with open(json_path, 'w') as f:
-        json.dump(printers, f, indent=2)
+    get_printer_registry().save(printers)
+
+
+def _fallback_printer():
+    return {
+        'id': 'default',
+        'name': 'Default Printer',
+        'type': 'local',
+        'model': current_app.config['PRINTER_MODEL'],
+        'device': current_app.config['PRINTER_PRINTER'],
+        'default': True
+    }
 
 
 def get_available_printers():
@@ -47,38 +190,45 @@ def get_available_printers():
     if printers:
         return printers
 
-    return [{
-        'id': 'default',
-        'name': 'Default Printer',
-        'type': 'local',
-        'model': current_app.config['PRINTER_MODEL'],
-        'device': current_app.config['PRINTER_PRINTER'],
-        'default': True
-    }]
+    return [_fallback_printer()]
 
 
 def get_default_printer():
     """Get the default printer configuration."""
-    printers = get_available_printers()
-    for printer in printers:
-        if printer.get('default', False):
-            return printer
-    return printers[0] if printers else None
+    if current_app.config.get('PRINTERS') is not None:
+        printers = current_app.config['PRINTERS']
+        for printer in printers:
+            if printer.get('default', False):
+                return printer
+        return printers[0] if printers else None
 
+    return get_printer_registry().default() or _fallback_printer()
 
-def create_printer_queue(label_size, printer_id=None):
-    """Create printer queue for specified or default printer."""
-    printers = get_available_printers()
 
-    printer_config = None
+def get_printer(printer_id):
+    """Get configuration of the specified printer, None if there is no such printer."""
+    if current_app.config.get('PRINTERS') is not None:
+        return next((p for p in current_app.config['PRINTERS'] if p.get('id') == printer_id), None)
+
+    registry = get_printer_registry()
+    if registry.default() is None:
+        fallback = _fallback_printer()
+        return fallback if printer_id == fallback['id'] else None
+    return registry.get(printer_id)
+
+
+def get_printer_config(printer_id=None):
+    """Get configuration of the specified printer, falling back to the default one."""
     if printer_id:
-        for p in printers:
-            if p.get('id') == printer_id:
-                printer_config = p
-                break
+        printer = get_printer(printer_id)
+        if printer is not None:
+            return printer
+    return get_default_printer()
 
-    if not printer_config:
-        printer_config = get_default_printer()
+
+def create_printer_queue(label_size, printer_id=None):
+    """Create printer queue for specified or default printer."""
+    printer_config = get_printer_config(printer_id)
 
     if not printer_config:
         raise ValueError("No printer configured")
@@ -86,13 +236,21 @@ def create_printer_queue(label_size, printer_id=None):
     if printer_config['type'] == 'remote':
         return RemotePrinterQueue(
             remote_url=printer_config['url'],
-            label_size=label_size
+            label_size=label_size,
+            printer_id=printer_config.get('id', 'default'),
+            client=get_remote_client(printer_config['url']),
+            model=printer_config.get('model'),
+            raster_cache=get_raster_cache()
         )
     else:
         return PrinterQueue(
             model=printer_config['model'],
             device_specifier=printer_config['device'],
-            label_size=label_size
+            label_size=label_size,
+            printer_id=printer_config.get('id', 'default'),
+            connection_idle_timeout=connection_idle_timeout(current_app.config.get('PRINTER_CONNECTION_IDLE_TIMEOUT')),
+            streaming=current_app.config.get('PRINTER_STREAMING', True),
+            raster_cache=get_raster_cache()
         )
 
 
@@ -101,17 +259,14 @@ def update_printer_status_support(printer_id, supports_status):
     if current_app.config.get('PRINTERS') is not None:
         return
 
-    printers = load_printers_from_json()
-    updated = False
+    registry = get_printer_registry()
+    printer = registry.get(printer_id)
+    if printer is None or printer.get('supports_status') == supports_status:
+        return
 
-    for printer in printers:
-        if printer.get('id') == printer_id:
-            if printer.get('supports_status') != supports_status:
+    with registry.edit() as printers:
+        for printer in printers:
+            if printer.get('id') == printer_id:
                 printer['supports_status'] = supports_status
-                updated = True
-            break
-
-    if updated:
-        save_printers_to_json(printers)
-        current_app.logger.info("Updated printer %s status support: %s", printer_id, supports_status)
-        current_app.logger.info("Updated printer %s status support: %s", printer_id, supports_status)
+                break
+    current_app.logger.info("Updated printer %s status support: %s", printer_id, supports_status)
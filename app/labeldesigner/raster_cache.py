@@ -0,0 +1,22 @@
+"""LRU cache of rasterized Brother QL instruction streams."""
+
+import threading
+
+from flask import current_app
+
+from app.lru_cache import BytesLRUCache
+
+DEFAULT_SIZE_MB = 32
+
+_raster_cache = None
+_raster_cache_lock = threading.Lock()
+
+
+def get_raster_cache():
+    """Get the process wide raster cache, sized by RASTER_CACHE_SIZE_MB."""
+    global _raster_cache
+    with _raster_cache_lock:
+        if _raster_cache is None:
+            size_mb = current_app.config.get('RASTER_CACHE_SIZE_MB', DEFAULT_SIZE_MB)
+            _raster_cache = BytesLRUCache(max_bytes=int(size_mb * 1024 * 1024))
+        return _raster_cache
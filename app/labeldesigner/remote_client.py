@@ -0,0 +1,152 @@
+"""Pooled HTTP clients for remote brother_ql_web instances."""
+
+import gzip
+import logging
+import threading
+import zlib
+from typing import NamedTuple
+
+from flask import current_app
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Only idempotent requests are retried after the request was sent, a print
+# POST is retried only when the connection could not be established
+RETRY_METHODS = frozenset(['GET', 'HEAD'])
+RETRY_STATUS = (502, 503, 504)
+
+# Content-Encodings accepted for forwarded raster data, 'identity' is uncompressed
+RASTER_ENCODINGS = ('identity', 'gzip', 'zstd')
+
+
+class RemoteSettings(NamedTuple):
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    status_timeout: float = 5.0
+    retries: int = 3
+    backoff: float = 0.5
+    max_connections: int = 4
+    raster_encoding: str = 'gzip'
+
+
+class RemoteClient:
+    """Keep-alive session to one remote instance with retries and timeouts.
+
+    At most ``max_connections`` requests to the remote are in flight at the
+    same time, further requests wait for a free connection.
+    """
+
+    def __init__(self, base_url, settings=RemoteSettings()):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url.rstrip('/')
+        self.settings = settings
+        # Optional endpoints of the remote, learned from its answers
+        self.features = {}
+        if settings.raster_encoding == 'zstd' and zstandard is None:
+            logger.warning("zstandard is not installed, compressing raster data with gzip")
+            self.features['raster_encoding'] = 'gzip'
+        retry = Retry(total=settings.retries, backoff_factor=settings.backoff,
+                      status_forcelist=RETRY_STATUS, allowed_methods=RETRY_METHODS,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.max_connections,
+                              pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, path, **kwargs):
+        kwargs.setdefault('timeout', (self.settings.connect_timeout, self.settings.read_timeout))
+        return self.session.post(self.base_url + path, **kwargs)
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault('timeout', (self.settings.connect_timeout, self.settings.status_timeout))
+        return self.session.get(self.base_url + path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def remote_settings():
+    """Settings configured by REMOTE_PRINTER_*."""
+    cfg = current_app.config
+    defaults = RemoteSettings()
+    return RemoteSettings(
+        connect_timeout=cfg.get('REMOTE_PRINTER_CONNECT_TIMEOUT', defaults.connect_timeout),
+        read_timeout=cfg.get('REMOTE_PRINTER_READ_TIMEOUT', defaults.read_timeout),
+        status_timeout=cfg.get('REMOTE_PRINTER_STATUS_TIMEOUT', defaults.status_timeout),
+        retries=cfg.get('REMOTE_PRINTER_RETRIES', defaults.retries),
+        backoff=cfg.get('REMOTE_PRINTER_RETRY_BACKOFF', defaults.backoff),
+        max_connections=cfg.get('REMOTE_PRINTER_MAX_CONNECTIONS', defaults.max_connections),
+        raster_encoding=cfg.get('REMOTE_PRINTER_RASTER_ENCODING', defaults.raster_encoding))
+
+
+def get_remote_client(remote_url):
+    """Get the process wide client of a remote instance, one per base URL."""
+    base_url = remote_url.rstrip('/')
+    settings = remote_settings()
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None or client.settings != settings:
+            if client is not None:
+                client.close()
+            logger.info(f"Opening session to remote instance {base_url}")
+            client = _clients[base_url] = RemoteClient(base_url, settings)
+        return client
+
+
+def close_remote_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def supported_raster_encodings():
+    """Content-Encodings this instance can decode."""
+    return tuple(e for e in RASTER_ENCODINGS if e != 'zstd' or zstandard is not None)
+
+
+def encode_raster(data, encoding):
+    """Compress raster data for forwarding, returns (body, encoding actually used)."""
+    if encoding == 'zstd':
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=3).compress(data), 'zstd'
+        encoding = 'gzip'
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=6), 'gzip'
+    return data, 'identity'
+
+
+def decode_raster(body, encoding, max_bytes):
+    """Decompress forwarded raster data, raises ValueError for unsupported or oversized data."""
+    encoding = (encoding or 'identity').lower()
+    if encoding == 'identity':
+        data = body
+    elif encoding == 'gzip':
+        try:
+            data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body, max_bytes + 1)
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip data: {e}") from e
+    elif encoding == 'zstd' and zstandard is not None:
+        try:
+            data = zstandard.ZstdDecompressor().decompress(body, max_output_size=max_bytes + 1)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd data: {e}") from e
+    else:
+        raise ValueError(f"Unsupported raster encoding: {encoding}")
+    if len(data) > max_bytes:
+        raise ValueError(f"Raster data exceeds {max_bytes} bytes")
+    return data
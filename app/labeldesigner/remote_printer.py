@@ -1,62 +1,243 @@
-import requests
 import io
+import json
 import base64
 import logging
+import threading
+import time
 from PIL import Image
 
+from .print_spooler import JOB_RASTERIZING, JOB_SENDING
+from .printer import rasterize_label
+from .remote_client import RemoteClient, get_remote_client, encode_raster
+
 logger = logging.getLogger(__name__)
 
+# A remote that did not report its printer model is asked again after this many seconds
+MODEL_RETRY_SECONDS = 300
+
 class RemotePrinterQueue:
     """Forwards print jobs to a remote brother_ql_web instance"""
 
-    def __init__(self, remote_url, label_size):
+    def __init__(self, remote_url, label_size, printer_id=None, client=None, model=None, raster_cache=None):
         self.remote_url = remote_url.rstrip('/')
         self.label_size = label_size
+        self.printer_id = printer_id
+        # Printer model of the remote, learned from its status when not configured
+        self.model = model
+        self.raster_cache = raster_cache
+        # Shared keep-alive session, see remote_client.get_remote_client
+        self._client = client or RemoteClient(self.remote_url)
         self._printQueue = []
+        self._lock = threading.Lock()
 
     def add_label_to_queue(self, label, count, cut_once=False):
-        for cnt in range(0, count):
-            cut = (not cut_once) or (cut_once and cnt == count-1)
-            self._printQueue.append({'label': label, 'cut': cut})
+        with self._lock:
+            for cnt in range(0, count):
+                cut = (not cut_once) or (cut_once and cnt == count-1)
+                self._printQueue.append({'label': label, 'cut': cut})
 
     def add_label_sequence(self, labels, copies, cut_once=False):
         if not labels:
             return
         total_labels = len(labels)
-        for copy in range(copies):
-            for idx, lbl in enumerate(labels):
-                is_last = (copy == copies - 1) and (idx == total_labels - 1)
-                cut = (not cut_once) or (cut_once and is_last)
-                self._printQueue.append({'label': lbl, 'cut': cut})
-
-    def process_queue(self):
-        """Send each label to remote printer via /api/print endpoint"""
-        for idx, queue_entry in enumerate(self._printQueue, 1):
-            img = queue_entry['label'].generate()
-
-            # For landscape images, rotate to portrait to fit printhead width
-            # The landscape rendering (text left-to-right) is correct, we just need
-            # to rotate the PNG so it fits the printer's printhead width
-            if img.width > img.height:
-                # Rotate 90° clockwise: landscape 945×590 → portrait 590×945
-                img = img.transpose(Image.ROTATE_270)
-                logger.info(f"Rotated landscape image to portrait for printhead: {img.width}x{img.height}")
+        with self._lock:
+            for copy in range(copies):
+                for idx, lbl in enumerate(labels):
+                    is_last = (copy == copies - 1) and (idx == total_labels - 1)
+                    cut = (not cut_once) or (cut_once and is_last)
+                    self._printQueue.append({'label': lbl, 'cut': cut})
+
+    def add_queue_entries(self, entries):
+        with self._lock:
+            self._printQueue.extend({'label': label, 'cut': cut} for label, cut in entries)
+
+    def process_queue(self, progress_callback=None):
+        """Send the queued labels to the remote printer.
+
+        When the model of the remote printer is known the job is rasterized
+        here and the instruction stream is sent to /api/print/raster.
+        Otherwise the whole job goes out in one request to /api/print/pages,
+        every distinct label is sent once and copies only appear in the
+        sequence. Remotes without that endpoint get one /api/print request
+        per label.
+        """
+        import requests
+        with self._lock:
+            print_queue = self._printQueue
+            self._printQueue = []
+        if not print_queue:
+            return
+
+        if progress_callback:
+            progress_callback(JOB_RASTERIZING)
+
+        try:
+            model = self._remote_model()
+            if model and self._client.features.get('print_raster', True):
+                data = self._rasterize_queue(print_queue, model)
+                if progress_callback:
+                    progress_callback(JOB_SENDING)
+                if self._send_raster(data, model, len(print_queue)):
+                    return
+
+            pages = []
+            page_index = {}
+            sequence = []
+            for queue_entry in print_queue:
+                label = queue_entry['label']
+                if id(label) not in page_index:
+                    page_index[id(label)] = len(pages)
+                    pages.append(self._page_image(label))
+                sequence.append((page_index[id(label)], queue_entry['cut']))
+
+            if progress_callback:
+                progress_callback(JOB_SENDING)
+
+            if self._client.features.get('print_pages', True):
+                if self._send_job(pages, sequence):
+                    return
+                logger.info(f"Remote {self.remote_url} has no job endpoint, sending labels one by one")
+                self._client.features['print_pages'] = False
+            self._send_labels(pages, sequence)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Remote printer error: {str(e)}")
+            raise Exception(f"Remote printer error: {str(e)}")
+
+    def _remote_model(self):
+        if self.model:
+            return self.model
+        features = self._client.features
+        # Only a known model is kept, a failed status query (remote briefly
+        # down, printer offline) is retried after MODEL_RETRY_SECONDS
+        if not features.get('model') and time.monotonic() >= features.get('model_retry_at', 0):
+            model = (get_remote_printer_status(self.remote_url, self._client) or {}).get('model')
+            if model:
+                features['model'] = model
+                logger.info(f"Remote {self.remote_url} prints on a {model}, forwarding raster data")
+            else:
+                features['model_retry_at'] = time.monotonic() + MODEL_RETRY_SECONDS
+        return features.get('model')
+
+    def _rasterize_queue(self, print_queue, model):
+        """Rasterize the job like a local printer of the remote's model would."""
+        memo = {}
+        chunks = []
+        for queue_entry in print_queue:
+            key = (id(queue_entry['label']), queue_entry['cut'])
+            if key not in memo:
+                memo[key] = rasterize_label(model, self.label_size, queue_entry['label'],
+                                            queue_entry['cut'], self.raster_cache)
+            chunks.append(memo[key])
+        return b''.join(chunks)
+
+    def _send_raster(self, data, model, label_count):
+        """Send a rasterized job, returns False if the remote cannot print it as is."""
+        settings = self._client.settings
+        timeout = (settings.connect_timeout, settings.read_timeout * label_count)
+        encoding = self._client.features.get('raster_encoding', settings.raster_encoding)
+        params = {'model': model, 'label_size': self.label_size, 'wait': '1'}
+
+        while True:
+            body, used = encode_raster(data, encoding)
+            logger.info(f"Sending {len(data)} bytes of raster data ({len(body)} bytes {used}) "
+                        f"for {label_count} labels to remote printer: {self.remote_url}/labeldesigner/api/print/raster")
+            response = self._client.post('/labeldesigner/api/print/raster', data=body, params=params,
+                                         headers={'Content-Type': 'application/octet-stream',
+                                                  'Content-Encoding': used},
+                                         timeout=timeout)
+            if response.status_code == 415 and used != 'gzip':
+                # The remote cannot decode this encoding, gzip is always supported
+                encoding = self._client.features['raster_encoding'] = 'gzip'
+                continue
+            break
+
+        if response.status_code in (404, 405):
+            logger.info(f"Remote {self.remote_url} has no raster endpoint, sending images")
+            self._client.features['print_raster'] = False
+            return False
+        if response.status_code == 409:
+            # Printer of the remote changed or is not local, relearn its model later
+            logger.warning(f"Remote {self.remote_url} rejected raster data for {model}: {response.text}")
+            self._client.features.pop('model', None)
+            self._client.features['model_retry_at'] = time.monotonic() + MODEL_RETRY_SECONDS
+            return False
+        self._check_response(response)
+        return True
+
+    @staticmethod
+    def _page_image(label):
+        img = label.generate()
+
+        # For landscape images, rotate to portrait to fit printhead width
+        # The landscape rendering (text left-to-right) is correct, we just need
+        # to rotate the PNG so it fits the printer's printhead width
+        if img.width > img.height:
+            # Rotate 90° clockwise: landscape 945×590 → portrait 590×945
+            img = img.transpose(Image.ROTATE_270)
+            logger.info(f"Rotated landscape image to portrait for printhead: {img.width}x{img.height}")
+
+        if img.mode not in ('L', 'RGB'):
+            img = img.convert('L')
+        return img
+
+    @staticmethod
+    def _png_bytes(img):
+        buffered = io.BytesIO()
+        img.save(buffered, format="PNG")
+        return buffered.getvalue()
+
+    @staticmethod
+    def _check_response(response):
+        response.raise_for_status()
+        logger.info(f"Remote printer response: {response.text}")
+
+        # Check if the response indicates success
+        try:
+            result = response.json()
+        except ValueError:
+            # Not JSON response, assume success if status is 200
+            return
+        if not result.get('success', False):
+            error_msg = result.get('message') or result.get('error') or 'Unknown error'
+            raise Exception(f"Remote printer failed: {error_msg}")
+
+    def _send_job(self, pages, sequence):
+        """Send all pages in one request, returns False if the remote lacks the endpoint."""
+        files = [('page', (f'page{idx}.png', self._png_bytes(img), 'image/png'))
+                 for idx, img in enumerate(pages)]
+        data = {
+            'label_size': self.label_size,
+            'sequence': json.dumps([[page, bool(cut)] for page, cut in sequence]),
+            # Only report success once the remote has actually printed the job
+            'wait': '1'
+        }
+        # The remote answers when the whole job is printed
+        settings = self._client.settings
+        timeout = (settings.connect_timeout, settings.read_timeout * len(sequence))
+
+        logger.info(f"Sending job of {len(sequence)} labels ({len(pages)} distinct) to remote printer: "
+                    f"{self.remote_url}/labeldesigner/api/print/pages")
+        response = self._client.post('/labeldesigner/api/print/pages', files=files, data=data, timeout=timeout)
+        if response.status_code in (404, 405):
+            return False
+        self._check_response(response)
+        return True
+
+    def _send_labels(self, pages, sequence):
+        """Legacy protocol: one /api/print request with a full form per label."""
+        for idx, (page, cut) in enumerate(sequence, 1):
+            img = pages[page]
 
             # Add a very light grey pixel in the last row to prevent cropping
             # This ensures the full image height is preserved on the remote server
             if img.height > 0 and img.width > 0:
+                img = img.copy()
                 pixels = img.load()
                 # Set last pixel to very light grey (249, almost white but prevents getbbox from cropping)
-                pixels[img.width - 1, img.height - 1] = (249, 249, 249)
+                pixels[img.width - 1, img.height - 1] = 249 if img.mode == 'L' else (249, 249, 249)
 
-            # Convert PIL Image to PNG bytes
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            buffered.seek(0)
-
-            # Prepare multipart form data
             files = {
-                'image': ('label.png', buffered, 'image/png')
+                'image': ('label.png', self._png_bytes(img), 'image/png')
             }
 
             # Use same approach as ql-print-md.py: always standard orientation
@@ -70,60 +251,42 @@ class RemotePrinterQueue:
                 'print_type': 'image',
                 'image_mode': 'grayscale',
                 'print_count': '1',
-                'cut_once': '1' if queue_entry['cut'] else '0',
+                'cut_once': '1' if cut else '0',
                 # Font parameters - required by older remote servers even for images
                 'font_family': 'DejaVu Serif',
                 'font_style': 'Book',
                 # Prevent remote server from cropping whitespace (for paged prints)
-                'no_crop': '1'
+                'no_crop': '1',
+                # Only report success once the remote has actually printed the label
+                'wait': '1'
             }
 
-            logger.info(f"Sending to remote: {img.width}x{img.height} image, orientation=standard")
-
-            try:
-                url = f"{self.remote_url}/labeldesigner/api/print"
-                logger.info(f"Sending label {idx}/{len(self._printQueue)} to remote printer: {url}")
-                logger.debug(f"Request data: {data}")
-                logger.debug(f"Image size: {img.size}, mode: {img.mode}")
-
-                response = requests.post(url, files=files, data=data, timeout=30)
-                response.raise_for_status()
-
-                logger.info(f"Remote printer response: {response.text}")
-                logger.debug(f"Response status: {response.status_code}")
-
-                # Check if the response indicates success
-                try:
-                    result = response.json()
-                    if not result.get('success', False):
-                        error_msg = result.get('message', 'Unknown error')
-                        raise Exception(f"Remote printer failed: {error_msg}")
-                except ValueError:
-                    # Not JSON response, assume success if status is 200
-                    pass
-
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Remote printer error: {str(e)}")
-                raise Exception(f"Remote printer error: {str(e)}")
+            logger.info(f"Sending label {idx}/{len(sequence)} to remote printer: "
+                        f"{self.remote_url}/labeldesigner/api/print")
+            logger.debug(f"Request data: {data}")
+            logger.debug(f"Image size: {img.size}, mode: {img.mode}")
 
-        self._printQueue.clear()
+            response = self._client.post('/labeldesigner/api/print', files=files, data=data)
+            self._check_response(response)
 
 
-def get_remote_printer_status(remote_url):
+def get_remote_printer_status(remote_url, client=None):
     """
     Query a remote brother_ql_web instance for printer status.
 
     Args:
         remote_url: Base URL of the remote brother_ql_web instance
+        client: RemoteClient to use, the shared client of remote_url by default
 
     Returns:
         dict: Status information or None if not supported/unreachable
     """
+    import requests
     try:
         url = f"{remote_url.rstrip('/')}/labeldesigner/api/printer/status"
         logger.info(f"Querying remote printer status: {url}")
 
-        response = requests.get(url, timeout=5)
+        response = (client or get_remote_client(remote_url)).get('/labeldesigner/api/printer/status')
 
         # If endpoint doesn't exist (404), return None
         if response.status_code == 404:
@@ -0,0 +1,171 @@
+"""Process pool for the expensive steps of multi-page labels.
+
+Rasterizing PDF pages with poppler (uploaded PDFs and markdown) is worth
+the round trip to a worker process. Generating the label images is not:
+it is cheap compared with pickling full resolution images both ways, so
+it stays in the requesting process.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_workers = 0
+_configured_workers = None
+
+# How often a cancellable render_map checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.05
+
+
+class RenderCancelled(Exception):
+    """A render was abandoned because its result is not wanted anymore."""
+
+
+def _noop():
+    return None
+
+
+def _generate_label_image(label):
+    return label.generate()
+
+
+def pool_size(server_workers=1):
+    """Workers of the render pool, RENDER_POOL_WORKERS or the CPU cores shared by all server workers."""
+    if _configured_workers is not None:
+        return _configured_workers
+    return (os.cpu_count() or 1) // max(1, server_workers)
+
+
+def start_render_pool(app):
+    """Start the render pool configured by RENDER_POOL_WORKERS.
+
+    Must run during app creation, before the spooler and request threads exist:
+    the workers are forked from the current process so they inherit loaded
+    fonts and modules, and forking is only safe while the process is single threaded.
+    """
+    global _workers, _configured_workers
+    _configured_workers = app.config.get('RENDER_POOL_WORKERS')
+    workers = pool_size()
+    if workers <= 1:
+        app.logger.info('Render pool disabled, rendering pages in-process')
+        return None
+
+    _workers = workers
+    executor = _start_executor()
+    app.logger.info('Render pool started with %d workers', workers)
+    return executor
+
+
+def _start_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None and _workers > 1:
+            _executor = ProcessPoolExecutor(max_workers=_workers,
+                                            mp_context=multiprocessing.get_context('fork'))
+            # Fork all workers right away while it is still safe to do so
+            _executor.submit(_noop).result()
+    return _executor
+
+
+def stop_render_pool():
+    """Shut the render pool down, restart_render_pool() starts it again.
+
+    A preloading server calls this before forking its workers: a pool
+    belongs to the process that started it and is unusable in forked children.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def restart_render_pool(server_workers=1):
+    """Start the configured render pool in a freshly forked server worker.
+
+    Without RENDER_POOL_WORKERS the CPU cores are split between the
+    ``server_workers`` processes, each getting a smaller pool (or none).
+    """
+    global _workers
+    _workers = pool_size(server_workers)
+    executor = _start_executor()
+    if executor is not None:
+        logger.info(f"Render pool started with {_workers} workers in process {os.getpid()}")
+    return executor
+
+
+def render_map(fn, items, cancelled=None):
+    """Apply a picklable top-level function to items, in parallel when a pool is running.
+
+    Results are returned in input order. Falls back to rendering in-process
+    for single items or when the pool is disabled or broken. ``cancelled``
+    is polled between items, once it returns True pending items are dropped
+    and RenderCancelled is raised.
+    """
+    items = list(items)
+    if _executor is None or len(items) < 2:
+        return _map_in_process(fn, items, cancelled)
+    if cancelled is None:
+        try:
+            return list(_executor.map(fn, items))
+        except BrokenExecutor as e:
+            logger.warning(f"Render pool failed ({e}), rendering in-process")
+            return [fn(item) for item in items]
+
+    futures = []
+    try:
+        futures = [_executor.submit(fn, item) for item in items]
+        results = []
+        for future in futures:
+            while True:
+                if cancelled():
+                    raise RenderCancelled()
+                try:
+                    results.append(future.result(timeout=CANCEL_POLL_SECONDS))
+                    break
+                except FutureTimeoutError:
+                    pass
+        return results
+    except BrokenExecutor as e:
+        logger.warning(f"Render pool failed ({e}), rendering in-process")
+        return _map_in_process(fn, items, cancelled)
+    finally:
+        # Drops items no worker has started yet when cancelled or failed
+        for future in futures:
+            future.cancel()
+
+
+def render_map_chunked(fn, items, cancelled=None):
+    """Like render_map, for a function turning a list of items into a list of results.
+
+    Items are split into one contiguous chunk per pool worker, so a per-call
+    setup like starting poppler is paid once per worker instead of per item.
+    """
+    items = list(items)
+    chunk_count = min(len(items), _workers) if _executor is not None else 1
+    if chunk_count < 2:
+        return fn(items) if items else []
+    size = -(-len(items) // chunk_count)
+    chunks = [items[start:start + size] for start in range(0, len(items), size)]
+    return [result for chunk in render_map(fn, chunks, cancelled) for result in chunk]
+
+
+def _map_in_process(fn, items, cancelled=None):
+    results = []
+    for item in items:
+        if cancelled is not None and cancelled():
+            raise RenderCancelled()
+        results.append(fn(item))
+    return results
+
+
+def generate_label_images(labels, cancelled=None):
+    """Generate the images of many labels in-process, ``cancelled`` is polled between labels."""
+    return _map_in_process(_generate_label_image, labels, cancelled)
@@ -1,29 +1,57 @@
 """Flask routes for label designer - route handlers only."""
 
 import base64
+import json
 import uuid
-from flask import current_app, render_template, request, make_response, jsonify
+from flask import current_app, render_template, request, make_response, jsonify, url_for
+from PIL import Image
 
 from brother_ql.devicedependent import label_type_specs, label_sizes, two_color_support
 from brother_ql.devicedependent import ROUND_DIE_CUT_LABEL
 
 from . import bp
 from app.utils import image_to_png_bytes
+from app.font_cache import font_cache
 from app import FONTS
 
-from .context_builder import build_label_context_from_request, build_label_context_from_json
-from .label_factory import create_label_from_context, create_label_from_request
+from .context_builder import (
+    build_label_context_from_request,
+    build_label_context_from_json,
+    build_label_context_from_values,
+    apply_preview_quality
+)
+from .label_factory import (
+    create_label_from_context,
+    create_label_from_request,
+    create_labels_from_contexts,
+    create_labels_from_images
+)
 from .printer_management import (
     get_available_printers,
+    get_default_printer,
+    get_printer,
+    get_printer_config,
+    get_printer_registry,
     create_printer_queue,
     load_printers_from_json,
-    save_printers_to_json,
     update_printer_status_support
 )
+from .printer import is_raster_stream
+from .print_spooler import spool_print_job, get_print_job
+from .render_pool import generate_label_images, RenderCancelled
+from .preview_channel import get_preview_channel, live_preview_available, open_stream
+from .preview_cache import get_preview_cache, preview_cache_key, PREVIEW_META_KEYS
+from .raster_cache import get_raster_cache
+from .utils.image_processing import to_preview_scale
+from .remote_client import supported_raster_encodings, decode_raster
 
 LINE_SPACINGS = (100, 150, 200, 250, 300)
 DEFAULT_DPI = 300
 
+PREVIEW_PAGE_FORMATS = {'png': 'image/png', 'webp': 'image/webp'}
+# Preview pages are content addressed, browsers may keep them for a day
+PREVIEW_PAGE_MAX_AGE = 24 * 3600
+
 LABEL_SIZES = [(
     name,
     label_type_specs[name]['name'],
@@ -56,6 +84,7 @@ def index():
                            line_spacings=LINE_SPACINGS,
                            default_line_spacing=current_app.config['LABEL_DEFAULT_LINE_SPACING'],
                            default_dpi=DEFAULT_DPI,
+                           live_preview=live_preview_available(current_app.config.get('PREVIEW_LIVE_ENABLED', True)),
                            default_margin_top=current_app.config['LABEL_DEFAULT_MARGIN_TOP'],
                            default_margin_bottom=current_app.config['LABEL_DEFAULT_MARGIN_BOTTOM'],
                            default_margin_left=current_app.config['LABEL_DEFAULT_MARGIN_LEFT'],
@@ -93,66 +122,218 @@ def get_font_styles():
     return jsonify(styles)
 
 
+def render_preview_pages(kind, context, image_file=None, ticket=None):
+    """Render the PNG pages of a preview, served from the preview cache when unchanged.
+
+    Returns ``(pages, meta, render_id)`` where meta holds the context
+    entries the renderer filled in (source dimensions, PDF page info) and
+    render_id addresses the cached pages for get_preview_page. With a
+    live preview ``ticket`` the render raises RenderCancelled between its
+    steps once a newer edit has superseded it.
+    """
+    cache = get_preview_cache()
+    key = preview_cache_key(kind, context, image_file)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0], cached[1], key
+
+    cancelled = ticket.cancelled if ticket is not None else None
+    if ticket is not None:
+        ticket.check()
+    label = create_label_from_context(context, image_file=image_file)
+    labels = getattr(label, '_markdown_labels', None) or getattr(label, '_pdf_page_labels', None)
+    label_list = labels if labels else [label]
+    images = generate_label_images(label_list, cancelled)
+
+    # For rotated markdown previews, the images are already landscape (wide)
+    # No need to rotate them - they're ready to display
+    # (The original orientation is stored but we set it to STANDARD for printing)
+
+    dpi = context.get('render_dpi', DEFAULT_DPI)
+    pages = []
+    for img in images:
+        if ticket is not None:
+            ticket.check()
+        pages.append(image_to_png_bytes(to_preview_scale(img, dpi)))
+    meta = {k: context[k] for k in PREVIEW_META_KEYS if k in context}
+    cache.put(key, pages, meta)
+    return pages, meta, key
+
+
+def preview_page_urls(render_id, pages):
+    """URLs of the pages of a rendered preview, see get_preview_page.
+
+    Falls back to base64 encoded pages when the preview cache did not keep
+    the preview (cache disabled or preview too large for it), or when other
+    server processes could not serve it (several workers without disk tier).
+    """
+    if not get_preview_cache().addressable(render_id):
+        return [base64.b64encode(page).decode('ascii') for page in pages]
+    return [url_for('.get_preview_page', render_id=render_id, page=n, ext='png')
+            for n in range(1, len(pages) + 1)]
+
+
 @bp.route('/api/preview', methods=['POST', 'GET'])
 def get_preview_from_image():
     """Generate preview of label."""
     try:
-        context = build_label_context_from_request(request)
-        label = create_label_from_context(context, image_file=request.files.get('image', None))
-        labels = getattr(label, '_markdown_labels', None) or getattr(label, '_pdf_page_labels', None)
-        label_list = labels if labels else [label]
-        images = [lbl.generate() for lbl in label_list]
-
-        # For rotated markdown previews, the images are already landscape (wide)
-        # No need to rotate them - they're ready to display
-        # (The original orientation is stored but we set it to STANDARD for printing)
+        image_file = request.files.get('image', None)
+        context = apply_preview_quality(build_label_context_from_request(request),
+                                        request.values.get('preview_quality'), image_file)
+        pages, meta, render_id = render_preview_pages('preview', context, image_file=image_file)
 
         return_format = request.values.get('return_format', 'png')
 
-        if return_format == 'base64':
-            import base64
-            pages = [base64.b64encode(image_to_png_bytes(img)).decode('ascii') for img in images]
-
-            # Prepare response with source dimensions and PDF page info if available
-            if len(pages) == 1:
-                response_data = {'image': pages[0]}
-                if 'source_width_mm' in context and 'source_height_mm' in context:
-                    response_data['source_width_mm'] = context['source_width_mm']
-                    response_data['source_height_mm'] = context['source_height_mm']
-                if 'pdf_page_count' in context:
-                    response_data['pdf_page_count'] = context['pdf_page_count']
-                    response_data['pdf_current_page'] = context['pdf_current_page']
-                    current_app.logger.info('[preview] Returning PDF metadata - page %d of %d',
-                                           context['pdf_current_page'], context['pdf_page_count'])
-                return jsonify(response_data)
-            else:
-                response_data = {'pages': pages}
-                if 'source_width_mm' in context and 'source_height_mm' in context:
-                    response_data['source_width_mm'] = context['source_width_mm']
-                    response_data['source_height_mm'] = context['source_height_mm']
-                if 'pdf_page_count' in context:
-                    response_data['pdf_page_count'] = context['pdf_page_count']
-                    response_data['pdf_current_page'] = context['pdf_current_page']
-                return jsonify(response_data)
+        if return_format in ('base64', 'urls'):
+            return jsonify(preview_response_data(pages, meta, render_id, return_format))
         else:
-            response = make_response(image_to_png_bytes(images[0]))
+            response = make_response(pages[0])
             response.headers.set('Content-type', 'image/png')
             return response
     except ValueError as e:
         # Return empty response for image mode without uploaded file
         current_app.logger.info('Preview skipped: %s', str(e))
-        if request.values.get('return_format') == 'base64':
+        if request.values.get('return_format') in ('base64', 'urls'):
             return jsonify({'image': None, 'error': str(e)})
         else:
             return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error('Preview failed: %s', str(e), exc_info=True)
-        if request.values.get('return_format') == 'base64':
+        if request.values.get('return_format') in ('base64', 'urls'):
             return jsonify({'error': str(e)})
         else:
             return jsonify({'error': str(e)}), 500
 
 
+def preview_response_data(pages, meta, render_id, return_format):
+    """JSON preview of the 'base64' or 'urls' return formats."""
+    # Prepare response with source dimensions and PDF page info if available
+    if return_format == 'urls':
+        response_data = {'render_id': render_id, 'pages': preview_page_urls(render_id, pages)}
+    elif len(pages) == 1:
+        response_data = {'image': base64.b64encode(pages[0]).decode('ascii')}
+    else:
+        response_data = {'pages': [base64.b64encode(page).decode('ascii') for page in pages]}
+    response_data['dpi'] = meta.get('render_dpi', DEFAULT_DPI)
+    if 'source_width_mm' in meta and 'source_height_mm' in meta:
+        response_data['source_width_mm'] = meta['source_width_mm']
+        response_data['source_height_mm'] = meta['source_height_mm']
+    if 'pdf_page_count' in meta:
+        response_data['pdf_page_count'] = meta['pdf_page_count']
+        response_data['pdf_current_page'] = meta['pdf_current_page']
+        current_app.logger.info('[preview] Returning PDF metadata - page %d of %d',
+                                meta['pdf_current_page'], meta['pdf_page_count'])
+    return response_data
+
+
+@bp.route('/api/preview/live/<channel_id>', methods=['GET'])
+def preview_live_stream(channel_id):
+    """Event stream pushing the latest preview of a live preview channel.
+
+    Every preview is an ``event: preview`` whose data is the JSON of
+    /api/preview with ``return_format=urls`` plus the ``seq`` of its edit.
+    Answers 503 when PREVIEW_LIVE_MAX_STREAMS streams are already open in
+    this process, every stream holds a server thread. Answers 404 when live
+    preview is disabled or the server runs several processes.
+    """
+    cfg = current_app.config
+    if not live_preview_available(cfg.get('PREVIEW_LIVE_ENABLED', True)):
+        return jsonify({'error': 'Live preview disabled'}), 404
+    channel = open_stream(channel_id, cfg.get('PREVIEW_LIVE_MAX_STREAMS', 2))
+    if channel is None:
+        return jsonify({'error': 'Too many live preview streams'}), 503
+
+    keepalive = cfg.get('PREVIEW_LIVE_KEEPALIVE', 15)
+    max_seconds = cfg.get('PREVIEW_LIVE_STREAM_SECONDS', 300)
+
+    def stream():
+        yield 'retry: 1000\n\n'
+        for event in channel.events(keepalive, max_seconds):
+            if event is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f'event: preview\ndata: {json.dumps(event)}\n\n'
+
+    response = current_app.response_class(stream(), mimetype='text/event-stream')
+    # Runs once the response is closed, even if the stream never started
+    response.call_on_close(channel.close_stream)
+    response.headers.set('Cache-Control', 'no-cache')
+    # Keep reverse proxies from buffering the stream
+    response.headers.set('X-Accel-Buffering', 'no')
+    return response
+
+
+@bp.route('/api/preview/live/<channel_id>', methods=['POST'])
+def preview_live_edit(channel_id):
+    """Render an edit of a live preview channel.
+
+    Takes the form of /api/preview plus ``seq``, increasing with every
+    edit. Starting an edit cancels the renders of older edits of the
+    channel. The preview is pushed to the channel's event stream and the
+    answer is ``{'pushed': true}``. Without an open stream the answer is
+    the preview itself, ``{'superseded': true}`` if a newer edit came in
+    meanwhile.
+    """
+    if not live_preview_available(current_app.config.get('PREVIEW_LIVE_ENABLED', True)):
+        return jsonify({'error': 'Live preview disabled'}), 404
+    try:
+        seq = int(request.values.get('seq', ''))
+    except ValueError:
+        return jsonify({'error': 'seq is required'}), 400
+
+    channel = get_preview_channel(channel_id)
+    ticket = channel.begin(seq)
+    if ticket is None:
+        return jsonify({'superseded': True, 'seq': seq})
+
+    try:
+        image_file = request.files.get('image', None)
+        context = apply_preview_quality(build_label_context_from_request(request),
+                                        request.values.get('preview_quality'), image_file)
+        pages, meta, render_id = render_preview_pages('preview', context, image_file=image_file, ticket=ticket)
+        event = preview_response_data(pages, meta, render_id, 'urls')
+    except RenderCancelled:
+        current_app.logger.debug('Live preview %s: edit %d superseded', channel_id, seq)
+        return jsonify({'superseded': True, 'seq': seq})
+    except ValueError as e:
+        current_app.logger.info('Preview skipped: %s', str(e))
+        event = {'image': None, 'error': str(e)}
+    except Exception as e:
+        current_app.logger.error('Preview failed: %s', str(e), exc_info=True)
+        event = {'error': str(e)}
+
+    event['seq'] = seq
+    if channel.publish(ticket, event):
+        return jsonify({'pushed': True, 'seq': seq})
+    if ticket.cancelled():
+        return jsonify({'superseded': True, 'seq': seq})
+    return jsonify(event)
+
+
+@bp.route('/api/preview/<render_id>/page/<int:page>.<ext>', methods=['GET'])
+def get_preview_page(render_id, page, ext):
+    """Serve one page (1-based) of a rendered preview as PNG or WebP.
+
+    Pages are addressed by the hash of the label settings, so their content
+    never changes and browsers may cache them. Pass ``bits=1`` for a 1 bit
+    image dithered like the printer does, much smaller for black labels.
+    Answers 404 once the preview has been evicted from the preview cache.
+    """
+    if ext not in PREVIEW_PAGE_FORMATS or not all(c in '0123456789abcdef' for c in render_id):
+        return jsonify({'error': 'Unknown preview format'}), 404
+    bilevel = request.args.get('bits') == '1'
+
+    data = get_preview_cache().get_page(render_id, page - 1, ext, bilevel)
+    if data is None:
+        return jsonify({'error': 'Preview not found, render it again'}), 404
+
+    response = make_response(data)
+    response.headers.set('Content-Type', PREVIEW_PAGE_FORMATS[ext])
+    response.headers.set('Cache-Control', f'private, max-age={PREVIEW_PAGE_MAX_AGE}, immutable')
+    response.set_etag(f'{render_id}-{page}-{ext}-{int(bilevel)}')
+    return response.make_conditional(request)
+
+
 @bp.route('/api/markdown/preview', methods=['POST'])
 def markdown_preview_api():
     """Generate markdown preview."""
@@ -162,15 +343,11 @@ def markdown_preview_api():
 
     try:
         context = build_label_context_from_json(payload)
-        label = create_label_from_context(context)
-        labels = getattr(label, '_markdown_labels', None) or getattr(label, '_pdf_page_labels', None)
-        label_list = labels if labels else [label]
-        images = [lbl.generate() for lbl in label_list]
-
-        # For rotated markdown, images are already landscape - no rotation needed
-
-        pages = [base64.b64encode(image_to_png_bytes(img)).decode('ascii') for img in images]
-        return jsonify({'pages': pages})
+        pages, meta, render_id = render_preview_pages('markdown', context)
+        dpi = meta.get('render_dpi', DEFAULT_DPI)
+        if payload.get('return_format') == 'urls':
+            return jsonify({'render_id': render_id, 'pages': preview_page_urls(render_id, pages), 'dpi': dpi})
+        return jsonify({'pages': [base64.b64encode(page).decode('ascii') for page in pages], 'dpi': dpi})
     except Exception as exc:
         current_app.logger.error('Markdown preview failed: %s', exc)
         return jsonify({'error': str(exc)}), 400
@@ -270,13 +447,15 @@ def print_text():
         printer.add_label_to_queue(label, print_count, cut_once)
 
     try:
-        printer.process_queue()
+        job_id = spool_print_job(printer, wait=int(request.values.get('wait', 0)) == 1)
     except Exception as e:
         return_dict['message'] = str(e)
         current_app.logger.error('Exception happened: %s', e)
         return return_dict
 
     return_dict['success'] = True
+    if job_id:
+        return_dict['job_id'] = job_id
     return return_dict
 
 
@@ -365,13 +544,222 @@ def markdown_print_api():
         else:
             printer.add_label_to_queue(label, print_count, cut_once)
 
-        printer.process_queue()
-        return jsonify({'success': True})
+        job_id = spool_print_job(printer, wait=bool(payload.get('wait', False)))
+        response_data = {'success': True}
+        if job_id:
+            response_data['job_id'] = job_id
+        return jsonify(response_data)
     except Exception as exc:
         current_app.logger.error('Markdown print failed: %s', exc)
         return jsonify({'success': False, 'error': str(exc)}), 400
 
 
+@bp.route('/api/print/batch', methods=['POST'])
+def print_batch_api():
+    """Print many distinct labels sharing one template as a single job.
+
+    JSON body:
+        {
+            'template': {...},      # form fields as accepted by /api/print
+            'labels': [{...}, ...], # per-label overrides of the template
+            'printer_id': str,      # optional, default printer otherwise
+            'print_count': int,     # copies of the whole batch
+            'cut': 'each' | 'last', # cut after every label or only at the end
+            'wait': bool            # block until printed
+        }
+    """
+    payload = request.get_json(force=True, silent=True)
+    if payload is None:
+        return jsonify({'success': False, 'error': 'Invalid or missing JSON payload'}), 400
+
+    template = payload.get('template') or {}
+    overrides = payload.get('labels') or []
+    if not isinstance(template, dict) or not isinstance(overrides, list) or not overrides:
+        return jsonify({'success': False, 'error': 'A template object and a non-empty labels list are required'}), 400
+
+    # All labels go through one printer queue, rasterized for one label size
+    label_size = str(template.get('label_size', current_app.config['LABEL_DEFAULT_SIZE']))
+    if any(str((override or {}).get('label_size', label_size)) != label_size for override in overrides):
+        return jsonify({'success': False, 'error': 'label_size can only be set in the template'}), 400
+
+    try:
+        print_count = int(payload.get('print_count', 1))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'print_count must be a number'}), 400
+    if print_count < 1:
+        return jsonify({'success': False, 'error': 'print_count must be at least 1'}), 400
+
+    # Limits the labels printed, copies included
+    max_labels = current_app.config.get('BATCH_MAX_LABELS', 1000)
+    if len(overrides) * print_count > max_labels:
+        return jsonify({'success': False, 'error': f'Too many labels in batch (max {max_labels})'}), 400
+
+    try:
+        contexts = [build_label_context_from_values({**template, **(override or {})}) for override in overrides]
+        labels = create_labels_from_contexts(contexts, current_app.config.get('BATCH_RENDER_WORKERS', 4))
+
+        # Multi-page labels (markdown, PDF) contribute all of their pages
+        label_sequence = []
+        for label in labels:
+            pages = getattr(label, '_markdown_labels', None) or getattr(label, '_pdf_page_labels', None)
+            label_sequence.extend(pages if pages else [label])
+        if len(label_sequence) * print_count > max_labels:
+            return jsonify({'success': False, 'error': f'Too many labels in batch (max {max_labels})'}), 400
+
+        printer = create_printer_queue(label_size, payload.get('printer_id', None))
+        cut_once = str(payload.get('cut', 'each')).lower() == 'last'
+        printer.add_label_sequence(label_sequence, print_count, cut_once)
+
+        job_id = spool_print_job(printer, wait=bool(payload.get('wait', False)))
+        response_data = {'success': True, 'label_count': len(label_sequence)}
+        if job_id:
+            response_data['job_id'] = job_id
+        return jsonify(response_data)
+    except Exception as exc:
+        current_app.logger.error('Batch print failed: %s', exc)
+        return jsonify({'success': False, 'error': str(exc)}), 400
+
+
+@bp.route('/api/print/pages', methods=['POST'])
+def print_pages_api():
+    """Print a job of already rendered pages in one request.
+
+    Used by remote printer forwarding. Multipart form:
+        page:       PNG file, repeated, every distinct page once
+        sequence:   JSON list of [page_index, cut] pairs in print order,
+                    each page once with a cut when omitted
+        label_size: label size the pages were rendered for
+        printer_id: optional, default printer otherwise
+        wait:       1 to block until printed
+    """
+    pages = request.files.getlist('page')
+    if not pages:
+        return jsonify({'success': False, 'error': 'No pages in request'}), 400
+
+    try:
+        images = []
+        for page in pages:
+            img = Image.open(page.stream)
+            img.load()
+            images.append(img)
+
+        sequence = request.values.get('sequence')
+        try:
+            sequence = json.loads(sequence) if sequence else [[idx, True] for idx in range(len(images))]
+            sequence = [(int(page), bool(cut)) for page, cut in sequence]
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'sequence must be a list of [page_index, cut] pairs'}), 400
+        if any(not 0 <= page < len(images) for page, _ in sequence):
+            return jsonify({'success': False, 'error': f'Page index out of range (0-{len(images) - 1})'}), 400
+        max_labels = current_app.config.get('BATCH_MAX_LABELS', 1000)
+        if len(sequence) > max_labels:
+            return jsonify({'success': False, 'error': f'Too many labels in job (max {max_labels})'}), 400
+
+        label_size = request.values.get('label_size', current_app.config['LABEL_DEFAULT_SIZE'])
+        labels = create_labels_from_images(images, label_size)
+        entries = [(labels[page], cut) for page, cut in sequence]
+
+        printer = create_printer_queue(label_size, request.values.get('printer_id', None))
+        printer.add_queue_entries(entries)
+        job_id = spool_print_job(printer, wait=int(request.values.get('wait', 0)) == 1)
+    except Exception as exc:
+        current_app.logger.error('Page job print failed: %s', exc)
+        return jsonify({'success': False, 'error': str(exc)}), 400
+
+    response_data = {'success': True, 'label_count': len(entries)}
+    if job_id:
+        response_data['job_id'] = job_id
+    return jsonify(response_data)
+
+
+@bp.route('/api/print/raster', methods=['POST'])
+def print_raster_api():
+    """Send a Brother QL instruction stream rasterized by another instance to a printer.
+
+    The request body is the raw stream, optionally compressed as announced
+    by the Content-Encoding header (gzip, or zstd when zstandard is
+    installed). Query parameters:
+        model:      printer model the stream was rasterized for
+        label_size: label size the stream was rasterized for
+        printer_id: optional, default printer otherwise
+        wait:       1 to block until printed
+
+    Answers 409 when the printer is not a local printer of that model, the
+    sender then falls back to forwarding images.
+    """
+    encoding = request.headers.get('Content-Encoding', 'identity').lower()
+    if encoding not in supported_raster_encodings():
+        return jsonify({'success': False, 'error': f'Unsupported Content-Encoding: {encoding}'}), 415
+
+    printer_config = get_printer_config(request.args.get('printer_id', None))
+    if not printer_config:
+        return jsonify({'success': False, 'error': 'No printer configured'}), 404
+    model = request.args.get('model')
+    if printer_config['type'] != 'local' or printer_config.get('model') != model:
+        return jsonify({
+            'success': False,
+            'error': f'Printer {printer_config.get("id")} is not a local {model} printer'
+        }), 409
+
+    try:
+        max_bytes = int(current_app.config.get('RASTER_PASSTHROUGH_MAX_MB', 64) * 1024 * 1024)
+        data = decode_raster(request.get_data(cache=False), encoding, max_bytes)
+        if not data:
+            return jsonify({'success': False, 'error': 'No raster data in request'}), 400
+        if not is_raster_stream(data):
+            return jsonify({'success': False, 'error': 'Not a Brother QL instruction stream'}), 400
+
+        printer = create_printer_queue(
+            request.args.get('label_size', current_app.config['LABEL_DEFAULT_SIZE']),
+            printer_config.get('id')
+        )
+        printer.add_raster(data)
+        job_id = spool_print_job(printer, wait=int(request.args.get('wait', 0)) == 1)
+    except Exception as exc:
+        current_app.logger.error('Raster print failed: %s', exc)
+        return jsonify({'success': False, 'error': str(exc)}), 400
+
+    current_app.logger.info('Queued %d bytes of %s raster data for printer %s', len(data), encoding, printer_config.get('id'))
+    response_data = {'success': True}
+    if job_id:
+        response_data['job_id'] = job_id
+    return jsonify(response_data)
+
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def api_print_job(job_id):
+    """Get state of a spooled print job (queued/rasterizing/sending/done/failed)."""
+    job = get_print_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@bp.route('/api/cache/stats', methods=['GET'])
+def api_cache_stats():
+    """Get size and hit/miss counters of the preview, raster and font caches."""
+    return jsonify({
+        'success': True,
+        'preview': get_preview_cache().stats(),
+        'raster': get_raster_cache().stats(),
+        'fonts': font_cache.stats()
+    })
+
+
+@bp.route('/api/fonts/rescan', methods=['POST'])
+def api_rescan_fonts():
+    """Refresh the font list without restarting, {"full": true} rescans every font directory."""
+    data = request.get_json(silent=True) or {}
+    rescanned = FONTS.rescan(full=bool(data.get('full', False)))
+    current_app.logger.info('Font rescan: %s directories rescanned, %d families',
+                            'all' if rescanned is None else rescanned, len(FONTS.fonts))
+    return jsonify({
+        'success': True,
+        'families': len(FONTS.fonts),
+        'rescanned_directories': rescanned
+    })
+
+
 @bp.route('/api/printers', methods=['GET'])
 def api_list_printers():
     """List all configured printers."""
@@ -430,9 +818,6 @@ def api_add_printer():
             if not data.get('url'):
                 return jsonify({'success': False, 'error': 'URL is required for remote printers'}), 400
 
-        # Load existing printers
-        printers = load_printers_from_json()
-
         # Generate unique ID
         new_id = str(uuid.uuid4())
 
@@ -449,14 +834,17 @@ def api_add_printer():
             new_printer['device'] = data['device']
         else:
             new_printer['url'] = data['url']
+            # Model of the remote's printer, lets jobs be forwarded as raster data
+            if data.get('model'):
+                new_printer['model'] = data['model']
+
+        with get_printer_registry().edit() as printers:
+            # If this is set as default, unset others
+            if new_printer['default']:
+                for p in printers:
+                    p['default'] = False
 
-        # If this is set as default, unset others
-        if new_printer['default']:
-            for p in printers:
-                p['default'] = False
-
-        printers.append(new_printer)
-        save_printers_to_json(printers)
+            printers.append(new_printer)
 
         return jsonify({'success': True, 'printer': new_printer})
     except Exception as e:
@@ -475,41 +863,43 @@ def api_update_printer(printer_id):
     if not data:
         return jsonify({'success': False, 'error': 'No data provided'}), 400
 
-    printers = load_printers_from_json()
-
-    # Find printer
-    printer_index = None
-    for i, p in enumerate(printers):
-        if p.get('id') == printer_id:
-            printer_index = i
-            break
-
-    if printer_index is None:
-        return jsonify({'success': False, 'error': 'Printer not found'}), 404
-
-    # Update printer
-    printer = printers[printer_index]
-    if 'name' in data:
-        printer['name'] = data['name']
-    if 'default' in data:
-        is_default = data['default']
-        printer['default'] = is_default
-        # If setting as default, unset others
-        if is_default:
-            for i, p in enumerate(printers):
-                if i != printer_index:
-                    p['default'] = False
+    with get_printer_registry().edit() as printers:
+        # Find printer
+        printer_index = None
+        for i, p in enumerate(printers):
+            if p.get('id') == printer_id:
+                printer_index = i
+                break
 
-    if printer['type'] == 'local':
-        if 'model' in data:
-            printer['model'] = data['model']
-        if 'device' in data:
-            printer['device'] = data['device']
-    else:  # remote
-        if 'url' in data:
-            printer['url'] = data['url']
+        if printer_index is None:
+            return jsonify({'success': False, 'error': 'Printer not found'}), 404
 
-    save_printers_to_json(printers)
+        # Update printer
+        printer = printers[printer_index]
+        if 'name' in data:
+            printer['name'] = data['name']
+        if 'default' in data:
+            is_default = data['default']
+            printer['default'] = is_default
+            # If setting as default, unset others
+            if is_default:
+                for i, p in enumerate(printers):
+                    if i != printer_index:
+                        p['default'] = False
+
+        if printer['type'] == 'local':
+            if 'model' in data:
+                printer['model'] = data['model']
+            if 'device' in data:
+                printer['device'] = data['device']
+        else:  # remote
+            if 'url' in data:
+                printer['url'] = data['url']
+            if 'model' in data:
+                if data['model']:
+                    printer['model'] = data['model']
+                else:
+                    printer.pop('model', None)
 
     return jsonify({'success': True, 'printer': printer})
 
@@ -521,26 +911,23 @@ def api_delete_printer(printer_id):
     if current_app.config.get('PRINTERS') is not None:
         return jsonify({'success': False, 'error': 'Printers configured in config file (read-only)'}), 403
 
-    printers = load_printers_from_json()
-
-    # Find and remove printer
-    printer_index = None
-    for i, p in enumerate(printers):
-        if p.get('id') == printer_id:
-            printer_index = i
-            break
-
-    if printer_index is None:
-        return jsonify({'success': False, 'error': 'Printer not found'}), 404
+    with get_printer_registry().edit() as printers:
+        # Find and remove printer
+        printer_index = None
+        for i, p in enumerate(printers):
+            if p.get('id') == printer_id:
+                printer_index = i
+                break
 
-    was_default = printers[printer_index].get('default', False)
-    printers.pop(printer_index)
+        if printer_index is None:
+            return jsonify({'success': False, 'error': 'Printer not found'}), 404
 
-    # If deleted printer was default, set first remaining as default
-    if was_default and printers:
-        printers[0]['default'] = True
+        was_default = printers[printer_index].get('default', False)
+        printers.pop(printer_index)
 
-    save_printers_to_json(printers)
+        # If deleted printer was default, set first remaining as default
+        if was_default and printers:
+            printers[0]['default'] = True
 
     return jsonify({'success': True})
 
@@ -569,28 +956,13 @@ def api_printer_status():
 
     printer_id = request.args.get('printer_id')
 
-    # Get printer configuration
-    printers = get_available_printers()
-    if not printers:
-        return jsonify({'success': False, 'error': 'No printers configured'}), 404
-
     # Find the requested printer or use default
-    printer = None
     if printer_id:
-        for p in printers:
-            if p.get('id') == printer_id:
-                printer = p
-                break
+        printer = get_printer(printer_id)
         if not printer:
             return jsonify({'success': False, 'error': 'Printer not found'}), 404
     else:
-        # Use default printer
-        for p in printers:
-            if p.get('default', False):
-                printer = p
-                break
-        if not printer and printers:
-            printer = printers[0]
+        printer = get_default_printer()
 
     if not printer:
         return jsonify({'success': False, 'error': 'No printer available'}), 404
@@ -617,7 +989,11 @@ def api_printer_status():
     try:
         # Create a temporary printer queue just for status query
         from .printer import PrinterQueue
-        queue = PrinterQueue(model, device, current_app.config['LABEL_DEFAULT_SIZE'])
+        from .backend_pool import connection_idle_timeout
+        queue = PrinterQueue(model, device, current_app.config['LABEL_DEFAULT_SIZE'],
+                             printer_id=printer.get('id'),
+                             connection_idle_timeout=connection_idle_timeout(
+                                 current_app.config.get('PRINTER_CONNECTION_IDLE_TIMEOUT')))
 
         status = queue.get_printer_status()
 
@@ -633,6 +1009,8 @@ def api_printer_status():
 
         if status.get('media_color') == 'red' and status.get('media_type'):
             status['media_type'] = status['media_type'] + '_red'
+        # Lets forwarding instances rasterize jobs for this printer themselves
+        status['model'] = model
 
         return jsonify({'success': True, 'status': status})
 
@@ -643,46 +1021,3 @@ def api_printer_status():
             'error': str(e),
             'supported': False
         }), 500
-        current_app.logger.error("Error querying printer status: %s", e, exc_info=True)
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'supported': False
-        }), 500
-    except ValueError as e:
-        # Return empty response for image mode without uploaded file
-        current_app.logger.info('Preview skipped: %s', str(e))
-        if request.values.get('return_format') == 'base64':
-            return jsonify({'image': None, 'error': str(e)})
-        else:
-            return jsonify({'error': str(e)}), 400
-    except Exception as e:
-        current_app.logger.error('Preview failed: %s', str(e), exc_info=True)
-        if request.values.get('return_format') == 'base64':
-            return jsonify({'error': str(e)})
-        else:
-            return jsonify({'error': str(e)}), 500
-
-
-@bp.route('/api/markdown/preview', methods=['POST'])
-def markdown_preview_api():
-    payload = request.get_json(force=True, silent=True)
-    if payload is None:
-        return jsonify({'error': 'Invalid or missing JSON payload'}), 400
-
-    try:
-        context = build_label_context_from_json(payload)
-        label = create_label_from_context(context)
-        labels = getattr(label, '_markdown_labels', None) or getattr(label, '_pdf_page_labels', None)
-        label_list = labels if labels else [label]
-        images = [lbl.generate() for lbl in label_list]
-
-        # For rotated markdown, images are already landscape - no rotation needed
-
-        pages = [base64.b64encode(image_to_png_bytes(img)).decode('ascii') for img in images]
-        return jsonify({'pages': pages})
-    except Exception as exc:
-        current_app.logger.error('Markdown preview failed: %s', exc)
-        return jsonify({'error': str(exc)}), 400
-
-
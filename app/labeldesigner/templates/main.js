@@ -27,6 +27,17 @@ var markdownButtonDefaultHtml = null;
 var markdownButtonResetTimer = null;
 var markdownPreviewPages = [];
 var markdownCurrentPage = 0;
+// Edits are previewed at draft resolution, a full resolution preview follows
+// once the user pauses for PREVIEW_REFINE_DELAY_MS
+var PREVIEW_REFINE_DELAY_MS = 800;
+var previewRefineTimer = null;
+var previewSeq = 0;
+var previewDpi = {{default_dpi}};
+// Edits are posted to a live preview channel whose results arrive over an
+// event stream, the server drops renders of outdated edits. Without an open
+// stream, previews are requested the classic way.
+var liveChannelId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+var liveChannelReady = false;
 const STORAGE_VERSION = 1;
 const STORAGE_KEY = 'brotherQlLabelDesignerSettings_v' + STORAGE_VERSION;
 const RED_SUPPORT = {{ 'true' if red_support else 'false' }};
@@ -159,16 +170,52 @@ function formData(cut_once) {
     return data;
 }
 
+// Preview pages are URLs of the cached page images, or base64 PNG data when
+// the server could not cache the preview
+function previewPageSrc(page) {
+    return page.charAt(0) === '/' ? page : 'data:image/png;base64,' + page;
+}
+
 function updatePreview(data) {
-    $('#previewImg').attr('src', 'data:image/png;base64,' + data);
+    $('#previewImg').attr('src', previewPageSrc(data));
     var img = $('#previewImg')[0];
     img.onload = function() {
         updateHeadWidth();
-        $('#labelWidth').html((img.naturalWidth / {{default_dpi}} * 2.54).toFixed(1));
-        $('#labelHeight').html((img.naturalHeight / {{default_dpi}} * 2.54).toFixed(1));
+        $('#labelWidth').html((img.naturalWidth / previewDpi * 2.54).toFixed(1));
+        $('#labelHeight').html((img.naturalHeight / previewDpi * 2.54).toFixed(1));
+
+        // Show draft previews as large as the full resolution one would be
+        var scale = {{default_dpi}} / previewDpi;
+        if (scale !== 1) {
+            var width = img.naturalWidth * scale;
+            var height = img.naturalHeight * scale;
+            var maxHeight = parseFloat($(img).css('max-height')) || height;
+            var maxWidth = $(img).parent().width() || width;
+            var fit = Math.min(1, maxHeight / height, maxWidth / width);
+            $(img).css({width: (width * fit) + 'px', height: (height * fit) + 'px'});
+        } else {
+            $(img).css({width: '', height: ''});
+        }
     };
 }
 
+function previewQuality(full) {
+    if (previewRefineTimer) {
+        clearTimeout(previewRefineTimer);
+        previewRefineTimer = null;
+    }
+    // Only PDF rasterizing gets cheaper at draft resolution, other sources
+    // are rendered at full resolution straight away.
+    if (full || !(getCheckedValue('printType') === 'image' && isPdfLoaded)) {
+        return 'full';
+    }
+    previewRefineTimer = setTimeout(function() {
+        previewRefineTimer = null;
+        preview(true, true);
+    }, PREVIEW_REFINE_DELAY_MS);
+    return 'draft';
+}
+
 function updateStyles() {
     var font_family = $('#fontFamily option:selected').text();
 
@@ -694,6 +741,10 @@ function showMarkdownPage(index) {
     markdownCurrentPage = clamped;
     updatePreview(markdownPreviewPages[clamped]);
     updateMarkdownPager();
+    // Fetch the next page in the background so paging forward is instant
+    if (clamped + 1 < markdownPreviewPages.length && markdownPreviewPages[clamped + 1].charAt(0) === '/') {
+        new Image().src = markdownPreviewPages[clamped + 1];
+    }
 }
 
 function markdownPrevPage() {
@@ -717,6 +768,7 @@ function handlePreviewResponse(raw, isMarkdown) {
         return;
     }
 
+    previewDpi = (raw && raw.dpi) || {{default_dpi}};
     var pages = normalizePreviewPages(raw);
     if (!pages.length) {
         if (isMarkdown || pages.length > 1) {
@@ -761,11 +813,49 @@ function handlePreviewResponse(raw, isMarkdown) {
     }
 }
 
-function preview(forceRender) {
+function previewUrl() {
+    if (liveChannelReady) {
+        return '{{url_for('.preview_live_edit', channel_id='__channel__')}}'.replace('__channel__', liveChannelId);
+    }
+    return '{{url_for('.get_preview_from_image')}}?return_format=urls';
+}
+
+// Answers of the live channel only acknowledge edits whose preview is pushed
+// to the event stream, or that a newer edit superseded
+function isLiveAck(data) {
+    return !!(data && (data.pushed || data.superseded));
+}
+
+function openLiveChannel() {
+    if (!window.EventSource) {
+        return;
+    }
+    var source = new EventSource('{{url_for('.preview_live_stream', channel_id='__channel__')}}'.replace('__channel__', liveChannelId));
+    source.onopen = function() {
+        liveChannelReady = true;
+    };
+    source.onerror = function() {
+        // The browser reconnects on its own, until then previews are polled
+        liveChannelReady = false;
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(openLiveChannel, 30000);
+        }
+    };
+    source.addEventListener('preview', function(e) {
+        var data = JSON.parse(e.data);
+        if (data.seq === previewSeq) {
+            handlePreviewResponse(data, getCheckedValue('printType') === 'markdown');
+        }
+    });
+}
+
+function preview(forceRender, fullQuality) {
     updateHeadWidth();
     var printType = getCheckedValue('printType');
     var isMarkdown = (printType === 'markdown');
     var force = forceRender === true;
+    // Only the response to the latest request is shown
+    var seq = ++previewSeq;
 
     toggleMarkdownButton(isMarkdown);
     toggleMarkdownOptions(isMarkdown);
@@ -832,15 +922,21 @@ function preview(forceRender) {
                 // Add all other form parameters
                 var fd = formData(false);
                 $.each(fd, function(key, value) { formDataObj.append(key, value); });
+                formDataObj.append('preview_quality', previewQuality(fullQuality === true));
+                formDataObj.append('seq', seq);
 
                 // Send via AJAX (simple example - server expects form-encoded or file)
                 $.ajax({
-                    url: '{{url_for('.get_preview_from_image')}}?return_format=base64',
+                    url: previewUrl(),
                     type: 'POST',
                     data: formDataObj,
                     contentType: false,
                     processData: false,
-                    success: function(data) { handlePreviewResponse(data, false); }
+                    success: function(data) {
+                        if (seq === previewSeq && !isLiveAck(data)) {
+                            handlePreviewResponse(data, false);
+                        }
+                    }
                 });
             } else {
                 // No stored file to send; preview will proceed via standard flow
@@ -853,16 +949,23 @@ function preview(forceRender) {
         return;
     }
 
+    var requestData = formData();
+    // The render button asks for the final result right away
+    requestData.preview_quality = previewQuality(fullQuality === true || (isMarkdown && force));
+    requestData.seq = seq;
+
     $.ajax({
         type:        'POST',
-        url:         '{{url_for('.get_preview_from_image')}}?return_format=base64',
+        url:         previewUrl(),
         contentType: 'application/x-www-form-urlencoded; charset=UTF-8',
-        data:        formData(),
+        data:        requestData,
         success: function(data) {
-            handlePreviewResponse(data, isMarkdown);
+            if (seq === previewSeq && !isLiveAck(data)) {
+                handlePreviewResponse(data, isMarkdown);
+            }
         },
         error: function(xhr) {
-            if (isMarkdown) {
+            if (isMarkdown && seq === previewSeq) {
                 var msg = xhr && xhr.responseText ? $('<div>').text(xhr.responseText).html() : 'Unknown error';
                 finishMarkdownRenderFeedback('<span class="fas fa-exclamation-triangle" aria-hidden="true"></span> Render Failed');
                 // Reset the render button after a short period
@@ -919,10 +1022,14 @@ function print(cut_once) {
         return;
     }
 
+    // Wait for the printout, so printer errors are shown instead of a queued job
+    var printData = formData(cut_once);
+    printData.wait = 1;
+
     $.ajax({
         type:     'POST',
         dataType: 'json',
-        data:     formData(cut_once),
+        data:     printData,
         url:      '{{url_for('.print_text')}}',
         success:  setStatus,
         error:    setStatus
@@ -1544,6 +1651,10 @@ $(function() {
         schedulePersist();
     });
 
+    {% if live_preview %}
+    openLiveChannel();
+    {% endif %}
+
     setTimeout(function() {
         initializing = false;
         storageReady = storageAvailable;
@@ -1553,9 +1664,9 @@ $(function() {
 Dropzone.options.myAwesomeDropzone = {
     url: function() {
         if (dropZoneMode == 'preview') {
-            return "{{url_for('.get_preview_from_image')}}?return_format=base64";
+            return "{{url_for('.get_preview_from_image')}}?return_format=urls";
         } else {
-            return "{{url_for('.print_text')}}";
+            return "{{url_for('.print_text')}}?wait=1";
         }
     },
     paramName: "image",
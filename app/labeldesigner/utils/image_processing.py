@@ -13,12 +13,44 @@ from app.utils import (
 
 try:
     RESAMPLE_LANCZOS = Image.Resampling.LANCZOS
+    RESAMPLE_BILINEAR = Image.Resampling.BILINEAR
+    RESAMPLE_BOX = Image.Resampling.BOX
 except AttributeError:
     RESAMPLE_LANCZOS = Image.LANCZOS
+    RESAMPLE_BILINEAR = Image.BILINEAR
+    RESAMPLE_BOX = Image.BOX
 
 DEFAULT_DPI = 300
 
 
+def get_render_dpi(context):
+    """DPI PDF sources are rasterized at, lower than DEFAULT_DPI for draft previews."""
+    return context.get('render_dpi', DEFAULT_DPI)
+
+
+def to_printer_scale(image, dpi):
+    """Scale an image rasterized at ``dpi`` to the size it has at DEFAULT_DPI.
+
+    Draft previews rasterize PDFs at a low resolution, scaling them back keeps
+    cropping, fitting and slicing (and so the page count) identical to a full
+    render.
+    """
+    if image is None or dpi == DEFAULT_DPI:
+        return image
+    scale = DEFAULT_DPI / dpi
+    size = (max(1, int(round(image.width * scale))), max(1, int(round(image.height * scale))))
+    return image.resize(size, resample=RESAMPLE_BILINEAR)
+
+
+def to_preview_scale(image, dpi):
+    """Downscale a label rendered at DEFAULT_DPI to a ``dpi`` preview."""
+    if dpi >= DEFAULT_DPI:
+        return image
+    scale = dpi / DEFAULT_DPI
+    size = (max(1, int(round(image.width * scale))), max(1, int(round(image.height * scale))))
+    return image.resize(size, resample=RESAMPLE_BOX)
+
+
 def apply_crop_and_rotate(image, context):
     """Apply crop and rotation to image based on context settings."""
     if image is None:
@@ -93,7 +125,8 @@ def get_uploaded_image(image_file, context):
             return apply_image_mode(image, context)
         if ext.lower() == '.pdf':
             from app.utils import pdffile_to_image
-            image = pdffile_to_image(image_file, DEFAULT_DPI)
+            dpi = get_render_dpi(context)
+            image = to_printer_scale(pdffile_to_image(image_file, dpi), dpi)
             image = apply_crop_and_rotate(image, context)
             if context['image_mode'] == 'grayscale':
                 return convert_image_to_grayscale(image)
@@ -0,0 +1,369 @@
+"""Markdown blocks drawn directly onto PIL images.
+
+Alternative to the reportlab -> PDF -> poppler round trip of
+``markdown_render``: blocks from ``parse_blocks`` are laid out with the same
+paragraph styles (sizes, leading, spacing, table padding and grid) and drawn
+with PIL. Typography is approximate (greedy line breaking, no kerning or
+hyphenation) but no PDF is built and no process is spawned.
+"""
+
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from app.font_cache import load_font
+from app.markdown_render import (RenderedBlock, build_paragraph_styles, inline_md_to_html,
+                                 make_rendered_block)
+
+TOKEN = re.compile(r"\n|[^\S\n]+|\S+")
+
+# Placeholder face names handed to the shared style/markup builders
+FACE_KEYS = ('regular', 'bold', 'italic', 'bolditalic')
+MONO_FACE = 'Courier'
+MONO_FONT_CANDIDATES = ('DejaVuSansMono.ttf', 'LiberationMono-Regular.ttf', 'FreeMono.ttf', 'cour.ttf')
+
+WHITESMOKE = (245, 245, 245)
+BLACK = (0, 0, 0)
+GRAY = (128, 128, 128)
+
+ALIGNMENTS = {0: 'left', 1: 'center', 2: 'right', 4: 'justify'}
+
+
+class RunStyle(NamedTuple):
+    face: str
+    size_pt: float
+    color: Tuple[int, int, int]
+    underline: bool
+
+
+class _Box(NamedTuple):
+    """Paragraph style in pixels."""
+    face: str
+    size_pt: float
+    leading_px: float
+    space_after_px: float
+    color: Tuple[int, int, int]
+    align: str
+
+
+@lru_cache(maxsize=1)
+def _mono_font_path() -> str:
+    for candidate in MONO_FONT_CANDIDATES:
+        try:
+            load_font(candidate, 10)
+            return candidate
+        except OSError:
+            continue
+    return ''
+
+
+def _load_font(path: str, size_px: int):
+    size_px = max(1, size_px)
+    if path:
+        try:
+            return load_font(path, size_px)
+        except OSError:
+            pass
+    return ImageFont.load_default(size_px)
+
+
+def _rgb(color) -> Tuple[int, int, int]:
+    r, g, b = color.rgb()
+    return (int(round(r * 255)), int(round(g * 255)), int(round(b * 255)))
+
+
+class _MarkupParser(HTMLParser):
+    """Turn the reportlab paragraph markup of ``inline_md_to_html`` into styled runs."""
+
+    def __init__(self, base: RunStyle):
+        super().__init__(convert_charrefs=True)
+        self.stack = [base]
+        self.runs: List[Tuple[str, RunStyle]] = []
+        self.align: Optional[str] = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        style = self.stack[-1]
+        if tag == 'br':
+            self.runs.append(('\n', style))
+            return
+        if tag == 'font':
+            if attrs.get('name'):
+                style = style._replace(face=attrs['name'])
+            if attrs.get('color'):
+                try:
+                    style = style._replace(color=ImageColor.getrgb(attrs['color'])[:3])
+                except ValueError:
+                    pass
+            if attrs.get('size'):
+                try:
+                    style = style._replace(size_pt=float(attrs['size']))
+                except ValueError:
+                    pass
+        elif tag == 'u':
+            style = style._replace(underline=True)
+        elif tag in ('sub', 'super'):
+            style = style._replace(size_pt=style.size_pt * 0.7)
+        elif tag == 'para':
+            self.align = attrs.get('align', self.align)
+        self.stack.append(style)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'br':
+            self.runs.append(('\n', self.stack[-1]))
+
+    def handle_endtag(self, tag):
+        if tag != 'br' and len(self.stack) > 1:
+            self.stack.pop()
+
+    def handle_data(self, data):
+        if data:
+            self.runs.append((data, self.stack[-1]))
+
+
+class _Layout:
+    """Lays out and draws the blocks of one document width/style combination."""
+
+    def __init__(self, width_px: int, dpi: int, base_font_pt: float, line_spacing: int,
+                 font_paths: Tuple[str, str, str, str]):
+        self.width_px = width_px
+        self.scale = dpi / 72.0
+        self.base_font_pt = base_font_pt
+        self.styles = build_paragraph_styles(base_font_pt, line_spacing, FACE_KEYS)
+        regular = font_paths[0]
+        self.face_paths: Dict[str, str] = {key: path or regular for key, path in zip(FACE_KEYS, font_paths)}
+        self.face_paths[MONO_FACE] = _mono_font_path() or regular
+
+    def px(self, pt: float) -> int:
+        return int(round(pt * self.scale))
+
+    def box(self, style, align: Optional[str] = None) -> _Box:
+        return _Box(face=style.fontName,
+                    size_pt=style.fontSize,
+                    leading_px=style.leading * self.scale,
+                    space_after_px=style.spaceAfter * self.scale,
+                    color=_rgb(style.textColor),
+                    align=align or ALIGNMENTS.get(style.alignment, 'left'))
+
+    def font(self, style: RunStyle):
+        path = self.face_paths.get(style.face, self.face_paths['regular'])
+        return _load_font(path, self.px(style.size_pt))
+
+    # Paragraphs
+
+    def runs(self, markup: str, box: _Box) -> Tuple[List[Tuple[str, RunStyle]], str]:
+        parser = _MarkupParser(RunStyle(box.face, box.size_pt, box.color, False))
+        parser.feed(markup)
+        parser.close()
+        return parser.runs, parser.align or box.align
+
+    def wrap(self, runs: List[Tuple[str, RunStyle]], width_px: int) -> List[List[Tuple[str, RunStyle, float]]]:
+        """Greedy line breaking. Returns lines of (text, style, width) pieces."""
+        lines: List[List[Tuple[str, RunStyle, float]]] = [[]]
+        line_w = 0.0
+        for text, style in runs:
+            font = self.font(style)
+            for token in _tokens(text):
+                if token == '\n':
+                    lines.append([])
+                    line_w = 0.0
+                    continue
+                if token.isspace():
+                    if lines[-1]:
+                        w = font.getlength(token)
+                        lines[-1].append((token, style, w))
+                        line_w += w
+                    continue
+                w = font.getlength(token)
+                if line_w + w > width_px and lines[-1]:
+                    _strip_trailing_space(lines[-1])
+                    lines.append([])
+                    line_w = 0.0
+                while w > width_px and len(token) > 1:
+                    # Word wider than the line: break it where it overflows
+                    cut = len(token) - 1
+                    while cut > 1 and font.getlength(token[:cut]) > width_px:
+                        cut -= 1
+                    lines[-1].append((token[:cut], style, font.getlength(token[:cut])))
+                    lines.append([])
+                    token = token[cut:]
+                    w = font.getlength(token)
+                lines[-1].append((token, style, w))
+                line_w = sum(piece[2] for piece in lines[-1])
+        for line in lines:
+            _strip_trailing_space(line)
+        return lines
+
+    def paragraph(self, markup: str, box: _Box, width_px: int):
+        runs, align = self.runs(markup, box)
+        lines = self.wrap(runs, width_px)
+        height = len(lines) * box.leading_px
+        return lines, align, height
+
+    def draw_paragraph(self, draw: ImageDraw.ImageDraw, laid_out, box: _Box, x0: float, y0: float, width_px: int):
+        lines, align, _ = laid_out
+        for idx, line in enumerate(lines):
+            line_w = sum(piece[2] for piece in line)
+            if align == 'center':
+                x = x0 + (width_px - line_w) / 2
+            elif align == 'right':
+                x = x0 + width_px - line_w
+            else:
+                x = x0
+            # Baseline sits one font size below the line top, like reportlab's first line
+            baseline = y0 + idx * box.leading_px + self.px(box.size_pt)
+            for text, style, w in line:
+                font = self.font(style)
+                if not text.isspace():
+                    draw.text((x, baseline), text, fill=style.color, font=font, anchor='ls')
+                if style.underline:
+                    thickness = max(1, self.px(style.size_pt) // 15)
+                    uy = baseline + thickness * 2
+                    draw.rectangle([x, uy, x + w, uy + thickness - 1], fill=style.color)
+                x += w
+
+    # Blocks
+
+    def render(self, kind: str, data: object) -> RenderedBlock:
+        styles = self.styles
+        spacer_px = self.base_font_pt * 0.3 * self.scale
+        if kind in ('h1', 'h2', 'h3', 'p'):
+            return self.render_paragraphs([inline_md_to_html(data, FACE_KEYS)], self.box(styles[kind]), spacer_px)
+        if kind == 'ul':
+            return self.render_paragraphs([inline_md_to_html(f"• {item}", FACE_KEYS) for item in data],
+                                          self.box(styles['p']), spacer_px)
+        if kind == 'ol':
+            return self.render_paragraphs([inline_md_to_html(f"{idx}. {item}", FACE_KEYS) for idx, item in enumerate(data, 1)],
+                                          self.box(styles['p']), spacer_px)
+        if kind == 'quote':
+            return self.render_quote(data, spacer_px)
+        if kind == 'codeblock':
+            return self.render_code(data, spacer_px)
+        if kind == 'table':
+            return self.render_table(data, spacer_px)
+        return make_rendered_block(Image.new('RGB', (self.width_px, max(1, int(round(spacer_px)))), 'white'), [])
+
+    def render_paragraphs(self, markups: List[str], box: _Box, spacer_px: float) -> RenderedBlock:
+        laid_out = [self.paragraph(markup, box, self.width_px) for markup in markups]
+        height = sum(p[2] + box.space_after_px for p in laid_out) + spacer_px
+        image = Image.new('RGB', (self.width_px, max(1, int(round(height)))), 'white')
+        draw = ImageDraw.Draw(image)
+        y = 0.0
+        for paragraph in laid_out:
+            self.draw_paragraph(draw, paragraph, box, 0, y, self.width_px)
+            y += paragraph[2] + box.space_after_px
+        return make_rendered_block(image, [])
+
+    def render_quote(self, text: str, spacer_px: float) -> RenderedBlock:
+        box = self.box(self.styles['quote'])
+        ruler_px = self.px(3)
+        pad_right, pad_v = self.px(6), self.px(2)
+        inner_w = max(1, self.width_px - ruler_px - pad_right)
+        paragraph = self.paragraph(inline_md_to_html(text, FACE_KEYS), box, inner_w)
+        table_h = paragraph[2] + 2 * pad_v
+        image = Image.new('RGB', (self.width_px, max(1, int(round(table_h + spacer_px)))), 'white')
+        draw = ImageDraw.Draw(image)
+        # Only the inner half of the 3pt rule centered on the left edge is on the page
+        draw.rectangle([0, 0, max(0, ruler_px // 2 - 1), int(round(table_h)) - 1], fill=GRAY)
+        self.draw_paragraph(draw, paragraph, box, ruler_px, pad_v, inner_w)
+        return make_rendered_block(image, [])
+
+    def render_code(self, code: str, spacer_px: float) -> RenderedBlock:
+        box = self.box(self.styles['code'])
+        pad_h, pad_v = self.px(6), self.px(4)
+        inner_w = max(1, self.width_px - 2 * pad_h)
+        style = RunStyle(MONO_FACE, box.size_pt, box.color, False)
+        runs = [(code.replace('\t', '    '), style)]
+        lines = self.wrap_preformatted(runs, inner_w)
+        table_h = len(lines) * box.leading_px + 2 * pad_v
+        image = Image.new('RGB', (self.width_px, max(1, int(round(table_h + spacer_px)))), 'white')
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, 0, self.width_px - 1, int(round(table_h)) - 1], fill=WHITESMOKE)
+        self.draw_paragraph(draw, (lines, 'left', 0), box, pad_h, pad_v, inner_w)
+        return make_rendered_block(image, [])
+
+    def wrap_preformatted(self, runs: List[Tuple[str, RunStyle]], width_px: int) -> List[List[Tuple[str, RunStyle, float]]]:
+        """Keep spaces and line breaks, only wrap lines that overflow."""
+        lines = []
+        for text, style in runs:
+            font = self.font(style)
+            for raw in text.split('\n'):
+                while raw and font.getlength(raw) > width_px and len(raw) > 1:
+                    cut = len(raw) - 1
+                    while cut > 1 and font.getlength(raw[:cut]) > width_px:
+                        cut -= 1
+                    lines.append([(raw[:cut], style, font.getlength(raw[:cut]))])
+                    raw = raw[cut:]
+                lines.append([(raw, style, font.getlength(raw))] if raw else [])
+        return lines
+
+    def render_table(self, data, spacer_px: float) -> RenderedBlock:
+        headers, aligns, rows = data
+        styles = self.styles
+        cols = len(headers)
+        pad_h, pad_v = self.px(4), self.px(2)
+        edges = [int(round(self.width_px * idx / cols)) for idx in range(cols + 1)]
+
+        def cell(text: str, idx: int, header: bool):
+            align = aligns[idx] if idx < len(aligns) else 'left'
+            style_map = styles['th'] if header else styles['td']
+            box = self.box(style_map.get(align, style_map['left']))
+            width = max(1, edges[idx + 1] - edges[idx] - 2 * pad_h)
+            return box, self.paragraph(inline_md_to_html(text, FACE_KEYS), box, width), width
+
+        laid_rows = [[cell(text, idx, True) for idx, text in enumerate(headers)]]
+        for row in rows:
+            laid_rows.append([cell(text, idx, False) for idx, text in enumerate(row)])
+        row_heights = [int(round(max(c[1][2] for c in row) + 2 * pad_v)) for row in laid_rows]
+        table_h = sum(row_heights)
+
+        image = Image.new('RGB', (self.width_px, max(1, table_h + int(round(spacer_px)))), 'white')
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, 0, self.width_px - 1, row_heights[0] - 1], fill=WHITESMOKE)
+
+        boundaries: List[Tuple[int, str]] = []
+        y = 0
+        for row_idx, (row, row_h) in enumerate(zip(laid_rows, row_heights)):
+            boundaries.append((y, 'table_start' if row_idx == 0 else 'row'))
+            for col_idx, (box, paragraph, width) in enumerate(row):
+                # Cells are vertically centered
+                top = y + (row_h - paragraph[2]) / 2
+                self.draw_paragraph(draw, paragraph, box, edges[col_idx] + pad_h, top, width)
+            y += row_h
+        boundaries.append((table_h, 'table_end'))
+
+        grid = max(1, self.px(0.6))
+        rule = max(1, self.px(1.0))
+        y = 0
+        for row_h in row_heights[:-1]:
+            y += row_h
+            draw.rectangle([0, y - grid // 2, self.width_px - 1, y - grid // 2 + grid - 1], fill=BLACK)
+        draw.rectangle([0, row_heights[0] - rule // 2, self.width_px - 1, row_heights[0] - rule // 2 + rule - 1], fill=BLACK)
+        for x in edges[1:-1]:
+            draw.rectangle([x - grid // 2, 0, x - grid // 2 + grid - 1, table_h - 1], fill=BLACK)
+        draw.rectangle([0, 0, self.width_px - 1, table_h - 1], outline=BLACK, width=rule)
+        return make_rendered_block(image, boundaries)
+
+
+def _tokens(text: str) -> List[str]:
+    """Split text into words, whitespace runs and line breaks."""
+    return TOKEN.findall(text)
+
+
+def _strip_trailing_space(line: List[Tuple[str, RunStyle, float]]):
+    while line and line[-1][0].isspace():
+        line.pop()
+
+
+def rasterize_blocks_pil(blocks: List[Tuple[str, object]],
+                         width_px: int,
+                         dpi: int,
+                         base_font_pt: float,
+                         line_spacing: int,
+                         font_paths: Tuple[str, str, str, str]) -> List[RenderedBlock]:
+    """Draw each block onto its own image, same contract as the reportlab block renderer."""
+    layout = _Layout(width_px, dpi, base_font_pt, line_spacing, font_paths)
+    return [layout.render(kind, data) for kind, data in blocks]
@@ -1,8 +1,12 @@
 import html
+import math
+import pickle
 import re
+import tempfile
+from functools import partial
 from hashlib import md5
 from io import BytesIO
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 from pdf2image import convert_from_bytes
 from PIL import Image
@@ -12,14 +16,38 @@ from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.platypus import (BaseDocTemplate, Frame, PageTemplate,
                                 Paragraph, Spacer, Table, TableStyle,
                                 PageBreak)
 
+from app.font_cache import load_font
+from app.lru_cache import BytesLRUCache
+
 
 DEFAULT_PAGE_HEIGHT_MM = 400.0
 PAGE_BREAK_MARKER = '---PAGE---'
 
+# Rasterized blocks are cached so editing one block only re-renders that block
+BLOCK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 'reportlab' lays blocks out as PDF and rasterizes them with poppler, 'pil'
+# draws them directly onto an image (faster, approximate typography)
+MARKDOWN_ENGINES = ('reportlab', 'pil')
+
+# Blocks taller than the largest PDF page go through the single document path
+MAX_BLOCK_HEIGHT_PT = 14400
+
+block_cache = BytesLRUCache(max_bytes=BLOCK_CACHE_MAX_BYTES)
+
+
+class RenderedBlock(NamedTuple):
+    image: Image.Image
+    # Table boundaries relative to the block top, (px, type)
+    boundaries: List[Tuple[int, str]]
+    # First and last row with ink, None for blank blocks
+    ink: Optional[Tuple[int, int]]
+
+
 TRIPLE = re.compile(r"\*\*\*(.+?)\*\*\*", flags=re.DOTALL)
 DOUBLE = re.compile(r"\*\*(.+?)\*\*", flags=re.DOTALL)
 SINGLE = re.compile(r"(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)", flags=re.DOTALL)
@@ -34,6 +62,7 @@ FENCE = re.compile(r"^\s*```")
 BLANK = re.compile(r"^\s*$")
 TABLE_SPLIT = re.compile(r"(?<!\\)\|")
 ALIGN_SPEC = re.compile(r"^:?-{3,}:?$")
+FONT_COLOR = re.compile(r"<font\b[^>]*\bcolor\s*=", flags=re.IGNORECASE)
 
 
 def inline_md_to_html(text: str, faces: Tuple[str, str, str, str]) -> str:
@@ -230,7 +259,8 @@ def register_font_face(path: Optional[str], label: str) -> str:
     return font_name
 
 
-def resolve_font_faces(style_map: Dict[str, str], preferred_style: str) -> Tuple[str, str, str, str]:
+def resolve_font_paths(style_map: Dict[str, str], preferred_style: str) -> Tuple[str, str, str, str]:
+    """Pick the regular, bold, italic and bold italic font files of a family, '' if it has none."""
     def find_with_keywords(keywords: Iterable[str], fallback: str) -> str:
         for key, path in style_map.items():
             name = key.lower()
@@ -244,6 +274,11 @@ def resolve_font_faces(style_map: Dict[str, str], preferred_style: str) -> Tuple
     bold_path = find_with_keywords(['bold'], preferred_style) or regular_path
     italic_path = find_with_keywords(['italic'], preferred_style) or find_with_keywords(['oblique'], preferred_style) or regular_path
     bolditalic_path = find_with_keywords(['bold', 'italic'], preferred_style) or find_with_keywords(['bold', 'oblique'], preferred_style) or bold_path or italic_path or regular_path
+    return (regular_path, bold_path, italic_path, bolditalic_path)
+
+
+def resolve_font_faces(style_map: Dict[str, str], preferred_style: str) -> Tuple[str, str, str, str]:
+    regular_path, bold_path, italic_path, bolditalic_path = resolve_font_paths(style_map, preferred_style)
 
     if not regular_path:
         return ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique')
@@ -255,6 +290,104 @@ def resolve_font_faces(style_map: Dict[str, str], preferred_style: str) -> Tuple
     return (regular_name, bold_name, italic_name, bolditalic_name)
 
 
+def build_paragraph_styles(base_font_pt: float, line_spacing: int, faces: Tuple[str, str, str, str]) -> Dict[str, object]:
+    spacing_factor = max(line_spacing, 1) / 100.0
+    lead = max(base_font_pt * spacing_factor, base_font_pt)
+    regular, bold, italic, bolditalic = faces
+
+    style_p = ParagraphStyle('P', fontName=regular, fontSize=base_font_pt, leading=lead,
+                             textColor=colors.black, alignment=0, spaceAfter=max(2, base_font_pt * 0.15))
+    return {
+        'p': style_p,
+        'h1': ParagraphStyle('H1', parent=style_p, fontName=bold, fontSize=int(base_font_pt * 1.6), leading=int(lead * 1.4), spaceAfter=lead),
+        'h2': ParagraphStyle('H2', parent=style_p, fontName=bold, fontSize=int(base_font_pt * 1.3), leading=int(lead * 1.2), spaceAfter=lead * 0.9),
+        'h3': ParagraphStyle('H3', parent=style_p, fontName=bolditalic, fontSize=int(base_font_pt * 1.1), leading=int(lead * 1.1), spaceAfter=lead * 0.8),
+        'quote': ParagraphStyle('Quote', parent=style_p, leftIndent=0, textColor=colors.gray),
+        'code': ParagraphStyle('Code', parent=style_p, fontName='Courier', leading=int(lead * 0.95)),
+        'th': {
+            'left': ParagraphStyle('ThLeft', parent=style_p, fontName=bold, alignment=0),
+            'center': ParagraphStyle('ThCenter', parent=style_p, fontName=bold, alignment=1),
+            'right': ParagraphStyle('ThRight', parent=style_p, fontName=bold, alignment=2)
+        },
+        'td': {
+            'left': ParagraphStyle('TdLeft', parent=style_p, alignment=0),
+            'center': ParagraphStyle('TdCenter', parent=style_p, alignment=1),
+            'right': ParagraphStyle('TdRight', parent=style_p, alignment=2)
+        }
+    }
+
+
+def _block_flowables(kind: str,
+                     data: object,
+                     styles: Dict[str, object],
+                     faces: Tuple[str, str, str, str],
+                     page_w: float,
+                     base_font_pt: float,
+                     tracker: List[Tuple[int, float, str]]) -> list:
+    """Build the flowables of one parsed block, followed by the block spacer."""
+    flowables = []
+    if kind in ('h1', 'h2', 'h3', 'p'):
+        flowables.append(Paragraph(inline_md_to_html(data, faces), styles[kind]))
+    elif kind == 'ul':
+        for item in data:
+            flowables.append(Paragraph(inline_md_to_html(f"• {item}", faces), styles['p']))
+    elif kind == 'ol':
+        for idx, item in enumerate(data, 1):
+            flowables.append(Paragraph(inline_md_to_html(f"{idx}. {item}", faces), styles['p']))
+    elif kind == 'quote':
+        quote_para = Paragraph(inline_md_to_html(data, faces), styles['quote'])
+        ruler_width = 3
+        table = Table([[ '', quote_para ]], colWidths=[ruler_width, page_w - ruler_width])
+        table.setStyle(TableStyle([
+            ("LINEBEFORE", (0, 0), (0, -1), 3, colors.gray),
+            ("LEFTPADDING", (0, 0), (-1, -1), 0),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 6),
+            ("TOPPADDING", (0, 0), (-1, -1), 2),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+        ]))
+        flowables.append(table)
+    elif kind == 'codeblock':
+        code = html.escape(data).replace('\t', '    ').replace(' ', '&#160;').replace('\n', '<br/>')
+        code_para = Paragraph(f'<font name="Courier">{code}</font>', styles['code'])
+        code_table = Table([[code_para]], colWidths=[page_w])
+        code_table.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, -1), colors.whitesmoke),
+            ("LEFTPADDING", (0, 0), (-1, -1), 6),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 6),
+            ("TOPPADDING", (0, 0), (-1, -1), 4),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+            ("BOX", (0, 0), (-1, -1), 0.3, colors.whitesmoke)
+        ]))
+        flowables.append(code_table)
+    elif kind == 'table':
+        headers, aligns, rows = data
+
+        def make_cell(text: str, idx: int, header: bool) -> Paragraph:
+            align = aligns[idx] if idx < len(aligns) else 'left'
+            style_map = styles['th'] if header else styles['td']
+            return Paragraph(inline_md_to_html(text, faces), style_map.get(align, style_map['left']))
+
+        table_rows = [[make_cell(text, idx, True) for idx, text in enumerate(headers)]]
+        for row in rows:
+            table_rows.append([make_cell(text, idx, False) for idx, text in enumerate(row)])
+
+        tbl = TrackingTable(table_rows, tracker=tracker)
+        tbl.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
+            ("LINEBELOW", (0, 0), (-1, 0), 1.0, colors.black),
+            ("INNERGRID", (0, 0), (-1, -1), 0.6, colors.black),
+            ("BOX", (0, 0), (-1, -1), 1.0, colors.black),
+            ("LEFTPADDING", (0, 0), (-1, -1), 4),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 4),
+            ("TOPPADDING", (0, 0), (-1, -1), 2),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),  # Vertically center all cells
+        ]))
+        flowables.append(tbl)
+    flowables.append(Spacer(1, base_font_pt * 0.3))
+    return flowables
+
+
 def build_pdf(md_text: str,
               width_px: int,
               dpi: int,
@@ -277,114 +410,27 @@ def build_pdf(md_text: str,
     frame = Frame(0, 0, page_w, page_h, leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0, showBoundary=0)
     doc.addPageTemplates([PageTemplate(id="label", frames=[frame])])
 
-    spacing_factor = max(line_spacing, 1) / 100.0
-    lead = max(base_font_pt * spacing_factor, base_font_pt)
-    regular, bold, italic, bolditalic = faces
-
-    style_p = ParagraphStyle('P', fontName=regular, fontSize=base_font_pt, leading=lead,
-                             textColor=colors.black, alignment=0, spaceAfter=max(2, base_font_pt * 0.15))
-    style_h1 = ParagraphStyle('H1', parent=style_p, fontName=bold, fontSize=int(base_font_pt * 1.6), leading=int(lead * 1.4), spaceAfter=lead)
-    style_h2 = ParagraphStyle('H2', parent=style_p, fontName=bold, fontSize=int(base_font_pt * 1.3), leading=int(lead * 1.2), spaceAfter=lead * 0.9)
-    style_h3 = ParagraphStyle('H3', parent=style_p, fontName=bolditalic, fontSize=int(base_font_pt * 1.1), leading=int(lead * 1.1), spaceAfter=lead * 0.8)
-    style_quote = ParagraphStyle('Quote', parent=style_p, leftIndent=0, textColor=colors.gray)
-    style_code = ParagraphStyle('Code', parent=style_p, fontName='Courier', leading=int(lead * 0.95))
-
-    table_header_styles = {
-        'left': ParagraphStyle('ThLeft', parent=style_p, fontName=bold, alignment=0),
-        'center': ParagraphStyle('ThCenter', parent=style_p, fontName=bold, alignment=1),
-        'right': ParagraphStyle('ThRight', parent=style_p, fontName=bold, alignment=2)
-    }
-    table_cell_styles = {
-        'left': ParagraphStyle('TdLeft', parent=style_p, alignment=0),
-        'center': ParagraphStyle('TdCenter', parent=style_p, alignment=1),
-        'right': ParagraphStyle('TdRight', parent=style_p, alignment=2)
-    }
+    styles = build_paragraph_styles(base_font_pt, line_spacing, faces)
 
     story = []
     table_boundaries: List[Tuple[int, float]] = []
     blocks = parse_blocks(md_text)
 
     for kind, data in blocks:
-        if kind == 'h1':
-            story.append(Paragraph(inline_md_to_html(data, faces), style_h1))
-        elif kind == 'h2':
-            story.append(Paragraph(inline_md_to_html(data, faces), style_h2))
-        elif kind == 'h3':
-            story.append(Paragraph(inline_md_to_html(data, faces), style_h3))
-        elif kind == 'p':
-            story.append(Paragraph(inline_md_to_html(data, faces), style_p))
-        elif kind == 'ul':
-            for item in data:
-                story.append(Paragraph(inline_md_to_html(f"• {item}", faces), style_p))
-        elif kind == 'ol':
-            for idx, item in enumerate(data, 1):
-                story.append(Paragraph(inline_md_to_html(f"{idx}. {item}", faces), style_p))
-        elif kind == 'quote':
-            quote_para = Paragraph(inline_md_to_html(data, faces), style_quote)
-            ruler_width = 3
-            table = Table([[ '', quote_para ]], colWidths=[ruler_width, page_w - ruler_width])
-            table.setStyle(TableStyle([
-                ("LINEBEFORE", (0, 0), (0, -1), 3, colors.gray),
-                ("LEFTPADDING", (0, 0), (-1, -1), 0),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 6),
-                ("TOPPADDING", (0, 0), (-1, -1), 2),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
-            ]))
-            story.append(table)
-        elif kind == 'codeblock':
-            code = html.escape(data).replace('\t', '    ').replace(' ', '&#160;').replace('\n', '<br/>')
-            code_para = Paragraph(f'<font name="Courier">{code}</font>', style_code)
-            code_table = Table([[code_para]], colWidths=[page_w])
-            code_table.setStyle(TableStyle([
-                ("BACKGROUND", (0, 0), (-1, -1), colors.whitesmoke),
-                ("LEFTPADDING", (0, 0), (-1, -1), 6),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 6),
-                ("TOPPADDING", (0, 0), (-1, -1), 4),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-                ("BOX", (0, 0), (-1, -1), 0.3, colors.whitesmoke)
-            ]))
-            story.append(code_table)
-        elif kind == 'table':
-            headers, aligns, rows = data
-
-            def make_cell(text: str, idx: int, header: bool) -> Paragraph:
-                align = aligns[idx] if idx < len(aligns) else 'left'
-                style_map = table_header_styles if header else table_cell_styles
-                return Paragraph(inline_md_to_html(text, faces), style_map.get(align, style_map['left']))
-
-            table_rows = [[make_cell(text, idx, True) for idx, text in enumerate(headers)]]
-            for row in rows:
-                table_rows.append([make_cell(text, idx, False) for idx, text in enumerate(row)])
-
-            tbl = TrackingTable(table_rows, tracker=table_boundaries)
-            tbl.setStyle(TableStyle([
-                ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
-                ("LINEBELOW", (0, 0), (-1, 0), 1.0, colors.black),
-                ("INNERGRID", (0, 0), (-1, -1), 0.6, colors.black),
-                ("BOX", (0, 0), (-1, -1), 1.0, colors.black),
-                ("LEFTPADDING", (0, 0), (-1, -1), 4),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 4),
-                ("TOPPADDING", (0, 0), (-1, -1), 2),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),  # Vertically center all cells
-            ]))
-            story.append(tbl)
-        elif kind == 'pagebreak':
+        if kind == 'pagebreak':
             if allow_pagebreaks:
                 story.append(PageBreak())
             continue
-        story.append(Spacer(1, base_font_pt * 0.3))
+        story.extend(_block_flowables(kind, data, styles, faces, page_w, base_font_pt, table_boundaries))
 
     if not story:
-        story.append(Paragraph('&nbsp;', style_p))
+        story.append(Paragraph('&nbsp;', styles['p']))
 
     doc.build(story)
     return buffer.getvalue(), table_boundaries
 
 
-def _normalize_pdf_image(page: Image.Image, target_px_w: int) -> Optional[Tuple[Image.Image, int]]:
-    image = page.convert('RGB')
-
+def _fit_width(image: Image.Image, target_px_w: int) -> Image.Image:
     if target_px_w > 0 and image.width != target_px_w:
         if image.width > target_px_w:
             delta = image.width - target_px_w
@@ -393,57 +439,78 @@ def _normalize_pdf_image(page: Image.Image, target_px_w: int) -> Optional[Tuple[
             image = image.crop((left, 0, right, image.height))
         else:
             pad = (target_px_w - image.width) // 2
-            canvas = Image.new('RGB', (target_px_w, image.height), (255, 255, 255))
+            canvas = Image.new(image.mode, (target_px_w, image.height), 'white')
             canvas.paste(image, (pad, 0))
             image = canvas
+    return image
+
 
+def _ink_bbox(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
     grayscale = image.convert('L')
     mask = grayscale.point(lambda p: 0 if p >= 250 else 255, mode='1').convert('L')
-    bbox = mask.getbbox()
+    return mask.getbbox()
+
+
+def _load_page(path: str, mode: str) -> Image.Image:
+    page = Image.open(path)
+    page.load()
+    return page if page.mode == mode else page.convert(mode)
+
+
+def _content_rows(image: Image.Image) -> Optional[Tuple[int, int]]:
+    bbox = _ink_bbox(image)
     if not bbox:
         return None
-
     top = max(0, bbox[1])
-    bottom = max(top + 1, bbox[3])
-    if bottom < image.height or top > 0:
-        image = image.crop((0, top, image.width, bottom))
-    return image, top
-
-
-def pdf_bytes_to_image(pdf_bytes: bytes, dpi: int, target_px_w: int) -> Tuple[Image.Image, List[int], List[int], List[int]]:
-    pages = convert_from_bytes(pdf_bytes, dpi=dpi)
-    processed: List[Image.Image] = []
-    page_heights: List[int] = []
-    page_top_offsets: List[int] = []
-    for page in pages:
-        normalized = _normalize_pdf_image(page, target_px_w)
-        if normalized is not None:
-            normalized_image, top_offset = normalized
-            processed.append(normalized_image)
-            page_heights.append(normalized_image.height)
-            page_top_offsets.append(top_offset)
-
-    if not processed:
-        return Image.new('RGB', (max(target_px_w, 1), 1), (255, 255, 255)), [], [], []
-
-    total_height = sum(img.height for img in processed)
-    output = Image.new('RGB', (processed[0].width, total_height), (255, 255, 255))
-    y = 0
-    cumulative_breaks: List[int] = []
-    for img in processed:
-        output.paste(img, (0, y))
-        y += img.height
-        cumulative_breaks.append(y)
+    return top, max(top + 1, bbox[3])
+
+
+def markdown_image_mode(text: str) -> str:
+    """Image mode for rendered markdown: grayscale unless the markup asks for colored text."""
+    return 'RGB' if FONT_COLOR.search(text) else 'L'
 
-    # Remove the final total height since it is not a break position
-    if cumulative_breaks:
-        cumulative_breaks.pop()
 
-    page_starts: List[int] = []
-    acc = 0
-    for height in page_heights:
-        page_starts.append(acc)
-        acc += height
+def pdf_bytes_to_image(pdf_bytes: bytes, dpi: int, target_px_w: int,
+                       mode: str = 'RGB') -> Tuple[Image.Image, List[int], List[int], List[int]]:
+    """Rasterize a PDF and stack its pages, trimmed of blank rows, into one image.
+
+    poppler renders all pages in one run into a temporary folder and they are
+    read back one at a time: a first pass finds the content rows of every
+    page so the output is allocated once at its exact size, a second pass
+    pastes them. Only a single page is in memory next to the output.
+    ``mode`` 'L' rasterizes in grayscale.
+    """
+    with tempfile.TemporaryDirectory(prefix='markdown-render-') as folder:
+        paths = convert_from_bytes(pdf_bytes, dpi=dpi, output_folder=folder, paths_only=True,
+                                   grayscale=(mode == 'L'))
+
+        kept: List[Tuple[str, int, int]] = []
+        width = 0
+        for path in paths:
+            page = _fit_width(_load_page(path, mode), target_px_w)
+            rows = _content_rows(page)
+            if rows is not None:
+                width = width or page.width
+                kept.append((path, rows[0], rows[1]))
+
+        if not kept:
+            return Image.new(mode, (max(target_px_w, 1), 1), 'white'), [], [], []
+
+        output = Image.new(mode, (width, sum(bottom - top for _, top, bottom in kept)), 'white')
+        y = 0
+        cumulative_breaks: List[int] = []
+        page_starts: List[int] = []
+        page_top_offsets: List[int] = []
+        for path, top, bottom in kept:
+            page = _fit_width(_load_page(path, mode), target_px_w)
+            output.paste(page.crop((0, top, page.width, bottom)), (0, y))
+            page_starts.append(y)
+            page_top_offsets.append(top)
+            y += bottom - top
+            cumulative_breaks.append(y)
+
+    # Remove the final total height since it is not a break position
+    cumulative_breaks.pop()
 
     return output, cumulative_breaks, page_starts, page_top_offsets
 
@@ -556,8 +623,16 @@ def add_border_areas(img: Image.Image,
     final_width = content_width + left_area_px + right_area_px
     final_height = content_height + top_area_px + bottom_area_px
 
-    # Create result canvas with border areas
-    result = Image.new('RGB', (final_width, final_height), 'white')
+    # Create result canvas with border areas, in color only if the content or a bar needs it
+    bar_colors = [
+        color for enabled, color in (
+            (enable_left_area and enable_left_bar and left_bar_px > 0, left_bar_color),
+            (enable_right_area and enable_right_bar and right_bar_px > 0, right_bar_color),
+            (enable_top_area and enable_top_bar and top_bar_px > 0, top_bar_color),
+            (enable_bottom_area and enable_bottom_bar and bottom_bar_px > 0, bottom_bar_color))
+        if enabled]
+    mode = 'RGB' if img.mode not in ('1', 'L') or 'red' in bar_colors else 'L'
+    result = Image.new(mode, (final_width, final_height), 'white')
 
     # Paste content at position offset by border areas
     content_x = left_area_px
@@ -584,7 +659,7 @@ def add_border_areas(img: Image.Image,
     if left_area_px > 0 and enable_left_area:
         # Left bar (aligned LEFT in area) - only if bar is enabled
         if left_bar_px > 0 and enable_left_bar:
-            left_bar_fill = (255, 0, 0) if left_bar_color == 'red' else (0, 0, 0)
+            left_bar_fill = 'red' if left_bar_color == 'red' else 'black'
             draw.rectangle([(0, 0), (left_bar_px, final_height)], fill=left_bar_fill)
 
             if left_bar_text and font_path:
@@ -592,14 +667,14 @@ def add_border_areas(img: Image.Image,
                     font_size_px = int(left_bar_text_size_pt * dpi / 72) if left_bar_text_size_pt > 0 else int(left_bar_px * 0.7)
                     try:
                         if font_path:
-                            font = ImageFont.truetype(font_path, font_size_px)
+                            font = load_font(font_path, font_size_px)
                         else:
                             font = ImageFont.load_default()
                     except Exception as font_e:
                         font = ImageFont.load_default()
 
                     # Create text image to rotate - dimensions for vertical bar
-                    txt_img = Image.new('RGB', (final_height, left_bar_px), left_bar_fill)
+                    txt_img = Image.new(result.mode, (final_height, left_bar_px), left_bar_fill)
                     txt_draw = ImageDraw.Draw(txt_img)
 
                     bbox = txt_draw.textbbox((0, 0), left_bar_text, font=font)
@@ -610,7 +685,7 @@ def add_border_areas(img: Image.Image,
                     # y = vertical center in bar (will become horizontal center after rotation)
                     x = (final_height - w) // 2 - bbox[0]
                     y = (left_bar_px - h) // 2 - bbox[1]
-                    txt_draw.text((x, y), left_bar_text, fill=(255, 255, 255), font=font)
+                    txt_draw.text((x, y), left_bar_text, fill='white', font=font)
 
                     # Rotate 90° CCW - this makes the text read bottom-to-top
                     txt_img = txt_img.rotate(90, expand=True)
@@ -624,14 +699,14 @@ def add_border_areas(img: Image.Image,
                 font_size_px = int(default_font_size_pt * dpi / 72)
                 try:
                     if font_path:
-                        font = ImageFont.truetype(font_path, font_size_px)
+                        font = load_font(font_path, font_size_px)
                     else:
                         font = ImageFont.load_default()
                 except Exception as font_e:
                     font = ImageFont.load_default()
 
                 # Create text image for vertical text
-                txt_img = Image.new('RGB', (final_height, left_area_px), (255, 255, 255))
+                txt_img = Image.new(result.mode, (final_height, left_area_px), 'white')
                 txt_draw = ImageDraw.Draw(txt_img)
 
                 bbox = txt_draw.textbbox((0, 0), left_text, font=font)
@@ -639,7 +714,7 @@ def add_border_areas(img: Image.Image,
 
                 x = (final_height - w) // 2 - bbox[0]
                 y = (left_area_px - h) // 2 - bbox[1]
-                txt_draw.text((x, y), left_text, fill=(0, 0, 0), font=font)
+                txt_draw.text((x, y), left_text, fill='black', font=font)
 
                 txt_img = txt_img.rotate(90, expand=True)
                 result.paste(txt_img, (0, 0))
@@ -650,7 +725,7 @@ def add_border_areas(img: Image.Image,
     if right_area_px > 0 and enable_right_area:
         # Right bar (aligned RIGHT in area) - only if bar is enabled
         if right_bar_px > 0 and enable_right_bar:
-            right_bar_fill = (255, 0, 0) if right_bar_color == 'red' else (0, 0, 0)
+            right_bar_fill = 'red' if right_bar_color == 'red' else 'black'
             bar_x = final_width - right_bar_px
             draw.rectangle([(bar_x, 0), (final_width, final_height)], fill=right_bar_fill)
 
@@ -659,13 +734,13 @@ def add_border_areas(img: Image.Image,
                     font_size_px = int(right_bar_text_size_pt * dpi / 72) if right_bar_text_size_pt > 0 else int(right_bar_px * 0.7)
                     try:
                         if font_path:
-                            font = ImageFont.truetype(font_path, font_size_px)
+                            font = load_font(font_path, font_size_px)
                         else:
                             font = ImageFont.load_default()
                     except Exception as font_e:
                         font = ImageFont.load_default()
 
-                    txt_img = Image.new('RGB', (final_height, right_bar_px), right_bar_fill)
+                    txt_img = Image.new(result.mode, (final_height, right_bar_px), right_bar_fill)
                     txt_draw = ImageDraw.Draw(txt_img)
 
                     bbox = txt_draw.textbbox((0, 0), right_bar_text, font=font)
@@ -674,7 +749,7 @@ def add_border_areas(img: Image.Image,
                     # Center horizontally and vertically
                     x = (final_height - w) // 2 - bbox[0]
                     y = (right_bar_px - h) // 2 - bbox[1]
-                    txt_draw.text((x, y), right_bar_text, fill=(255, 255, 255), font=font)
+                    txt_draw.text((x, y), right_bar_text, fill='white', font=font)
 
                     # Rotate 90° CW
                     txt_img = txt_img.rotate(270, expand=True)
@@ -688,14 +763,14 @@ def add_border_areas(img: Image.Image,
                 font_size_px = int(default_font_size_pt * dpi / 72)
                 try:
                     if font_path:
-                        font = ImageFont.truetype(font_path, font_size_px)
+                        font = load_font(font_path, font_size_px)
                     else:
                         font = ImageFont.load_default()
                 except Exception as font_e:
                     font = ImageFont.load_default()
 
                 bar_x = final_width - right_area_px
-                txt_img = Image.new('RGB', (final_height, right_area_px), (255, 255, 255))
+                txt_img = Image.new(result.mode, (final_height, right_area_px), 'white')
                 txt_draw = ImageDraw.Draw(txt_img)
 
                 bbox = txt_draw.textbbox((0, 0), right_text, font=font)
@@ -703,7 +778,7 @@ def add_border_areas(img: Image.Image,
 
                 x = (final_height - w) // 2 - bbox[0]
                 y = (right_area_px - h) // 2 - bbox[1]
-                txt_draw.text((x, y), right_text, fill=(0, 0, 0), font=font)
+                txt_draw.text((x, y), right_text, fill='black', font=font)
 
                 txt_img = txt_img.rotate(270, expand=True)
                 result.paste(txt_img, (bar_x, 0))
@@ -716,7 +791,7 @@ def add_border_areas(img: Image.Image,
 
         # Top bar - only if bar is enabled
         if bar_height > 0 and enable_top_bar:
-            top_bar_fill = (255, 0, 0) if top_bar_color == 'red' else (0, 0, 0)
+            top_bar_fill = 'red' if top_bar_color == 'red' else 'black'
             bar_x1 = content_x
             bar_x2 = content_x + content_width
             draw.rectangle([(bar_x1, 0), (bar_x2, bar_height)], fill=top_bar_fill)
@@ -725,7 +800,7 @@ def add_border_areas(img: Image.Image,
                 try:
                     font_size_px = int(top_bar_text_size_pt * dpi / 72) if top_bar_text_size_pt > 0 else int(bar_height * 0.6)
                     try:
-                        font = ImageFont.truetype(font_path, max(font_size_px, 1))
+                        font = load_font(font_path, max(font_size_px, 1))
                     except Exception as font_e:
                         font = ImageFont.load_default()
                     text = process_vars(top_bar_text)
@@ -733,7 +808,7 @@ def add_border_areas(img: Image.Image,
                     w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
                     x = bar_x1 + (content_width - w) // 2 - bbox[0]
                     y = (bar_height - h) // 2 - bbox[1]
-                    draw.text((x, y), text, fill=(255, 255, 255), font=font)
+                    draw.text((x, y), text, fill='white', font=font)
                 except Exception as e:
                     pass
 
@@ -742,7 +817,7 @@ def add_border_areas(img: Image.Image,
             # Divider line (optional)
             if top_divider:
                 div_y = top_area_px - divider_distance_px
-                draw.line([(content_x, div_y), (content_x + content_width, div_y)], fill=(0, 0, 0), width=1)
+                draw.line([(content_x, div_y), (content_x + content_width, div_y)], fill='black', width=1)
 
             if top_text and font_path:
                 try:
@@ -751,7 +826,7 @@ def add_border_areas(img: Image.Image,
                     font_size_px = int(top_text_size_pt * dpi / 72) if top_text_size_pt > 0 else int(default_font_size_pt * dpi / 72)
                     try:
                         if font_path:
-                            font = ImageFont.truetype(font_path, font_size_px)
+                            font = load_font(font_path, font_size_px)
                         else:
                             font = ImageFont.load_default()
                     except Exception as font_e:
@@ -763,7 +838,7 @@ def add_border_areas(img: Image.Image,
                     # Center horizontally on content area, vertically within top area
                     x = content_x + (content_width - w) // 2 - bbox[0]
                     y = (top_area_px - h) // 2 - bbox[1]
-                    draw.text((x, y), text, fill=(0, 0, 0), font=font)
+                    draw.text((x, y), text, fill='black', font=font)
                 except Exception as e:
                     pass
 
@@ -774,7 +849,7 @@ def add_border_areas(img: Image.Image,
         bar_y2 = bar_y1 + bar_height
 
         if bar_height > 0 and enable_bottom_bar:
-            bottom_bar_fill = (255, 0, 0) if bottom_bar_color == 'red' else (0, 0, 0)
+            bottom_bar_fill = 'red' if bottom_bar_color == 'red' else 'black'
             bar_x1 = content_x
             bar_x2 = content_x + content_width
             draw.rectangle([(bar_x1, bar_y1), (bar_x2, bar_y2)], fill=bottom_bar_fill)
@@ -784,7 +859,7 @@ def add_border_areas(img: Image.Image,
                     font_size_px = int(bottom_bar_text_size_pt * dpi / 72) if bottom_bar_text_size_pt > 0 else int(bar_height * 0.6)
                     try:
                         if font_path:
-                            font = ImageFont.truetype(font_path, max(font_size_px, 1))
+                            font = load_font(font_path, max(font_size_px, 1))
                         else:
                             font = ImageFont.load_default()
                     except Exception as font_e:
@@ -794,7 +869,7 @@ def add_border_areas(img: Image.Image,
                     w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
                     x = bar_x1 + (content_width - w) // 2 - bbox[0]
                     y = bar_y1 + (bar_height - h) // 2 - bbox[1]
-                    draw.text((x, y), text, fill=(255, 255, 255), font=font)
+                    draw.text((x, y), text, fill='white', font=font)
                 except Exception:
                     pass
 
@@ -802,7 +877,7 @@ def add_border_areas(img: Image.Image,
             # Divider line (optional)
             if bottom_divider:
                 div_y = content_y + content_height + divider_distance_px
-                draw.line([(content_x, div_y), (content_x + content_width, div_y)], fill=(0, 0, 0), width=1)
+                draw.line([(content_x, div_y), (content_x + content_width, div_y)], fill='black', width=1)
 
             # Draw page numbers if enabled, otherwise draw bottom text
             if draw_page_numbers and total_pages > 0:
@@ -814,7 +889,7 @@ def add_border_areas(img: Image.Image,
                     if font_path:
                         font_size = max(8, min(diameter_px - 2, int(diameter_px * 0.85)))
                         try:
-                            font = ImageFont.truetype(font_path, font_size)
+                            font = load_font(font_path, font_size)
                         except Exception as font_e:
                             font = ImageFont.load_default()
                     else:
@@ -854,7 +929,7 @@ def add_border_areas(img: Image.Image,
                     font_size_px = int(bottom_text_size_pt * dpi / 72) if bottom_text_size_pt > 0 else int(default_font_size_pt * dpi / 72)
                     try:
                         if font_path:
-                            font = ImageFont.truetype(font_path, font_size_px)
+                            font = load_font(font_path, font_size_px)
                         else:
                             font = ImageFont.load_default()
                     except Exception as font_e:
@@ -868,85 +943,188 @@ def add_border_areas(img: Image.Image,
                     text_area_top = final_height - bottom_area_px
                     text_area_height = bottom_area_px
                     y = text_area_top + (text_area_height - h) // 2 - bbox[1]
-                    draw.text((x, y), text, fill=(0, 0, 0), font=font)
+                    draw.text((x, y), text, fill='black', font=font)
                 except:
                     pass
 
     return result
 
 
-def render_markdown_to_image(markdown_text: str,
-                             *,
-                             content_width_px: int,
-                             dpi: int,
-                             base_font_pt: int,
-                             line_spacing: int,
-                             font_map: Dict[str, str],
-                             preferred_style: str,
-                             allow_pagebreaks: bool = False) -> Tuple[Image.Image, List[int], List[int]]:
-    text = markdown_text or ''
-    width_px = max(content_width_px, 10)
-    faces = resolve_font_faces(font_map, preferred_style or '')
-    pdf_bytes, table_boundaries_pt = build_pdf(text, width_px, dpi, base_font_pt, line_spacing, faces, allow_pagebreaks)
-    image, page_breaks, page_starts_px, page_top_offsets_px = pdf_bytes_to_image(pdf_bytes, dpi, width_px)
-    scale = dpi / 72.0
-    table_boundaries_px: List[int] = []
-    boundary_types: Dict[int, str] = {}
-    for page_index, boundary_top_pt, boundary_type in table_boundaries_pt:
-        if page_index >= len(page_starts_px):
-            continue
-        boundary_px = int(round(boundary_top_pt * scale))
-        top_offset = page_top_offsets_px[page_index] if page_index < len(page_top_offsets_px) else 0
-        adjusted_px = boundary_px - top_offset
-        global_px = page_starts_px[page_index] + max(adjusted_px, 0)
-        table_boundaries_px.append(global_px)
-        boundary_types[global_px] = boundary_type
-    table_boundaries_px.sort()
-    rgb_image = image.convert('RGB')
-    return rgb_image, page_breaks, (table_boundaries_px, boundary_types)
-class TrackingTable(Table):
-    def __init__(self, data, *args, tracker=None, **kwargs):
-        super().__init__(data, *args, **kwargs)
-        self._slice_tracker = tracker
+def _block_cache_key(engine: str, mode: str, kind: str, data: object, width_px: int, dpi: int, base_font_pt: float,
+                     line_spacing: int, faces: Tuple[str, str, str, str]) -> str:
+    key = (engine, mode, kind, data, width_px, dpi, base_font_pt, line_spacing, faces)
+    return md5(repr(key).encode('utf-8')).hexdigest()
 
-    def drawOn(self, canvas, x, y, _sW=0):
-        if self._slice_tracker is not None and self._rowHeights:
-            page_height = canvas._pagesize[1]
-            page_index = max(0, canvas.getPageNumber() - 1)
 
-            # Record boundaries after each row (measured from the top edge of each row's bottom border)
-            # In PDF: y points to bottom-left of table, increases upward
-            # When we add heights going up from y, we're moving toward the top of the table
-            # But in image space, we want boundaries in top-to-bottom order
+def make_rendered_block(image: Image.Image, boundaries: List[Tuple[int, str]]) -> RenderedBlock:
+    bbox = _ink_bbox(image)
+    ink = (bbox[1], max(bbox[1] + 1, bbox[3])) if bbox else None
+    return RenderedBlock(image, boundaries, ink)
 
-            # Total table height
-            total_height = sum(self._rowHeights)
 
-            # Record boundaries starting from the top of the table (in image space)
-            # which is y + total_height in PDF space (at the top of the table)
-            cumulative = total_height
-            for i, height in enumerate(self._rowHeights):
-                # Boundary before this row (at top of row)
-                # In PDF: this is at y + cumulative (measured from bottom)
-                # Convert to "from top of page": page_height - (y + cumulative)
-                boundary_from_top = page_height - (y + cumulative)
-                # Mark first boundary as table start
-                boundary_type = 'table_start' if i == 0 else 'row'
-                self._slice_tracker.append((page_index, boundary_from_top, boundary_type))
-                cumulative -= height
+def _pack_block(block: RenderedBlock) -> bytes:
+    return pickle.dumps((block.image.mode, block.image.size, block.image.tobytes(), block.boundaries, block.ink),
+                        protocol=pickle.HIGHEST_PROTOCOL)
 
-            # Record boundary after last row (at bottom of table)
-            boundary_from_top = page_height - y
-            self._slice_tracker.append((page_index, boundary_from_top, 'table_end'))
-        return super().drawOn(canvas, x, y, _sW=_sW)
-                    text_area_top = final_height - bottom_area_px
-                    text_area_height = bottom_area_px
-                    y = text_area_top + (text_area_height - h) // 2 - bbox[1]
-                    draw.text((x, y), text, fill=(0, 0, 0), font=font)
-                except:
-                    pass
 
-    return result
+def _unpack_block(data: bytes) -> RenderedBlock:
+    mode, size, pixels, boundaries, ink = pickle.loads(data)
+    return RenderedBlock(Image.frombytes(mode, size, pixels), boundaries, ink)
+
+
+def _rasterize_blocks(blocks: List[Tuple[str, object]],
+                      width_px: int,
+                      dpi: int,
+                      base_font_pt: float,
+                      line_spacing: int,
+                      faces: Tuple[str, str, str, str]) -> Optional[List[RenderedBlock]]:
+    """Render each block on its own PDF page sized to the block and rasterize them in one go.
+
+    Flowables are laid out like a reportlab Frame would (space before, height,
+    space after), so stacking the pages reproduces the document layout.
+    Returns None if a block is too tall for a single PDF page.
+    """
+    scale = dpi / 72.0
+    page_w = width_px / dpi * 25.4 * mm
+    styles = build_paragraph_styles(base_font_pt, line_spacing, faces)
+
+    buffer = BytesIO()
+    pdf = Canvas(buffer, pagesize=(page_w, page_w))
+    heights_px: List[int] = []
+    trackers: List[List[Tuple[int, float, str]]] = []
+    for kind, data in blocks:
+        tracker: List[Tuple[int, float, str]] = []
+        flowables = _block_flowables(kind, data, styles, faces, page_w, base_font_pt, tracker)
+        sizes = [flowable.wrapOn(pdf, page_w, MAX_BLOCK_HEIGHT_PT) for flowable in flowables]
+        total_pt = sum(flowable.getSpaceBefore() + h + flowable.getSpaceAfter()
+                       for flowable, (_, h) in zip(flowables, sizes))
+        if total_pt > MAX_BLOCK_HEIGHT_PT:
+            return None
+
+        height_px = max(1, int(math.ceil(total_pt * scale)))
+        page_h = height_px / scale
+        pdf.setPageSize((page_w, page_h))
+        y = page_h
+        for flowable, (w, h) in zip(flowables, sizes):
+            y -= flowable.getSpaceBefore() + h
+            flowable.drawOn(pdf, 0, y, _sW=page_w - w)
+            y -= flowable.getSpaceAfter()
+        pdf.showPage()
+        heights_px.append(height_px)
+        trackers.append(tracker)
+    pdf.save()
+
+    # Rasterized in parallel by the render pool, one poppler run per pool worker
+    from app.labeldesigner.render_pool import render_map_chunked
+    from app.utils import render_pdf_pages
+    pages = render_map_chunked(partial(render_pdf_pages, buffer.getvalue(), dpi), range(len(blocks)))
+    if len(pages) != len(blocks):
+        return None
+
+    rendered: List[RenderedBlock] = []
+    for page, height_px, tracker in zip(pages, heights_px, trackers):
+        image = _fit_width(page, width_px)
+        if image.height != height_px:
+            canvas_img = Image.new(image.mode, (image.width, height_px), 'white')
+            canvas_img.paste(image, (0, 0))
+            image = canvas_img
+        boundaries = [(int(round(boundary_pt * scale)), boundary_type) for _, boundary_pt, boundary_type in tracker]
+        rendered.append(make_rendered_block(image, boundaries))
+    return rendered
+
+
+def _render_markdown_incremental(text: str,
+                                 width_px: int,
+                                 dpi: int,
+                                 base_font_pt: float,
+                                 line_spacing: int,
+                                 faces: Tuple[str, str, str, str],
+                                 allow_pagebreaks: bool,
+                                 engine: str = 'reportlab',
+                                 rasterize=None):
+    """Render markdown block by block, only rasterizing blocks missing from the block cache.
+
+    ``rasterize`` turns a list of blocks into RenderedBlocks (the reportlab
+    block renderer by default) and ``faces`` is whatever it expects.
+    Blocks between page break markers form a page that is trimmed of blank
+    rows at the top and bottom, like the pages of the single PDF path.
+    Page breaks are reported only for explicit page break markers.
+    Returns None when the document has to go through ``build_pdf`` instead.
+    """
+    segments: List[List[Tuple[str, object]]] = [[]]
+    for kind, data in parse_blocks(text):
+        if kind == 'pagebreak':
+            if allow_pagebreaks:
+                segments.append([])
+            continue
+        segments[-1].append((kind, data))
+
+    blocks = [block for segment in segments for block in segment]
+    rasterize = rasterize or _rasterize_blocks
+    mode = markdown_image_mode(text)
+    keys = [_block_cache_key(engine, mode, kind, data, width_px, dpi, base_font_pt, line_spacing, faces)
+            for kind, data in blocks]
+    rendered: List[Optional[RenderedBlock]] = []
+    for key in keys:
+        cached = block_cache.get(key)
+        rendered.append(_unpack_block(cached) if cached is not None else None)
+
+    missing = [idx for idx, block in enumerate(rendered) if block is None]
+    if missing:
+        fresh = rasterize([blocks[idx] for idx in missing], width_px, dpi, base_font_pt, line_spacing, faces)
+        if fresh is None:
+            return None
+        for idx, block in zip(missing, fresh):
+            if block.image.mode != mode:
+                block = block._replace(image=block.image.convert(mode))
+            rendered[idx] = block
+            block_cache.put(keys[idx], _pack_block(block))
+
+    # Lay out the trimmed pages: (blocks with their y offset, content top, content bottom)
+    pages = []
+    block_iter = iter(rendered)
+    for segment in segments:
+        placed = []
+        y = 0
+        top = bottom = None
+        for _ in segment:
+            block = next(block_iter)
+            if block.ink is not None:
+                if top is None:
+                    top = y + block.ink[0]
+                bottom = y + block.ink[1]
+            placed.append((block, y))
+            y += block.image.height
+        if top is not None:
+            pages.append((placed, top, bottom))
+
+    if not pages:
+        return Image.new(mode, (max(width_px, 1), 1), 'white'), [], ([], {})
+
+    total_height = sum(bottom - top for _, top, bottom in pages)
+    output = Image.new(mode, (width_px, total_height), 'white')
+    page_breaks: List[int] = []
+    table_boundaries_px: List[int] = []
+    boundary_types: Dict[int, str] = {}
+    page_start = 0
+    for placed, top, bottom in pages:
+        for block, y in placed:
+            visible_top = max(y, top)
+            visible_bottom = min(y + block.image.height, bottom)
+            if visible_bottom > visible_top:
+                part = block.image.crop((0, visible_top - y, block.image.width, visible_bottom - y))
+                output.paste(part, (0, page_start + visible_top - top))
+            for boundary_px, boundary_type in block.boundaries:
+                global_px = page_start + max(y + boundary_px - top, 0)
+                table_boundaries_px.append(global_px)
+                boundary_types[global_px] = boundary_type
+        page_start += bottom - top
+        page_breaks.append(page_start)
+
+    # The end of the last page is not a break position
+    page_breaks.pop()
+    table_boundaries_px.sort()
+    return output, page_breaks, (table_boundaries_px, boundary_types)
 
 
 def render_markdown_to_image(markdown_text: str,
@@ -957,12 +1135,27 @@ def render_markdown_to_image(markdown_text: str,
                              line_spacing: int,
                              font_map: Dict[str, str],
                              preferred_style: str,
-                             allow_pagebreaks: bool = False) -> Tuple[Image.Image, List[int], List[int]]:
+                             allow_pagebreaks: bool = False,
+                             incremental: bool = True,
+                             engine: str = 'reportlab') -> Tuple[Image.Image, List[int], List[int]]:
+    if engine not in MARKDOWN_ENGINES:
+        raise ValueError(f"Unknown markdown engine '{engine}', expected one of {', '.join(MARKDOWN_ENGINES)}")
     text = markdown_text or ''
     width_px = max(content_width_px, 10)
+    if engine == 'pil':
+        from app.markdown_pil import rasterize_blocks_pil
+        font_paths = resolve_font_paths(font_map, preferred_style or '')
+        return _render_markdown_incremental(text, width_px, dpi, base_font_pt, line_spacing, font_paths,
+                                            allow_pagebreaks, engine='pil', rasterize=rasterize_blocks_pil)
+
     faces = resolve_font_faces(font_map, preferred_style or '')
+    if incremental:
+        result = _render_markdown_incremental(text, width_px, dpi, base_font_pt, line_spacing, faces, allow_pagebreaks)
+        if result is not None:
+            return result
     pdf_bytes, table_boundaries_pt = build_pdf(text, width_px, dpi, base_font_pt, line_spacing, faces, allow_pagebreaks)
-    image, page_breaks, page_starts_px, page_top_offsets_px = pdf_bytes_to_image(pdf_bytes, dpi, width_px)
+    image, page_breaks, page_starts_px, page_top_offsets_px = pdf_bytes_to_image(
+        pdf_bytes, dpi, width_px, mode=markdown_image_mode(text))
     scale = dpi / 72.0
     table_boundaries_px: List[int] = []
     boundary_types: Dict[int, str] = {}
@@ -976,8 +1169,9 @@ def render_markdown_to_image(markdown_text: str,
         table_boundaries_px.append(global_px)
         boundary_types[global_px] = boundary_type
     table_boundaries_px.sort()
-    rgb_image = image.convert('RGB')
-    return rgb_image, page_breaks, (table_boundaries_px, boundary_types)
+    return image, page_breaks, (table_boundaries_px, boundary_types)
+
+
 class TrackingTable(Table):
     def __init__(self, data, *args, tracker=None, **kwargs):
         super().__init__(data, *args, **kwargs)
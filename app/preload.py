@@ -0,0 +1,62 @@
+"""Warm up fonts and the markdown pipeline before serving requests.
+
+Runs at the end of app creation, before the render pool and (with gunicorn
+``--preload``) the server workers are forked, so every process starts with
+the font index loaded, the default family registered with reportlab and
+the renderer modules and poppler already exercised.
+"""
+
+import time
+
+from brother_ql.devicedependent import label_type_specs
+
+DPI = 300
+
+# Small document touching headings, inline styles and tables
+WARMUP_MARKDOWN = """# Label
+
+Some **bold**, *italic* and `code` text.
+
+| Item | Qty |
+|:-----|----:|
+| A | 1 |
+"""
+
+
+def preload(app, fonts):
+    """Index fonts, register the default family and render a warm-up label."""
+    start = time.perf_counter()
+    cfg = app.config
+
+    family = cfg['LABEL_DEFAULT_FONT_FAMILY']
+    style = cfg['LABEL_DEFAULT_FONT_STYLE']
+    style_map = fonts.fonts.get(family, {})
+    app.logger.info('Preload: %d font families indexed', len(fonts.fonts))
+
+    from app.font_cache import load_font
+    from app.markdown_render import render_markdown_to_image, resolve_font_faces
+
+    try:
+        # Registers the regular, bold, italic and bold italic faces with reportlab
+        faces = resolve_font_faces(style_map, style)
+        app.logger.info('Preload: registered markdown faces %s', ', '.join(faces))
+        if style_map.get(style):
+            load_font(style_map[style], int(round(cfg['LABEL_DEFAULT_FONT_SIZE'] * DPI / 72.0)))
+    except Exception as e:
+        app.logger.warning('Preload: could not load the default font %s (%s): %s', family, style, e)
+
+    spec = label_type_specs.get(cfg['LABEL_DEFAULT_SIZE'], label_type_specs['62'])
+    width_px = spec['dots_printable'][0]
+    try:
+        render_markdown_to_image(WARMUP_MARKDOWN,
+                                 content_width_px=width_px,
+                                 dpi=DPI,
+                                 base_font_pt=10,
+                                 line_spacing=cfg['LABEL_DEFAULT_LINE_SPACING'],
+                                 font_map=style_map,
+                                 preferred_style=style,
+                                 engine=cfg['MARKDOWN_DEFAULT_ENGINE'])
+    except Exception as e:
+        app.logger.warning('Preload: markdown warm-up render failed: %s', e)
+
+    app.logger.info('Preload finished in %.0f ms', (time.perf_counter() - start) * 1000.0)
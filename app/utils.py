@@ -3,7 +3,6 @@
 from PIL import Image
 from PIL.ImageOps import colorize
 from io import BytesIO
-from pdf2image import convert_from_bytes
 
 
 def convert_image_to_bw(image, threshold):
@@ -31,6 +30,7 @@ def pdffile_to_image(file, dpi):
     file.seek(0)  # Reset file stream position
     file.save(s)
     s.seek(0)
+    from pdf2image import convert_from_bytes
     im = convert_from_bytes(
         s.read(),
         dpi = dpi
@@ -53,31 +53,52 @@ def get_pdf_page_count(file):
         current_app.logger.warning('[get_pdf_page_count] Could not get page count: %s', str(e))
         return None
 
+def file_to_bytes(file):
+    """Read an uploaded file into bytes"""
+    s = BytesIO()
+    file.seek(0)
+    file.save(s)
+    return s.getvalue()
+
+
+def render_pdf_page(pdf_bytes, dpi, page_number=0):
+    """Render a specific page (0-indexed) of PDF bytes to an image, None if it is missing"""
+    from pdf2image import convert_from_bytes
+    images = convert_from_bytes(
+        pdf_bytes,
+        dpi = dpi,
+        first_page = page_number + 1,
+        last_page = page_number + 1,
+        thread_count = 1,
+        fmt = 'jpeg'
+    )
+    return images[0] if images else None
+
+
+def render_pdf_pages(pdf_bytes, dpi, page_numbers):
+    """Render consecutive pages (0-indexed) of PDF bytes in one poppler run"""
+    from pdf2image import convert_from_bytes
+    return convert_from_bytes(
+        pdf_bytes,
+        dpi = dpi,
+        first_page = page_numbers[0] + 1,
+        last_page = page_numbers[-1] + 1
+    )
+
+
 def pdffile_to_single_page(file, dpi, page_number=0):
     """Convert a specific page of a PDF to an image (0-indexed)"""
     try:
-        s = BytesIO()
-        file.seek(0)
-        file.save(s)
-        s.seek(0)
-        pdf_bytes = s.read()
+        pdf_bytes = file_to_bytes(file)
 
         from flask import current_app
         current_app.logger.info('[pdffile_to_single_page] Converting page %d at %d DPI', page_number + 1, dpi)
 
-        images = convert_from_bytes(
-            pdf_bytes,
-            dpi = dpi,
-            first_page = page_number + 1,
-            last_page = page_number + 1,
-            thread_count = 1,
-            fmt = 'jpeg'
-        )
+        image = render_pdf_page(pdf_bytes, dpi, page_number)
 
-        if images:
+        if image:
             current_app.logger.info('[pdffile_to_single_page] Successfully converted page %d', page_number + 1)
-            return images[0]
-        return None
+        return image
     except Exception as e:
         from flask import current_app
         current_app.logger.error('[pdffile_to_single_page] Failed to convert page %d: %s', page_number + 1, str(e), exc_info=True)
@@ -99,6 +120,7 @@ def pdffile_to_images(file, dpi):
 
         # Try conversion with optimizations
         current_app.logger.info('[pdffile_to_images] Starting PDF conversion...')
+        from pdf2image import convert_from_bytes
         images = convert_from_bytes(
             pdf_bytes,
             dpi = dpi,
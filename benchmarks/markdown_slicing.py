@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark markdown page slicing against label length.
+
+Builds synthetic endless labels (text-like ink runs plus table grid lines)
+and times the row statistics with NumPy and with the pure PIL fallback, and
+the full slice_markdown_pages call.
+
+    python benchmarks/markdown_slicing.py --lengths 100 500 1500 --slice-mm 90
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def synthetic_label(length_mm, width_px, dpi, seed=0):
+    rng = random.Random(seed)
+    height = int(round(length_mm / 25.4 * dpi))
+    image = Image.new('RGB', (width_px, height), 'white')
+    draw = ImageDraw.Draw(image)
+    y = 0
+    while y < height:
+        if rng.random() < 0.1:
+            # Table row separator spanning the full width
+            draw.rectangle([0, y, width_px - 1, y + 2], fill='black')
+            y += rng.randint(30, 60)
+            continue
+        line_h = rng.randint(25, 45)
+        x = 0
+        while x < width_px - 40:
+            word_w = rng.randint(20, 120)
+            draw.rectangle([x, y, min(width_px - 1, x + word_w), y + line_h], fill='black')
+            x += word_w + rng.randint(10, 20)
+        y += line_h + rng.randint(8, 30)
+    return image
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lengths', type=float, nargs='+', default=[100, 250, 500, 1000, 1500],
+                        help='Label lengths in mm')
+    parser.add_argument('--width', type=int, default=696, help='Label width in pixels')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--slice-mm', type=float, default=90.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # A bare app for the config, create_app would index fonts into the instance folder
+    from flask import Flask
+    from config import Config
+    app = Flask(__name__)
+    app.config.from_object(Config)
+
+    from app.labeldesigner import markdown_processor
+
+    print(f"{'length mm':>10} {'rows':>7} {'stats numpy ms':>15} {'stats pil ms':>13} {'slice ms':>9} {'pages':>6}")
+    with app.app_context():
+        app.logger.disabled = True
+        for length_mm in args.lengths:
+            image = synthetic_label(length_mm, args.width, args.dpi)
+
+            numpy_ms = None
+            if markdown_processor.np is not None:
+                numpy_ms = timed(lambda: markdown_processor.compute_row_stats(image), args.repeat)
+            np_module, markdown_processor.np = markdown_processor.np, None
+            try:
+                pil_ms = timed(lambda: markdown_processor.compute_row_stats(image), args.repeat)
+            finally:
+                markdown_processor.np = np_module
+
+            pages = []
+
+            def run_slice():
+                pages[:] = markdown_processor.slice_markdown_pages(image, args.slice_mm, 0, args.dpi)
+            slice_ms = timed(run_slice, args.repeat)
+
+            numpy_col = f"{numpy_ms:15.1f}" if numpy_ms is not None else f"{'n/a':>15}"
+            print(f"{length_mm:10.0f} {image.height:7d} {numpy_col} {pil_ms:13.1f} {slice_ms:9.1f} {len(pages):6d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,114 @@ class Config(object):
     PRINTERS = None  # Set to list of printer dicts to override JSON file
     PRINTERS_JSON_PATH = None  # Auto-set to instance/printers.json if None
 
+    # Print jobs are handed to a background spooler (one thread per printer)
+    # and /api/print returns a job id right away. Poll /api/jobs/<id> for
+    # the result or pass wait=1 to block until the label is printed. Jobs are
+    # known only to the server process that accepted them, with several
+    # gunicorn workers a poll may reach another worker and get a 404, so
+    # clients there should use wait=1 (the web designer does).
+    PRINT_SPOOLER_ENABLED = True
+    PRINT_JOB_WAIT_TIMEOUT = 120
+
+    # Connections to network (tcp://) printers are kept open and reused
+    # between jobs. Idle connections are closed after this many seconds,
+    # 0 opens a new connection for every job. None uses 30 seconds, or 0
+    # under gunicorn with several workers: the printers accept about one
+    # client at a time, and an idle connection of one worker would block
+    # the jobs of the others.
+    PRINTER_CONNECTION_IDLE_TIMEOUT = None
+
+    # Jobs for remote printers are forwarded over one keep-alive session per
+    # remote instance, with at most REMOTE_PRINTER_MAX_CONNECTIONS requests in
+    # flight. Timeouts are in seconds. Failed connections, and status queries
+    # answered with 502/503/504, are retried with exponential backoff.
+    REMOTE_PRINTER_CONNECT_TIMEOUT = 5
+    REMOTE_PRINTER_READ_TIMEOUT = 30
+    REMOTE_PRINTER_STATUS_TIMEOUT = 5
+    REMOTE_PRINTER_RETRIES = 3
+    REMOTE_PRINTER_RETRY_BACKOFF = 0.5
+    REMOTE_PRINTER_MAX_CONNECTIONS = 4
+
+    # Jobs for remote printers whose model is known (configured as 'model' or
+    # reported by the remote's status endpoint) are rasterized here and sent
+    # as Brother QL instruction streams compressed with this Content-Encoding:
+    # 'gzip', 'zstd' (needs the zstandard package) or 'identity'.
+    # RASTER_PASSTHROUGH_MAX_MB limits the decompressed size accepted from
+    # other instances.
+    REMOTE_PRINTER_RASTER_ENCODING = 'gzip'
+    RASTER_PASSTHROUGH_MAX_MB = 64
+
+    # Send each label of a multi-label job to the printer as soon as it is
+    # rasterized instead of building the whole job in memory first.
+    PRINTER_STREAMING = True
+
+    # Rasterized labels are cached (LRU, in MB) so reprinting the same label
+    # skips rendering and conversion. 0 disables the cache.
+    RASTER_CACHE_SIZE_MB = 32
+
+    # Rendered previews are cached by a hash of the label settings and the
+    # uploaded file (LRU, in MB). A disk tier in the instance folder (or
+    # PREVIEW_CACHE_DISK_DIR) keeps previews across restarts, 0 disables it.
+    # None enables 128 MB under gunicorn with several workers, where preview
+    # page URLs are only handed out for previews on disk, and disables it
+    # otherwise.
+    PREVIEW_CACHE_SIZE_MB = 64
+    PREVIEW_CACHE_DISK_SIZE_MB = None
+    PREVIEW_CACHE_DISK_DIR = None
+
+    # Previews of uploaded PDFs requested with preview_quality=draft (the
+    # designer does so while editing) are rasterized and sent at this
+    # resolution. The layout is still computed at printer resolution, page
+    # counts do not change. Other sources ignore draft and render in full.
+    PREVIEW_DRAFT_DPI = 100
+
+    # The designer posts its edits to a live preview channel and receives the
+    # previews over a server-sent event stream, renders of edits superseded by
+    # newer ones are dropped early. Every open stream holds a server thread
+    # for up to PREVIEW_LIVE_STREAM_SECONDS (the browser then reconnects), so
+    # at most PREVIEW_LIVE_MAX_STREAMS streams are served per process, further
+    # designers fall back to plain preview requests. Keep-alive comments are
+    # sent every PREVIEW_LIVE_KEEPALIVE seconds. Channels live in the memory
+    # of one process, so live preview is only offered when the server runs a
+    # single worker process (gunicorn --workers 1, threads are fine).
+    PREVIEW_LIVE_ENABLED = True
+    PREVIEW_LIVE_MAX_STREAMS = 2
+    PREVIEW_LIVE_KEEPALIVE = 15
+    PREVIEW_LIVE_STREAM_SECONDS = 300
+
+    # Markdown is rendered block by block and rasterized blocks are cached
+    # (LRU, in MB), so an edit only re-renders the changed blocks. 0 disables
+    # the cache.
+    MARKDOWN_BLOCK_CACHE_SIZE_MB = 64
+
+    # Loaded fonts are shared by all label, border and footer drawing
+    # (LRU, number of path/size combinations). 0 disables the cache.
+    FONT_CACHE_SIZE = 256
+
+    # Default markdown renderer: 'reportlab' (PDF typesetting rasterized by
+    # poppler) or 'pil' (drawn directly with Pillow, faster, simpler layout).
+    MARKDOWN_DEFAULT_ENGINE = 'reportlab'
+
+    # /api/print/batch: maximum labels per request (pages and copies
+    # included) and threads used to build the labels of a batch
+    BATCH_MAX_LABELS = 1000
+    BATCH_RENDER_WORKERS = 4
+
+    # Load the font index, register the default font family with reportlab
+    # and render a warm-up markdown label during startup, so the first
+    # request is as fast as later ones. With gunicorn --preload this happens
+    # once, before the workers are forked. Without it (e.g. for scale-to-zero
+    # deployments where cold start matters most) only the font index is
+    # loaded on startup. The duration of each startup phase is logged at
+    # INFO level.
+    PRELOAD = True
+
+    # Worker processes rasterizing the pages of PDFs and markdown labels in
+    # parallel. None uses one per CPU core, split between the gunicorn
+    # workers (each gets cores // workers, a single one means no pool).
+    # 0 renders in-process.
+    RENDER_POOL_WORKERS = None
+
     LABEL_DEFAULT_ORIENTATION = 'standard'
     LABEL_DEFAULT_SIZE = '62'
     LABEL_DEFAULT_FONT_SIZE = 70
@@ -42,3 +150,14 @@ class Config(object):
     LABEL_DEFAULT_MARGIN_RIGHT = 35
 
     FONT_FOLDER = ''
+
+    # Fonts in FONT_DIRECTORIES, FONT_FOLDER and the directories fontconfig
+    # is configured with are indexed in the instance folder
+    # (font_index.json). The fontconfig directories are looked up with
+    # fc-list when the index is built. On startup only directories modified
+    # since are rescanned, POST /labeldesigner/api/fonts/rescan refreshes
+    # the index of a running server ({"full": true} also looks up the
+    # fontconfig directories again). Without any of the directories, or
+    # with FONT_INDEX = False, fc-list is asked on every start.
+    FONT_INDEX = True
+    FONT_DIRECTORIES = ['/usr/share/fonts', '/usr/local/share/fonts', '~/.local/share/fonts', '~/.fonts']
@@ -0,0 +1,31 @@
+"""Gunicorn settings for serving the app preloaded.
+
+With ``--preload`` the app, its font index and the warmed up markdown
+pipeline are created once in the master and the workers are forked from
+it. The render pool cannot be shared across that fork, so the master stops
+its pool and every worker starts its own. With several workers, preview
+page URLs are only used for previews in the shared disk tier of the
+preview cache, and connections to network printers are not kept open
+between jobs.
+"""
+
+preload_app = True
+
+
+def when_ready(server):
+    from app.labeldesigner.render_pool import stop_render_pool
+    stop_render_pool()
+
+
+def post_fork(server, worker):
+    from app.labeldesigner.render_pool import restart_render_pool
+    from app.labeldesigner.preview_cache import set_multiprocess
+    from app.labeldesigner import backend_pool, preview_channel
+    # The CPU cores are shared by all workers' render pools
+    restart_render_pool(server.cfg.workers)
+    # Preview page URLs must be answerable by every worker
+    set_multiprocess(server.cfg.workers > 1)
+    # Don't let one worker sit on the printers' only connection
+    backend_pool.set_multiprocess(server.cfg.workers > 1)
+    # Live preview channels only work within one process
+    preview_channel.set_multiprocess(server.cfg.workers > 1)